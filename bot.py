@@ -2,18 +2,77 @@ import asyncio
 import logging
 import structlog
 
-from aiogram import Bot
-from config_reader import bot_config, update_assistant_id
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from config_reader import BotMode, LLMBackendType, bot_config, update_assistant_id
 from dispatcher import get_dispatcher
 from logs import init_logging
+from services.assistant_bootstrap import assistant_bootstrap
+from services.image_prewarm import image_prewarmer
+from services.backends import llm_backend
+from services.opening import opening_cache
+from services.run_poller import run_poller
+from services.thread_pool import thread_pool
+from services.thread_cleanup import thread_deletion_queue
 from utils.db import create_db
-from utils.openai_helper import create_assistant
+from utils.openai_helper import image_cache, image_downloader, openai_client
 
 # Отключаем лишние логи от библиотек
 logging.getLogger("httpcore").setLevel(logging.WARNING)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("openai").setLevel(logging.DEBUG)
 
+async def run_polling(bot: Bot, dp: Dispatcher) -> None:
+    """Получение обновлений через long polling"""
+    # Вебхук и getUpdates взаимоисключающие, поэтому снимаем вебхук, если он остался
+    await bot.delete_webhook(drop_pending_updates=False)
+    await dp.start_polling(bot, skip_updates=False)
+
+async def run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    """
+    Получение обновлений через webhook.
+
+    Telegram получает ответ 200 сразу, а обработчики выполняются в фоне
+    через Dispatcher.feed_update.
+    """
+    logger = structlog.get_logger()
+    secret_token = bot_config.webhook_secret.get_secret_value()
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret_token,  # Проверяется заголовок X-Telegram-Bot-Api-Secret-Token
+        handle_in_background=True
+    ).register(app, path=bot_config.webhook_path)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=bot_config.webhook_host, port=bot_config.webhook_port)
+    await site.start()
+
+    webhook_url = bot_config.webhook_url.rstrip("/") + bot_config.webhook_path
+    await bot.set_webhook(
+        url=webhook_url,
+        secret_token=secret_token,
+        max_connections=bot_config.webhook_max_connections,
+        allowed_updates=dp.resolve_used_update_types(),
+        drop_pending_updates=False
+    )
+    await logger.ainfo(
+        "Webhook server started",
+        url=webhook_url,
+        host=bot_config.webhook_host,
+        port=bot_config.webhook_port
+    )
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
 async def main():
     """
     Entry point
@@ -24,26 +83,62 @@ async def main():
     # Создаем таблицы в БД
     await create_db()
     
+    # Треды и ассистент нужны только движку Assistants API
+    use_assistants = bot_config.llm_backend == LLMBackendType.ASSISTANTS
+    
+    # Фоновое удаление тредов OpenAI (в т.ч. оставшихся от прежнего движка)
+    thread_deletion_queue.start()
+    
     # Initialize bot and dispatcher
     bot = Bot(token=bot_config.token.get_secret_value())
     dp = get_dispatcher()
     
-    assistant_id = bot_config.assistant_id
-    logger.info(f"Assistant ID: {assistant_id}")
+    if use_assistants:
+        assistant_id = bot_config.assistant_id
+        logger.info(f"Assistant ID: {assistant_id}")
+        
+        # Ассистент с неизменной конфигурацией берётся из базы без запроса к OpenAI
+        try:
+            new_assistant_id = await assistant_bootstrap.ensure(assistant_id)
+            if new_assistant_id != assistant_id:
+                logger.info(f"Updating assistant ID: {new_assistant_id}")
+                update_assistant_id(new_assistant_id)
+        except Exception as e:
+            logger.error(f"Critical error with assistant creation/retrieval: {e}")
+            raise
+    else:
+        logger.info(f"LLM backend: {bot_config.llm_backend}")
     
-    # Создаём или проверяем ассистента
-    try:
-        new_assistant_id = await create_assistant(existing_assistant_id=assistant_id)
-        if new_assistant_id != assistant_id:
-            logger.info(f"Updating assistant ID: {new_assistant_id}")
-            update_assistant_id(new_assistant_id)
-    except Exception as e:
-        logger.error(f"Critical error with assistant creation/retrieval: {e}")
-        raise
+    # Фоновая очистка кэша изображений по размеру и сроку хранения
+    image_cache.start()
+    
+    if bot_config.image_prewarm_enabled:
+        # Изображения сценария скачиваются (и загружаются в Telegram) в фоне, не задерживая запуск
+        image_prewarmer.start(bot)
+    
+    def start_thread_pool(opening):
+        # Пополняем пул тредов в фоне, треды засеваются вступлением
+        thread_pool.set_opening(opening)
+        thread_pool.start()
+    
+    # Вступление генерируется один раз на версию сценария и ассистента, в фоне;
+    # до его готовности новеллы начинаются обычным раном, а треды создаются по запросу
+    opening_cache.start(llm_backend, on_ready=start_thread_pool if use_assistants else None)
     
     # Run bot
-    await logger.ainfo("Starting the bot...")
-    await dp.start_polling(bot, skip_updates=False)
+    await logger.ainfo("Starting the bot...", mode=bot_config.mode)
+    try:
+        if bot_config.mode == BotMode.WEBHOOK:
+            await run_webhook(bot, dp)
+        else:
+            await run_polling(bot, dp)
+    finally:
+        # Опрос ранов останавливается до закрытия клиента OpenAI
+        await run_poller.close()
+        # Закрываем пулы соединений с OpenAI и Google Drive
+        await openai_client.close()
+        await image_downloader.close()
+        await image_cache.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,7 +1,7 @@
 from enum import StrEnum
 from pathlib import Path
 from typing import Any, Type, Union
-from pydantic import BaseModel, SecretStr, field_validator
+from pydantic import BaseModel, SecretStr, field_validator, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 import structlog
 import tomli
@@ -14,6 +14,17 @@ class LogRenderer(StrEnum):
     JSON = "json"
     CONSOLE = "console"
 
+class BotMode(StrEnum):
+    """Способ получения обновлений от Telegram"""
+    POLLING = "polling"
+    WEBHOOK = "webhook"
+
+class LLMBackendType(StrEnum):
+    """Движок генерации ответов новеллы"""
+    ASSISTANTS = "assistants"
+    CHAT = "chat"
+    FAKE = "fake"
+
 class BotConfig(BaseSettings):
     """Bot configuration"""
     token: SecretStr
@@ -22,9 +33,99 @@ class BotConfig(BaseSettings):
     required_channel_invite: str
     provider_token: str = ""
     openai_api_key: SecretStr
+    openai_base_url: str | None = None  # Другой адрес API (по умолчанию - api.openai.com)
     assistant_id: str
     restart_cost: int = 100
 
+    # Режим получения обновлений: long polling или webhook
+    mode: BotMode = BotMode.POLLING
+    webhook_url: str = ""  # Публичный HTTPS-адрес, например https://bot.example.com
+    webhook_path: str = "/webhook"
+    webhook_secret: SecretStr = SecretStr("")
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8080
+    webhook_max_connections: int = 100  # Параллельные соединения Telegram -> бот (1-100)
+
+    # Сколько апдейтов обрабатывается одновременно (апдейты одного пользователя - по очереди)
+    max_concurrent_updates: int = 100
+
+    # Очередь ходов к модели: одновременные ходы, предел ожидания (сек), оценка токенов на ход
+    llm_max_concurrent_turns: int = 50
+    llm_max_queue_wait: float = 60
+    llm_turn_tokens: int = 4000
+    llm_paid_priority_minutes: int = 30  # Сколько действует повышенный приоритет после оплаты
+    llm_queue_notice_after: float = 5  # С какого ожидания предупреждать игрока об очереди
+
+    # Пауза (сек) для склейки сообщений, присланных во время хода, в одно (0 - отключить)
+    coalesce_window: float = 1.5
+
+    # Лимиты исходящих сообщений (сообщений в секунду)
+    outbound_global_rate: float = 30.0
+    outbound_chat_rate: float = 1.0
+    outbound_chat_burst: int = 3
+
+    # Движок ответов: Assistants API, Chat Completions с локальной историей или заглушка
+    llm_backend: LLMBackendType = LLMBackendType.ASSISTANTS
+    chat_model: str = "gpt-4-turbo-preview"
+    fake_backend_latency: float = 0.0  # Искусственная задержка ответа заглушки, секунды
+
+    # Сжатие истории: каждые N ходов старые сообщения заменяются кратким содержанием (0 - отключить)
+    compaction_every_turns: int = 10
+    compaction_keep_messages: int = 6  # Сколько последних сообщений остаются в контексте как есть
+    compaction_model: str = "gpt-4o-mini"
+
+    # Вступление новеллы генерируется один раз на версию сценария и ассистента
+    opening_cache_enabled: bool = True
+
+    # Прогрев изображений сценария при запуске: скачивание в кэш и загрузка в закрытый чат-хранилище
+    image_prewarm_enabled: bool = True
+    image_prewarm_concurrency: int = 8
+    image_storage_chat_id: int | None = None  # Без чата изображения только скачиваются
+
+    # Одновременные соединения с Google Drive при скачивании изображений
+    image_download_connections: int = 20
+
+    # Память (МБ) под часто отправляемые изображения поверх кэша на диске
+    image_cache_memory_mb: int = 64
+    # Предел кэша изображений на диске (МБ) и срок хранения неиспользуемых файлов (дней, 0 - бессрочно)
+    image_cache_disk_mb: int = 1024
+    image_cache_ttl_days: int = 30
+
+    # Стриминг ответа ассистента с редактированием сообщения по мере генерации
+    stream_responses: bool = True
+    stream_edit_interval: float = 1.5
+
+    # Общий бюджет запросов runs.retrieve в секунду для опроса ранов
+    run_poll_rps: float = 10.0
+
+    # Пул заранее созданных тредов OpenAI (0 - отключить)
+    thread_pool_size: int = 5
+    thread_pool_max_age_hours: float = 168
+
+    # Размер пачки фонового удаления тредов OpenAI
+    thread_delete_batch_size: int = 20
+
+    # HTTP-транспорт OpenAI: пул соединений и HTTP/2 (требует пакет h2)
+    openai_max_connections: int = 200
+    openai_max_keepalive_connections: int = 100
+    openai_keepalive_expiry: float = 60.0
+    openai_http2: bool = False
+
+    # Таймауты запросов к OpenAI по типу операции, секунды
+    openai_connect_timeout: float = 5.0
+    openai_pool_timeout: float = 10.0
+    openai_timeout_create: float = 30.0
+    openai_timeout_retrieve: float = 10.0
+    openai_timeout_list: float = 15.0
+    openai_timeout_delete: float = 15.0
+    openai_timeout_stream: float = 120.0
+
+    # Повторы запросов к OpenAI и автомат, отключающий запросы при сбоях API
+    openai_max_attempts: int = 4
+    openai_max_retry_delay: float = 20.0
+    openai_breaker_threshold: int = 5
+    openai_breaker_recovery: float = 30.0
+
     @field_validator("owners", mode="before")
     @classmethod
     def parse_owners(cls, v):
@@ -37,6 +138,15 @@ class BotConfig(BaseSettings):
                 raise ValueError(f"Invalid owners format: {v}")
         return v
 
+    @model_validator(mode="after")
+    def check_webhook_settings(self):
+        if self.mode == BotMode.WEBHOOK and not self.webhook_url:
+            raise ValueError("webhook_url is required when mode is 'webhook'")
+        # Без секрета вебхук принял бы апдейты от кого угодно
+        if self.mode == BotMode.WEBHOOK and not self.webhook_secret.get_secret_value():
+            raise ValueError("webhook_secret is required when mode is 'webhook'")
+        return self
+
     model_config = SettingsConfigDict(
         env_prefix="BOT_",
         env_file=".env",
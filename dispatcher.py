@@ -1,12 +1,20 @@
 from aiogram import Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
+from config_reader import bot_config
 from handlers import admin_actions, novel, personal_actions, referral
 from middlewares.check_subscription import CheckSubscriptionMiddleware
 from middlewares.localization import L10nMiddleware
 from middlewares.db import DatabaseMiddleware
+from middlewares.scheduler import UpdateSchedulerMiddleware
+from middlewares.coalescer import MessageCoalescerMiddleware
+from middlewares.interrupt import TurnInterruptMiddleware
+from filters.is_admin import IsAdminFilter
 from fluent_loader import get_fluent_localization
+from services.backends import llm_backend
+from services.novel import SKIP_COMMANDS
+from utils.db import session_maker
+from utils.metrics import register_stats
 
 def get_dispatcher() -> Dispatcher:
     """
@@ -15,14 +23,36 @@ def get_dispatcher() -> Dispatcher:
     # Создаем диспетчер
     dp = Dispatcher(storage=MemoryStorage())
     
-    # Создаем движок базы данных
-    engine = create_async_engine(
-        "sqlite+aiosqlite:///bot.db",
-        echo=False
+    # Сообщения, присланные во время хода, склеиваются в один следующий ход (до планировщика)
+    coalescer = MessageCoalescerMiddleware(
+        window=bot_config.coalesce_window,
+        # Кнопки меню, включая админские, - это команды, а не текст истории
+        skip_texts=SKIP_COMMANDS
     )
     
-    # Создаем фабрику сессий
-    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async def interrupt_turn(user_id: int) -> bool:
+        # Сообщения к отменённому ходу тоже больше не нужны
+        coalescer.discard(user_id)
+        return await llm_backend.cancel_turn(user_id)
+    
+    # Запуск, рестарт и завершение новеллы сразу отменяют идущий ран, не дожидаясь очереди пользователя
+    dp.update.outer_middleware(TurnInterruptMiddleware(
+        texts={
+            # Новелла с уже начатой историей тоже запускается заново
+            "🎮 Новелла": None,
+            "🔄 Рестарт": None,
+            # /end_novel доступна только админам, как и её обработчик
+            "/end_novel": IsAdminFilter(is_admin=True)
+        },
+        on_interrupt=interrupt_turn
+    ))
+    dp.update.outer_middleware(coalescer)
+    register_stats("coalescer", coalescer.get_stats)
+    
+    # Планировщик апдейтов: общий лимит параллельности и очередь на каждого пользователя
+    scheduler = UpdateSchedulerMiddleware(max_concurrent=bot_config.max_concurrent_updates)
+    dp.update.outer_middleware(scheduler)
+    register_stats("updates", scheduler.get_stats)
     
     # Регистрируем мидлвари
     dp.message.middleware(DatabaseMiddleware(session_maker))
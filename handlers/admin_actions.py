@@ -9,9 +9,11 @@ from sqlalchemy import select, func
 
 from filters.is_admin import IsAdminFilter
 from services.novel import NovelService
+from services.run_stats import format_run_stats, get_daily_run_stats
 from keyboards.menu import get_main_menu
 from models.referral import Referral
 from models.base import Base
+from utils.metrics import collect_stats, format_stats
 
 logger = structlog.get_logger()
 
@@ -47,6 +49,23 @@ async def cmd_end_novel(message: Message, session: AsyncSession, l10n):
     else:
         await message.answer("У вас нет активной новеллы")
 
+@router.message(Command("metrics"))
+async def cmd_metrics(message: Message):
+    """Runtime-метрики бота: очереди, ожидания, лимиты"""
+    await message.answer(
+        format_stats(collect_stats()),
+        parse_mode="HTML"
+    )
+
+@router.message(Command("run_stats"))
+async def cmd_run_stats(message: Message, session: AsyncSession):
+    """Задержки и расход токенов ранов ассистента по дням"""
+    report = await get_daily_run_stats(session)
+    await message.answer(
+        format_run_stats(report),
+        parse_mode="HTML"
+    )
+
 @router.message(F.text == "📊 Статистика")
 async def menu_stats(message: Message, session: AsyncSession):
     """Показывает статистику реферальной программы"""
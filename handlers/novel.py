@@ -8,6 +8,7 @@ from aiogram.exceptions import TelegramBadRequest
 
 from config_reader import bot_config
 from services.novel import NovelService
+from services.llm_scheduler import llm_scheduler
 from filters.chat_type import ChatTypeFilter
 from filters.is_subscribed import IsSubscribedFilter
 from filters.is_admin import IsAdminFilter
@@ -74,6 +75,9 @@ async def start_novel_common(message: Message, session: AsyncSession, l10n):
         novel_state = await novel_service.get_novel_state(message.from_user.id)
         if not novel_state:
             novel_state = await novel_service.create_novel_state(message.from_user.id)
+        else:
+            # Рестарт (в т.ч. после оплаты): история и ввод имени начинаются заново
+            novel_state = await novel_service.start_new_story(novel_state)
         
         # Запускаем новеллу через process_message
         await novel_service.process_message(
@@ -373,6 +377,9 @@ async def handle_successful_payment(message: Message, session: AsyncSession, l10
                 novel_state.needs_payment = False
                 await session.commit()
             
+            # Оплатившие ждут очереди к модели раньше остальных
+            llm_scheduler.mark_paid(message.from_user.id)
+            
             await start_novel_common(message, session, l10n)
             await message.answer(
                 l10n.format_value("restart-payment-success"),
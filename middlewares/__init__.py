@@ -1,7 +1,13 @@
 from .localization import L10nMiddleware
 from .check_subscription import CheckSubscriptionMiddleware
+from .scheduler import UpdateSchedulerMiddleware
+from .coalescer import MessageCoalescerMiddleware
+from .interrupt import TurnInterruptMiddleware
 
 __all__ = [
     "L10nMiddleware",
-    "CheckSubscriptionMiddleware"
+    "CheckSubscriptionMiddleware",
+    "UpdateSchedulerMiddleware",
+    "MessageCoalescerMiddleware",
+    "TurnInterruptMiddleware"
 ]
\ No newline at end of file
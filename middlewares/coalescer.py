@@ -0,0 +1,106 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Collection, Dict, List
+
+import structlog
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject, Update
+
+logger = structlog.get_logger()
+
+class MessageCoalescerMiddleware(BaseMiddleware):
+    """
+    Склейка сообщений, присланных пользователем во время его хода.
+
+    Пока текстовое сообщение новеллы обрабатывается (идёт ран), новые
+    текстовые сообщения того же пользователя не ставятся в очередь
+    планировщика, а копятся в буфере. После окончания хода и паузы
+    window (пока пользователь дописывает) буфер отправляется одним
+    апдейтом - одно сообщение и один ран вместо рана на каждое сообщение.
+    Подключается до планировщика апдейтов.
+    """
+
+    def __init__(self, window: float = 1.5, skip_texts: Collection[str] = (), max_wait: float = 10.0):
+        self.window = window
+        self.skip_texts = set(skip_texts)
+        self.max_wait = max_wait
+        self._active: set[int] = set()
+        self._buffers: Dict[int, List[Message]] = {}
+        self._coalesced = 0
+        self._follow_ups = 0
+
+    def is_story_text(self, message: Message | None) -> bool:
+        """Текст хода новеллы: не команда и не кнопка меню"""
+        return bool(
+            message is not None
+            and message.text
+            and not message.text.startswith("/")
+            and message.text not in self.skip_texts
+        )
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        message = event.message if isinstance(event, Update) else None
+        if self.window <= 0 or not self.is_story_text(message) or message.from_user is None:
+            return await handler(event, data)
+
+        user_id = message.from_user.id
+        if user_id in self._active:
+            # Ход уже выполняется - сообщение уйдёт вместе с остальными после него
+            self._buffers.setdefault(user_id, []).append(message)
+            self._coalesced += 1
+            logger.info(f"Buffered message of user {user_id} during active turn")
+            return None
+
+        # Вложенные мидлвари дополняют data, для повторного апдейта нужен исходный набор
+        base_data = dict(data)
+        self._active.add(user_id)
+        try:
+            result = await handler(event, data)
+            while (batch := await self._drain(user_id)):
+                self._follow_ups += 1
+                logger.info(f"Sending {len(batch)} buffered messages of user {user_id} as one turn")
+                await handler(self._combine(event, batch), dict(base_data))
+            return result
+        finally:
+            self._active.discard(user_id)
+            self._buffers.pop(user_id, None)
+
+    def discard(self, user_id: int) -> int:
+        """Выбрасывает сообщения, накопленные во время отменённого хода"""
+        return len(self._buffers.pop(user_id, []))
+
+    async def _drain(self, user_id: int) -> List[Message]:
+        """Ждёт, пока пользователь перестанет писать, и забирает буфер"""
+        if not self._buffers.get(user_id):
+            return []
+        waited = 0.0
+        while waited < self.max_wait:
+            count = len(self._buffers[user_id])
+            await asyncio.sleep(self.window)
+            waited += self.window
+            # Буфер могли выбросить через discard, пока ждали
+            buffer = self._buffers.get(user_id)
+            if not buffer:
+                return []
+            if len(buffer) == count:
+                break
+        return self._buffers.pop(user_id, [])
+
+    @staticmethod
+    def _combine(event: Update, batch: List[Message]) -> Update:
+        """Апдейт последнего сообщения с текстом всех сообщений буфера"""
+        text = "\n".join(message.text for message in batch)
+        return event.model_copy(update={"message": batch[-1].model_copy(update={"text": text})})
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики склейки сообщений"""
+        return {
+            "active_turns": len(self._active),
+            "buffered": sum(len(batch) for batch in self._buffers.values()),
+            "coalesced": self._coalesced,
+            "follow_up_turns": self._follow_ups
+        }
@@ -0,0 +1,52 @@
+from typing import Any, Awaitable, Callable, Dict, Mapping
+
+import structlog
+from aiogram import BaseMiddleware
+from aiogram.filters import Filter
+from aiogram.types import Message, TelegramObject, Update
+
+logger = structlog.get_logger()
+
+class TurnInterruptMiddleware(BaseMiddleware):
+    """
+    Отмена выполняющегося хода по рестарту или завершению новеллы.
+
+    Подключается до планировщика апдейтов: иначе команда дождалась бы
+    в очереди пользователя конца того самого рана, который должна отменить.
+    Сама команда после отмены обрабатывается как обычно. Для команды можно
+    задать фильтр (например, IsAdminFilter) - ход отменяется, только если
+    пользователь проходит тот же фильтр, что и обработчик команды.
+    """
+
+    def __init__(self, texts: Mapping[str, Filter | None], on_interrupt: Callable[[int], Awaitable[bool]]):
+        self.texts = dict(texts)
+        self.on_interrupt = on_interrupt
+
+    def command_of(self, text: str | None) -> str | None:
+        if not text:
+            return None
+        # Команды в группах приходят с именем бота: /end_novel@bot
+        command = text.split(maxsplit=1)[0].split("@", 1)[0] if text.startswith("/") else text
+        return command if command in self.texts else None
+
+    async def is_interrupt(self, message: Message) -> bool:
+        command = self.command_of(message.text)
+        if command is None:
+            return False
+        allowed = self.texts[command]
+        return allowed is None or bool(await allowed(message))
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        message = event.message if isinstance(event, Update) else None
+        if message is not None and message.from_user is not None and self.command_of(message.text):
+            try:
+                if await self.is_interrupt(message) and await self.on_interrupt(message.from_user.id):
+                    logger.info(f"Interrupted active turn of user {message.from_user.id}")
+            except Exception as e:
+                logger.error(f"Error interrupting turn of user {message.from_user.id}: {e}")
+        return await handler(event, data)
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Collection, Dict
+
+import structlog
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update, User
+
+from utils.metrics import percentile
+
+logger = structlog.get_logger()
+
+class UpdateSchedulerMiddleware(BaseMiddleware):
+    """
+    Планировщик апдейтов перед обработчиками.
+
+    Апдейты одного пользователя выполняются строго по очереди (FIFO),
+    апдейты разных пользователей - параллельно, но не больше max_concurrent
+    одновременно. Слот глобального лимита занимается только когда апдейт
+    дошёл до начала своей очереди, поэтому долгий ран одного пользователя
+    не блокирует остальных.
+
+    Апдейты типов bypass_types не ждут очереди: на pre_checkout_query Telegram
+    ждёт ответа не больше 10 секунд, и платёж не должен зависеть от рана
+    того же пользователя. Нажатия inline-кнопок идут через очередь: они
+    могут запустить новеллу, а ход одного пользователя не выполняется параллельно.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 100,
+        slow_wait_threshold: float = 5.0,
+        bypass_types: Collection[str] = ("pre_checkout_query",)
+    ):
+        self.max_concurrent = max_concurrent
+        self.slow_wait_threshold = slow_wait_threshold
+        self.bypass_types = set(bypass_types)
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._user_locks: Dict[int, asyncio.Lock] = {}
+        self._user_pending: Dict[int, int] = {}  # Ожидающие + выполняющийся апдейт
+        self._running = 0
+        self._processed = 0
+        self._wait_samples: deque = deque(maxlen=1000)
+        self._max_wait = 0.0
+        self._bypassed = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if isinstance(event, Update) and event.event_type in self.bypass_types:
+            self._bypassed += 1
+            return await self._run(handler, event, data, time.monotonic())
+
+        user: User | None = data.get("event_from_user")
+        if user is None:
+            # Апдейты без пользователя (например, посты в каналах) ограничиваем только общим лимитом
+            async with self._semaphore:
+                return await self._run(handler, event, data, time.monotonic())
+
+        user_id = user.id
+        enqueued_at = time.monotonic()
+        lock = self._user_locks.setdefault(user_id, asyncio.Lock())
+        self._user_pending[user_id] = self._user_pending.get(user_id, 0) + 1
+        try:
+            async with lock:
+                async with self._semaphore:
+                    return await self._run(handler, event, data, enqueued_at, user_id)
+        finally:
+            self._user_pending[user_id] -= 1
+            if not self._user_pending[user_id]:
+                # Никто больше не держит и не ждёт блокировку - освобождаем память
+                del self._user_pending[user_id]
+                self._user_locks.pop(user_id, None)
+
+    async def _run(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+        enqueued_at: float,
+        user_id: int | None = None
+    ) -> Any:
+        wait = time.monotonic() - enqueued_at
+        self._wait_samples.append(wait)
+        self._max_wait = max(self._max_wait, wait)
+        if wait > self.slow_wait_threshold:
+            logger.warning(
+                "Update waited too long in scheduler queue",
+                user_id=user_id,
+                wait=round(wait, 2)
+            )
+
+        self._running += 1
+        try:
+            return await handler(event, data)
+        finally:
+            self._running -= 1
+            self._processed += 1
+
+    def queue_depth(self, user_id: int | None = None) -> int:
+        """Количество апдейтов, ожидающих своей очереди (всего или у пользователя)"""
+        if user_id is not None:
+            return max(0, self._user_pending.get(user_id, 0) - 1)
+        return sum(max(0, pending - 1) for pending in self._user_pending.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики планировщика"""
+        samples = list(self._wait_samples)
+        return {
+            "running": self._running,
+            "max_concurrent": self.max_concurrent,
+            "active_users": len(self._user_pending),
+            "queued": self.queue_depth(),
+            "max_user_queue": max((p - 1 for p in self._user_pending.values()), default=0),
+            "processed": self._processed,
+            "bypassed": self._bypassed,
+            "wait_p50": percentile(samples, 50),
+            "wait_p95": percentile(samples, 95),
+            "wait_max": self._max_wait
+        }
@@ -1,6 +1,6 @@
 from .base import Base
 from .referral import ReferralLink, Referral, PendingReferral, ReferralReward
-from .novel import NovelState, NovelMessage
+from .novel import NovelState, NovelMessage, SpareThread, ThreadDeletion, NovelRun, OpeningTranscript, AssistantRecord, TelegramFile
 
 __all__ = [
     "Base",
@@ -9,5 +9,11 @@ __all__ = [
     "PendingReferral",
     "ReferralReward",
     "NovelState",
-    "NovelMessage"
+    "NovelMessage",
+    "SpareThread",
+    "ThreadDeletion",
+    "NovelRun",
+    "OpeningTranscript",
+    "AssistantRecord",
+    "TelegramFile"
 ] 
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, func
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, Float, ForeignKey, func
 from sqlalchemy.orm import relationship
 from models.base import Base
 
@@ -12,6 +12,10 @@ class NovelState(Base):
     current_scene = Column(Integer, default=0)
     is_completed = Column(Boolean, default=False)  # Флаг завершения новеллы
     needs_payment = Column(Boolean, default=False)  # Флаг необходимости оплаты
+    player_name = Column(String(255), nullable=True)  # Имя игрока, None - имя ещё не получено
+    summary = Column(Text, nullable=True)  # Краткое содержание сжатой части истории
+    summarized_until_id = Column(Integer, nullable=True)  # Последнее сообщение, вошедшее в summary
+    summary_saved_tokens = Column(Integer, default=0)  # Сколько токенов промпта экономит summary на каждом ходе
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -29,4 +33,75 @@ class NovelMessage(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Связь с состоянием новеллы
-    novel_state = relationship("NovelState", back_populates="messages") 
\ No newline at end of file
+    novel_state = relationship("NovelState", back_populates="messages") 
+
+class SpareThread(Base):
+    """Model for storing pre-created empty OpenAI threads"""
+    __tablename__ = "spare_threads"
+    
+    id = Column(Integer, primary_key=True)
+    thread_id = Column(String(255), nullable=False, unique=True)
+    opening_version = Column(String(64), nullable=True)  # Версия вступления, которым засеян тред
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+
+class ThreadDeletion(Base):
+    """Model for OpenAI threads waiting to be deleted"""
+    __tablename__ = "thread_deletions"
+    
+    id = Column(Integer, primary_key=True)
+    thread_id = Column(String(255), nullable=False, unique=True)
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, index=True)  # UTC
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class NovelRun(Base):
+    """Model for per-run latency and token usage of the assistant"""
+    __tablename__ = "novel_runs"
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    thread_id = Column(String(255), nullable=False)
+    run_id = Column(String(255), nullable=False)
+    status = Column(String(32), nullable=False)
+    streamed = Column(Boolean, default=False)
+    queue_time = Column(Float, nullable=True)  # От создания рана до начала выполнения (по данным OpenAI)
+    first_status_time = Column(Float, nullable=True)  # До первой смены статуса, замеченной ботом
+    first_token_time = Column(Float, nullable=True)  # До первого токена (только стриминг)
+    duration = Column(Float, nullable=False)  # Полное время от запроса до финального статуса
+    polls = Column(Integer, nullable=True)  # Запросов runs.retrieve (без стриминга)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+
+class OpeningTranscript(Base):
+    """Model for cached opening transcripts of the novel per assistant/scenario version"""
+    __tablename__ = "opening_transcripts"
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(String(64), nullable=False, unique=True)
+    kind = Column(String(32), nullable=False, default="opening")  # opening или characters
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class AssistantRecord(Base):
+    """Model for the assistant in use and the fingerprint of its configuration"""
+    __tablename__ = "assistant_records"
+    
+    id = Column(Integer, primary_key=True)
+    configured_id = Column(String(255), nullable=False, unique=True)  # BOT_ASSISTANT_ID из настроек
+    assistant_id = Column(String(255), nullable=False)  # Фактически используемый ассистент
+    fingerprint = Column(String(64), nullable=False)  # Хэш сценария, инструкций, функций и модели
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class TelegramFile(Base):
+    """Model for Telegram file_id of an already uploaded scenario image"""
+    __tablename__ = "telegram_files"
+    
+    id = Column(Integer, primary_key=True)
+    image_id = Column(String(255), nullable=False, unique=True)  # ID изображения на Google Drive
+    file_id = Column(String(255), nullable=False)  # file_id фото на серверах Telegram
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
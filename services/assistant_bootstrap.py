@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Dict
+
+import structlog
+from openai import NotFoundError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from config_reader import update_assistant_id
+from models.novel import AssistantRecord
+from utils.db import session_maker
+from utils.metrics import register_stats
+from utils.openai_helper import assistant_params, create_assistant, openai_client
+from utils.openai_resilience import call_openai
+from utils.openai_transport import op_timeout
+
+logger = structlog.get_logger()
+
+def assistant_fingerprint(params: Dict[str, Any]) -> str:
+    """Хэш конфигурации ассистента: сценарий с инструкциями, модель, функции"""
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class AssistantBootstrap:
+    """
+    Запуск без обращения к OpenAI за ассистентом.
+
+    ID используемого ассистента хранится в таблице assistant_records вместе
+    с хэшем его конфигурации. Если хэш не изменился, бот стартует сразу,
+    а существование ассистента проверяется в фоне. При первом запуске
+    настроенный ассистент только проверяется и принимается как есть - его
+    инструкции и модель не перезаписываются. Ассистент обновляется только
+    при изменении сохранённого хэша (сценария, инструкций, функций или
+    модели), новый ID сохраняется и переживает перезапуск.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker):
+        self.session_maker = session_maker
+        self._verify_task: asyncio.Task | None = None
+        self._skipped = 0
+        self._adopted = 0
+        self._updated = 0
+        self._created = 0
+        self._verify_failures = 0
+
+    async def ensure(self, configured_id: str) -> str:
+        """Возвращает ID ассистента с актуальной конфигурацией"""
+        params = assistant_params()
+        fingerprint = assistant_fingerprint(params)
+
+        record = await self._load(configured_id)
+        if record is not None and record.fingerprint == fingerprint:
+            self._skipped += 1
+            logger.info(f"Assistant {record.assistant_id} is up to date, skipping remote check")
+            self._verify_task = asyncio.create_task(
+                self.verify(configured_id, record.assistant_id, params, fingerprint)
+            )
+            return record.assistant_id
+
+        if record is None:
+            # Первый запуск: настроенный ассистент принимается как есть
+            assistant_id = await self._adopt(configured_id)
+            if assistant_id is None:
+                # OpenAI не ответил: запускаемся с настроенным ассистентом и проверяем его в фоне.
+                # Хэш не сохраняется, поэтому следующий запуск снова примет ассистента как есть
+                self._verify_task = asyncio.create_task(
+                    self.verify(configured_id, configured_id, params, fingerprint)
+                )
+                return configured_id
+        else:
+            assistant_id = await self._sync(record.assistant_id, params)
+        await self._save(configured_id, assistant_id, fingerprint)
+        return assistant_id
+
+    async def _adopt(self, configured_id: str | None) -> str | None:
+        """
+        Проверяет настроенного ассистента, не меняя его; создаёт нового, если его нет.
+        Возвращает None, если проверить ассистента не удалось.
+        """
+        if configured_id:
+            try:
+                await call_openai(openai_client.beta.assistants.retrieve, configured_id, timeout=op_timeout("retrieve"))
+                self._adopted += 1
+                logger.info(f"Using configured assistant {configured_id}")
+                return configured_id
+            except NotFoundError:
+                logger.warning(f"Assistant {configured_id} not found, creating a new one")
+            except Exception as e:
+                # Сбой API не должен останавливать запуск
+                self._verify_failures += 1
+                logger.warning(f"Failed to check assistant {configured_id}, using it unchecked: {e}")
+                return None
+        new_id = await create_assistant()
+        self._created += 1
+        return new_id
+
+    async def verify(self, configured_id: str, assistant_id: str, params: Dict[str, Any], fingerprint: str) -> None:
+        """Фоновая проверка, что сохранённый ассистент не удалён в OpenAI"""
+        try:
+            await call_openai(openai_client.beta.assistants.retrieve, assistant_id, timeout=op_timeout("retrieve"))
+        except NotFoundError:
+            logger.warning(f"Assistant {assistant_id} no longer exists, creating a new one")
+            new_id = await self._sync(None, params)
+            await self._save(configured_id, new_id, fingerprint)
+            update_assistant_id(new_id)
+        except Exception as e:
+            # Недоступность API не мешает работе: ассистент, скорее всего, на месте
+            self._verify_failures += 1
+            logger.warning(f"Background assistant check failed: {e}")
+
+    async def _sync(self, assistant_id: str | None, params: Dict[str, Any]) -> str:
+        """Обновляет конфигурацию существующего ассистента или создаёт нового"""
+        if assistant_id:
+            try:
+                await call_openai(
+                    openai_client.beta.assistants.update,
+                    assistant_id,
+                    **params,
+                    timeout=op_timeout("create")
+                )
+                self._updated += 1
+                logger.info(f"Updated assistant {assistant_id} configuration")
+                return assistant_id
+            except NotFoundError:
+                logger.warning(f"Assistant {assistant_id} not found, creating a new one")
+
+        new_id = await create_assistant()
+        self._created += 1
+        return new_id
+
+    async def _load(self, configured_id: str) -> AssistantRecord | None:
+        try:
+            async with self.session_maker() as session:
+                return await session.scalar(
+                    select(AssistantRecord).where(AssistantRecord.configured_id == configured_id)
+                )
+        except Exception as e:
+            logger.error(f"Error loading assistant record: {e}")
+            return None
+
+    async def _save(self, configured_id: str, assistant_id: str, fingerprint: str) -> None:
+        async with self.session_maker() as session:
+            record = await session.scalar(
+                select(AssistantRecord).where(AssistantRecord.configured_id == configured_id)
+            )
+            if record is None:
+                record = AssistantRecord(configured_id=configured_id)
+                session.add(record)
+            record.assistant_id = assistant_id
+            record.fingerprint = fingerprint
+            await session.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики запуска ассистента"""
+        return {
+            "skipped_checks": self._skipped,
+            "adopted": self._adopted,
+            "updated": self._updated,
+            "created": self._created,
+            "verify_failures": self._verify_failures
+        }
+
+assistant_bootstrap = AssistantBootstrap(session_maker)
+register_stats("assistant", assistant_bootstrap.get_stats)
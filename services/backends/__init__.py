@@ -0,0 +1,28 @@
+from config_reader import LLMBackendType, bot_config
+from utils.metrics import register_stats
+from .base import LLMBackend, TurnCancelledError, TurnResult
+from .assistants import AssistantsBackend
+from .chat import ChatCompletionsBackend
+from .fake import FakeBackend
+
+def create_backend(kind: LLMBackendType) -> LLMBackend:
+    """Создаёт движок ответов по типу из настроек"""
+    if kind == LLMBackendType.CHAT:
+        return ChatCompletionsBackend(model=bot_config.chat_model)
+    if kind == LLMBackendType.FAKE:
+        return FakeBackend(latency=bot_config.fake_backend_latency)
+    return AssistantsBackend()
+
+llm_backend = create_backend(bot_config.llm_backend)
+register_stats("llm_backend", llm_backend.get_stats)
+
+__all__ = [
+    "LLMBackend",
+    "TurnCancelledError",
+    "TurnResult",
+    "AssistantsBackend",
+    "ChatCompletionsBackend",
+    "FakeBackend",
+    "create_backend",
+    "llm_backend"
+]
@@ -0,0 +1,421 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Dict
+
+import structlog
+from openai import NotFoundError
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config_reader import bot_config
+from models.novel import NovelMessage, NovelState
+from services.backends.base import DeltaHandler, LLMBackend, TurnCancelledError, TurnResult
+from services.compaction import format_summary_instructions
+from services.opening import Opening
+from services.run_poller import run_poller
+from services.run_stats import record_run, record_turn
+from services.thread_pool import thread_pool
+from utils.openai_helper import openai_client
+from utils.openai_resilience import RunFailedError, call_openai, openai_resilience
+from utils.openai_transport import op_timeout
+
+logger = structlog.get_logger()
+
+@dataclass
+class ActiveRun:
+    """Выполняющийся ход пользователя"""
+    thread_id: str
+    run_id: str | None = None  # Появляется после создания рана
+    stream: Any = None  # Поток событий рана в режиме стриминга
+    cancelled: bool = False
+
+class AssistantsBackend(LLMBackend):
+    """Ответы через треды и раны OpenAI Assistants API"""
+
+    name = "assistants"
+
+    def __init__(self, run_timeout: float = 180, max_attempts: int = 3):
+        self.run_timeout = run_timeout
+        self.max_attempts = max_attempts
+        self._active: Dict[int, ActiveRun] = {}
+        self._avg_completion_tokens = 0.0
+        self._cancelled = 0
+        self._tokens_saved = 0
+
+    @property
+    def opening_key(self) -> str:
+        return f"{self.name}:{bot_config.assistant_id}"
+
+    async def create_conversation(self, opening: Opening | None = None) -> str:
+        # Берём готовый тред из пула (или создаём, если пул пуст), засеянный вступлением
+        return await thread_pool.acquire(opening)
+
+    async def recreate_thread(self, session: AsyncSession, novel_state: NovelState) -> None:
+        """Создаёт новый тред взамен пропавшего в OpenAI"""
+        novel_state.thread_id = await thread_pool.acquire()
+        await session.commit()
+        logger.info(f"Created new thread: {novel_state.thread_id}")
+
+    async def create_run(
+        self,
+        session: AsyncSession,
+        novel_state: NovelState,
+        user_content: str | None,
+        stream: bool = False
+    ):
+        """
+        Запускает ран, добавляя сообщение пользователя в тот же запрос.
+
+        Тред считается существующим без отдельной проверки: если OpenAI
+        его не нашёл, создаём новый и повторяем запуск один раз.
+        """
+        params = {
+            "thread_id": novel_state.thread_id,
+            "assistant_id": bot_config.assistant_id
+        }
+        if user_content:
+            params["additional_messages"] = [{"role": "user", "content": user_content}]
+        if novel_state.summary:
+            # Старая часть треда заменяется кратким содержанием, в контекст идут только последние сообщения
+            params["additional_instructions"] = format_summary_instructions(novel_state.summary)
+            params["truncation_strategy"] = {
+                "type": "last_messages",
+                "last_messages": await self._unsummarized_messages(session, novel_state) + 1
+            }
+        if stream:
+            params["stream"] = True
+        params["timeout"] = op_timeout("stream" if stream else "create")
+
+        try:
+            return await call_openai(openai_client.beta.threads.runs.create, **params)
+        except NotFoundError as e:
+            logger.error(f"Thread validation failed: {e}")
+            await self.recreate_thread(session, novel_state)
+            params["thread_id"] = novel_state.thread_id
+            return await call_openai(openai_client.beta.threads.runs.create, **params)
+
+    @staticmethod
+    async def _unsummarized_messages(session: AsyncSession, novel_state: NovelState) -> int:
+        """
+        Сколько сообщений новеллы ещё не вошло в краткое содержание.
+        Между сжатиями их больше keep_messages, и все они должны остаться в контексте рана.
+        """
+        return await session.scalar(
+            select(func.count())
+            .select_from(NovelMessage)
+            .where(
+                NovelMessage.novel_state_id == novel_state.id,
+                NovelMessage.id > (novel_state.summarized_until_id or 0)
+            )
+        )
+
+    async def append_turn(self, novel_state: NovelState, user_content: str, assistant_content: str) -> None:
+        # Ход записывается в тред, чтобы следующий ран продолжил историю с него
+        for role, content in (("user", user_content), ("assistant", assistant_content)):
+            await call_openai(
+                openai_client.beta.threads.messages.create,
+                thread_id=novel_state.thread_id,
+                role=role,
+                content=content,
+                timeout=op_timeout("create")
+            )
+
+    async def get_run_message(self, novel_state: NovelState, run_id: str) -> str | None:
+        """Получает только сообщение, созданное указанным раном"""
+        messages = await call_openai(
+            openai_client.beta.threads.messages.list,
+            thread_id=novel_state.thread_id,
+            run_id=run_id,
+            limit=1,
+            timeout=op_timeout("list")
+        )
+        if not messages.data:
+            return None
+        return messages.data[0].content[0].text.value
+
+    async def generate(
+        self,
+        session: AsyncSession,
+        novel_state: NovelState,
+        user_content: str,
+        on_delta: DeltaHandler | None = None
+    ) -> TurnResult:
+        if not bot_config.assistant_id:
+            raise ValueError("Assistant ID is not set")
+        active = self._active[novel_state.user_id] = ActiveRun(thread_id=novel_state.thread_id)
+        try:
+            if on_delta is not None:
+                return await self._stream(session, novel_state, user_content, on_delta, active)
+            return await self._poll(session, novel_state, user_content, active)
+        finally:
+            if self._active.get(novel_state.user_id) is active:
+                del self._active[novel_state.user_id]
+
+    async def cancel_turn(self, user_id: int) -> bool:
+        active = self._active.get(user_id)
+        if active is None or active.cancelled:
+            return False
+        active.cancelled = True
+        self._cancelled += 1
+        # Оценка: столько токенов в среднем генерирует завершённый ран
+        self._tokens_saved += round(self._avg_completion_tokens)
+        logger.info(f"Cancelling active run of user {user_id}", run_id=active.run_id)
+
+        if active.run_id:
+            await self._cancel_run(active)
+        if active.stream is not None:
+            # Закрытие соединения сразу прерывает чтение событий
+            await active.stream.close()
+        return True
+
+    async def _cancel_run(self, active: ActiveRun) -> None:
+        """Останавливает ран в OpenAI и будит ожидающую его корутину"""
+        try:
+            await call_openai(
+                openai_client.beta.threads.runs.cancel,
+                thread_id=active.thread_id,
+                run_id=active.run_id,
+                timeout=op_timeout("create"),
+                max_attempts=1
+            )
+        except Exception as e:
+            # Ран мог успеть завершиться сам
+            logger.warning(f"Failed to cancel run {active.run_id}: {e}")
+        run_poller.abort(active.run_id, TurnCancelledError(active.run_id))
+
+    def _observe(self, run) -> None:
+        """Учитывает расход токенов завершённого рана для оценки экономии при отмене"""
+        if run.status == "completed" and run.usage:
+            tokens = run.usage.completion_tokens
+            if self._avg_completion_tokens:
+                self._avg_completion_tokens = 0.9 * self._avg_completion_tokens + 0.1 * tokens
+            else:
+                self._avg_completion_tokens = float(tokens)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **super().get_stats(),
+            "active_runs": len(self._active),
+            "cancelled_runs": self._cancelled,
+            "tokens_saved": self._tokens_saved
+        }
+
+    async def _poll(
+        self,
+        session: AsyncSession,
+        novel_state: NovelState,
+        user_content: str,
+        active: ActiveRun
+    ) -> TurnResult:
+        """Ран с ожиданием через общий поллер"""
+        attempt = 0
+        while attempt < self.max_attempts:
+            attempt += 1
+            logger.info(f"Attempt {attempt}/{self.max_attempts} to get assistant response")
+
+            # Сообщение пользователя добавляется только в первый ран
+            start_time = time.time()
+            run = await self.create_run(session, novel_state, user_content if attempt == 1 else None)
+            logger.info(f"Started run {run.id}")
+            active.thread_id, active.run_id = novel_state.thread_id, run.id
+            if active.cancelled:
+                # Отмена пришла, пока ран создавался
+                await self._cancel_run(active)
+                raise TurnCancelledError(run.id)
+
+            try:
+                run, polled = await run_poller.wait_tracked(
+                    novel_state.thread_id, run.id, timeout=self.run_timeout, status=run.status
+                )
+            except TurnCancelledError:
+                await record_turn(
+                    session,
+                    user_id=novel_state.user_id,
+                    thread_id=novel_state.thread_id,
+                    run_id=run.id,
+                    status="cancelled",
+                    duration=time.time() - start_time
+                )
+                raise
+            except asyncio.TimeoutError:
+                raise Exception(f"Assistant run timeout after {self.run_timeout} seconds")
+            except NotFoundError:
+                # Тред удалили, пока ран выполнялся (например, новеллу перезапустили)
+                logger.info("Thread was deleted, stopping run retrieval")
+                return TurnResult(text="")
+
+            await record_run(
+                session,
+                user_id=novel_state.user_id,
+                run=run,
+                duration=time.time() - start_time,
+                polls=polled.polls,
+                first_status_time=polled.time_to_first_change
+            )
+            self._observe(run)
+
+            if run.status == "failed":
+                # Повторяем только сбои на стороне OpenAI (server_error, rate_limit_exceeded)
+                error = RunFailedError(run)
+                delay = openai_resilience.should_retry(error, attempt, self.max_attempts)
+                if delay is None:
+                    raise error
+                logger.warning(f"Assistant run failed on attempt {attempt} ({error.code}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            if run.status not in ("completed", "requires_action"):
+                raise Exception(f"Assistant run ended with status {run.status}")
+
+            logger.info(f"Run completed in {time.time() - start_time:.2f} seconds")
+            text = await self.get_run_message(novel_state, run.id)
+
+            if run.status == "requires_action":
+                logger.info(
+                    "Run requires action",
+                    run_id=run.id,
+                    thread_id=novel_state.thread_id
+                )
+                return TurnResult(text=text or "", tool_calls=self._tool_calls(run))
+
+            if not text:
+                raise Exception(f"Run {run.id} completed without a message")
+            return TurnResult(text=text)
+
+        raise Exception(f"Assistant run failed after {self.max_attempts} attempts")
+
+    async def _stream(
+        self,
+        session: AsyncSession,
+        novel_state: NovelState,
+        user_content: str,
+        on_delta: DeltaHandler,
+        active: ActiveRun
+    ) -> TurnResult:
+        """Ран в режиме стриминга с теми же повторами сбойных ранов, что и в _poll"""
+        streamed = False
+
+        async def feed(delta: str) -> None:
+            nonlocal streamed
+            streamed = True
+            await on_delta(delta)
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                # Сообщение пользователя добавляется только в первый ран
+                return await self._stream_run(
+                    session, novel_state, user_content if attempt == 1 else None, feed, active
+                )
+            except RunFailedError as error:
+                if streamed:
+                    # Показанный пользователю текст уже не отозвать - повтор его бы продублировал
+                    openai_resilience.record_error(error)
+                    raise
+                delay = openai_resilience.should_retry(error, attempt, self.max_attempts)
+                if delay is None:
+                    raise
+                logger.warning(f"Assistant run failed on attempt {attempt} ({error.code}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                if active.cancelled:
+                    raise TurnCancelledError(active.run_id)
+
+    async def _stream_run(
+        self,
+        session: AsyncSession,
+        novel_state: NovelState,
+        user_content: str | None,
+        on_delta: DeltaHandler,
+        active: ActiveRun
+    ) -> TurnResult:
+        """Одна попытка рана в режиме стриминга"""
+        start_time = time.time()
+        first_token_time = None
+        first_status_time = None
+        action_run = None
+        final_run = None
+        text = ""
+        try:
+            stream = await self.create_run(session, novel_state, user_content, stream=True)
+            active.thread_id, active.stream = novel_state.thread_id, stream
+            async with stream:
+                async for event in stream:
+                    if event.event == "thread.run.created":
+                        active.run_id = event.data.id
+                        if active.cancelled:
+                            await self._cancel_run(active)
+                            raise TurnCancelledError(active.run_id)
+                    elif event.event == "thread.run.in_progress" and first_status_time is None:
+                        first_status_time = time.time() - start_time
+                    elif event.event == "thread.run.completed":
+                        final_run = event.data
+                    elif event.event == "thread.message.delta":
+                        for part in event.data.delta.content or []:
+                            if part.type == "text" and part.text and part.text.value:
+                                if first_token_time is None:
+                                    first_token_time = time.time() - start_time
+                                    logger.info(f"First token in {first_token_time:.2f} seconds")
+                                text += part.text.value
+                                await on_delta(part.text.value)
+                    elif event.event == "thread.run.requires_action":
+                        action_run = final_run = event.data
+                        break
+                    elif event.event == "thread.run.failed":
+                        final_run = event.data
+                        raise RunFailedError(event.data)
+                    elif event.event in ("thread.run.expired", "thread.run.cancelled"):
+                        if active.cancelled:
+                            raise TurnCancelledError(event.data.id)
+                        raise Exception(f"Assistant run ended with status {event.data.status}")
+        except TurnCancelledError:
+            raise
+        except Exception as e:
+            # Чтение прервано закрытием потока при отмене хода
+            if active.cancelled:
+                raise TurnCancelledError(active.run_id) from e
+            raise
+        finally:
+            if active.cancelled and final_run is None:
+                await record_turn(
+                    session,
+                    user_id=novel_state.user_id,
+                    thread_id=novel_state.thread_id,
+                    run_id=active.run_id or "",
+                    status="cancelled",
+                    duration=time.time() - start_time,
+                    streamed=True,
+                    first_token_time=first_token_time
+                )
+            if final_run is not None:
+                await record_run(
+                    session,
+                    user_id=novel_state.user_id,
+                    run=final_run,
+                    duration=time.time() - start_time,
+                    streamed=True,
+                    first_status_time=first_status_time,
+                    first_token_time=first_token_time
+                )
+                self._observe(final_run)
+
+        logger.info(f"Run completed in {time.time() - start_time:.2f} seconds")
+        if active.cancelled:
+            # Поток успел дочитаться до конца раньше, чем закрылся
+            raise TurnCancelledError(active.run_id)
+        if action_run:
+            logger.info(
+                "Run requires action",
+                run_id=action_run.id,
+                thread_id=novel_state.thread_id
+            )
+            return TurnResult(text=text, tool_calls=self._tool_calls(action_run))
+        return TurnResult(text=text)
+
+    @staticmethod
+    def _tool_calls(run) -> list:
+        required_action = getattr(run, "required_action", None)
+        if not required_action or not getattr(required_action, "submit_tool_outputs", None):
+            logger.warning("No tool outputs to submit", run_id=run.id)
+            return []
+        return list(required_action.submit_tool_outputs.tool_calls)
@@ -0,0 +1,103 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.novel import NovelState
+from services.opening import Opening
+from services.run_stats import SERVICE_USER_ID
+from services.thread_cleanup import enqueue_thread_deletion
+
+# Префикс ID тредов Assistants API
+OPENAI_THREAD_PREFIX = "thread_"
+
+# Получатель фрагментов текста при стриминге
+DeltaHandler = Callable[[str], Awaitable[None]]
+
+class TurnCancelledError(Exception):
+    """Ход отменён (рестарт или завершение новеллы во время генерации)"""
+
+@dataclass
+class TurnResult:
+    """Результат одного хода новеллы"""
+    text: str  # Полный сырой ответ модели (с пометками изображений)
+    # Вызовы функций: объекты с .id, .function.name и .function.arguments
+    tool_calls: List[Any] = field(default_factory=list)
+
+class LLMBackend(ABC):
+    """
+    Движок, генерирующий ответы новеллы.
+
+    NovelService не знает, как устроен диалог на стороне модели: тред
+    Assistants API, локальная история или заглушка. conversation_id
+    хранится в NovelState.thread_id.
+    """
+
+    name: str = ""
+    supports_compaction: bool = True  # Использует ли движок NovelState.summary вместо полной истории
+
+    @property
+    def opening_key(self) -> str:
+        """От чего, кроме сценария, зависит текст вступления (ассистент, модель)"""
+        return self.name
+
+    @abstractmethod
+    async def create_conversation(self, opening: Opening | None = None) -> str:
+        """
+        Создаёт диалог для новой новеллы и возвращает его ID.
+        Если передано вступление, диалог должен уже содержать его переписку.
+        """
+
+    async def generate_transcript(self, session: AsyncSession, prompt: str, opening: Opening | None = None) -> str:
+        """Генерирует ответ на prompt во временном диалоге (засеянном вступлением, если оно передано)"""
+        conversation_id = await self.create_conversation(opening)
+        # Служебная новелла без игрока, в базу и статистику ранов не сохраняется
+        novel_state = NovelState(user_id=SERVICE_USER_ID, thread_id=conversation_id)
+        try:
+            result = await self.generate(session, novel_state, prompt)
+        finally:
+            await self.release_conversation(session, conversation_id)
+            await session.commit()
+        return result.text
+
+    async def cancel_turn(self, user_id: int) -> bool:
+        """
+        Отменяет выполняющийся ход пользователя, ожидающая корутина получает TurnCancelledError.
+        Возвращает False, если отменять нечего.
+        """
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики движка"""
+        return {"name": self.name}
+
+    async def append_turn(self, novel_state: NovelState, user_content: str, assistant_content: str) -> None:
+        """
+        Добавляет в диалог готовый ход без генерации.
+        По умолчанию ничего не делает: история берётся из NovelMessage.
+        """
+
+    async def release_conversation(self, session: AsyncSession, conversation_id: str | None) -> None:
+        """
+        Освобождает диалог завершённой новеллы в рамках транзакции session.
+        Треды OpenAI (в т.ч. оставшиеся после смены движка) ставятся в очередь на удаление.
+        """
+        if conversation_id and conversation_id.startswith(OPENAI_THREAD_PREFIX):
+            await enqueue_thread_deletion(session, conversation_id)
+
+    @abstractmethod
+    async def generate(
+        self,
+        session: AsyncSession,
+        novel_state: NovelState,
+        user_content: str,
+        on_delta: DeltaHandler | None = None
+    ) -> TurnResult:
+        """
+        Генерирует ответ на user_content.
+
+        Если передан on_delta, текст отдаётся фрагментами по мере генерации.
+        Сообщение пользователя текущего хода к этому моменту уже может быть
+        сохранено в NovelMessage - user_content его заменяет.
+        """
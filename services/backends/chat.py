@@ -0,0 +1,161 @@
+import time
+import uuid
+from typing import Dict, List
+
+import structlog
+from openai.types.chat import ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.novel import NovelMessage, NovelState
+from services.backends.base import DeltaHandler, LLMBackend, TurnResult
+from services.compaction import format_summary_instructions
+from services.opening import Opening
+from services.run_stats import record_turn
+from utils.openai_helper import END_STORY_TOOL, load_story_instructions, openai_client
+from utils.openai_resilience import call_openai
+from utils.openai_transport import op_timeout
+
+logger = structlog.get_logger()
+
+class ChatCompletionsBackend(LLMBackend):
+    """
+    Ответы через Chat Completions API.
+
+    Диалог хранится только у нас: промпт собирается из сценария и истории
+    NovelMessage, ответ приходит одним стриминговым запросом без тредов,
+    ранов и опроса статусов. end_story вызывается как обычная функция.
+    """
+
+    name = "chat"
+
+    def __init__(self, model: str):
+        self.model = model
+        self._instructions: str | None = None
+
+    @property
+    def instructions(self) -> str:
+        # Сценарий читается с диска один раз
+        if self._instructions is None:
+            self._instructions = load_story_instructions()
+        return self._instructions
+
+    @property
+    def opening_key(self) -> str:
+        return f"{self.name}:{self.model}"
+
+    async def create_conversation(self, opening: Opening | None = None) -> str:
+        # Удалённого состояния нет, ID нужен только для логов и статистики.
+        # Вступление попадает в промпт из истории NovelMessage
+        return f"chat_{uuid.uuid4().hex}"
+
+    async def build_messages(
+        self,
+        session: AsyncSession,
+        novel_state: NovelState,
+        user_content: str
+    ) -> List[Dict[str, str]]:
+        """Промпт: сценарий, краткое содержание, сохранённая история и запрос текущего хода"""
+        # Сжатая часть истории заменена кратким содержанием
+        history = (await session.scalars(
+            select(NovelMessage)
+            .where(
+                NovelMessage.novel_state_id == novel_state.id,
+                NovelMessage.id > (novel_state.summarized_until_id or 0)
+            )
+            .order_by(NovelMessage.id)
+        )).all()
+
+        # Последнее сообщение пользователя - это текущий ход, его заменяет user_content
+        if history and history[-1].is_user:
+            history = history[:-1]
+
+        messages = [{"role": "system", "content": self.instructions}]
+        if novel_state.summary:
+            messages.append({"role": "system", "content": format_summary_instructions(novel_state.summary)})
+        messages.extend(
+            {"role": "user" if item.is_user else "assistant", "content": item.content}
+            for item in history
+        )
+        messages.append({"role": "user", "content": user_content})
+        return messages
+
+    async def generate(
+        self,
+        session: AsyncSession,
+        novel_state: NovelState,
+        user_content: str,
+        on_delta: DeltaHandler | None = None
+    ) -> TurnResult:
+        messages = await self.build_messages(session, novel_state, user_content)
+
+        start_time = time.time()
+        first_token_time = None
+        text = ""
+        tool_calls: Dict[int, Dict[str, str]] = {}
+        usage = None
+        completion_id = None
+
+        stream = await call_openai(
+            openai_client.chat.completions.create,
+            model=self.model,
+            messages=messages,
+            tools=[END_STORY_TOOL],
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=op_timeout("stream")
+        )
+        async with stream:
+            async for chunk in stream:
+                completion_id = chunk.id
+                if chunk.usage:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                        logger.info(f"First token in {first_token_time:.2f} seconds")
+                    text += delta.content
+                    if on_delta is not None:
+                        await on_delta(delta.content)
+
+                # Аргументы функций приходят по частям, собираем их по индексу вызова
+                for call in delta.tool_calls or []:
+                    collected = tool_calls.setdefault(call.index, {"id": "", "name": "", "arguments": ""})
+                    if call.id:
+                        collected["id"] = call.id
+                    if call.function and call.function.name:
+                        collected["name"] += call.function.name
+                    if call.function and call.function.arguments:
+                        collected["arguments"] += call.function.arguments
+
+        duration = time.time() - start_time
+        logger.info(f"Completion finished in {duration:.2f} seconds")
+        await record_turn(
+            session,
+            user_id=novel_state.user_id,
+            thread_id=novel_state.thread_id,
+            run_id=completion_id or "",
+            status="requires_action" if tool_calls else "completed",
+            duration=duration,
+            streamed=True,
+            first_token_time=first_token_time,
+            prompt_tokens=usage.prompt_tokens if usage else None,
+            completion_tokens=usage.completion_tokens if usage else None
+        )
+
+        return TurnResult(
+            text=text,
+            tool_calls=[
+                ChatCompletionMessageToolCall(
+                    id=call["id"],
+                    type="function",
+                    function=Function(name=call["name"], arguments=call["arguments"])
+                )
+                for _, call in sorted(tool_calls.items())
+            ]
+        )
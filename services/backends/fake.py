@@ -0,0 +1,76 @@
+import asyncio
+import json
+import time
+import uuid
+
+from openai.types.chat import ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.novel import NovelState
+from services.backends.base import DeltaHandler, LLMBackend, TurnResult
+from services.opening import Opening
+from services.run_stats import record_turn
+
+# Сообщение игрока, на которое заглушка вызывает end_story
+END_STORY_TRIGGER = "/end_story"
+
+class FakeBackend(LLMBackend):
+    """
+    Локальная заглушка без обращений к OpenAI для тестов и нагрузочных прогонов.
+
+    Отвечает эхом запроса, отдавая текст по словам с задержкой latency
+    (делится поровну между фрагментами).
+    """
+
+    name = "fake"
+    supports_compaction = False
+
+    def __init__(self, latency: float = 0.0, reply_template: str = "Ответ на: {content}"):
+        self.latency = latency
+        self.reply_template = reply_template
+        self.turns = 0
+
+    async def create_conversation(self, opening: Opening | None = None) -> str:
+        return f"fake_{uuid.uuid4().hex}"
+
+    async def generate(
+        self,
+        session: AsyncSession,
+        novel_state: NovelState,
+        user_content: str,
+        on_delta: DeltaHandler | None = None
+    ) -> TurnResult:
+        self.turns += 1
+        start_time = time.time()
+
+        if user_content.strip() == END_STORY_TRIGGER:
+            text = ""
+            tool_calls = [ChatCompletionMessageToolCall(
+                id=f"call_{self.turns}",
+                type="function",
+                function=Function(name="end_story", arguments=json.dumps({"reason": "user_choice"}))
+            )]
+        else:
+            text = self.reply_template.format(content=user_content)
+            tool_calls = []
+
+        chunks = [word + " " for word in text.split(" ")] if text else []
+        delay = self.latency / len(chunks) if chunks else self.latency
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            if on_delta is not None:
+                await on_delta(chunk)
+        if not chunks:
+            await asyncio.sleep(delay)
+
+        await record_turn(
+            session,
+            user_id=novel_state.user_id,
+            thread_id=novel_state.thread_id,
+            run_id=f"fake_run_{self.turns}",
+            status="requires_action" if tool_calls else "completed",
+            duration=time.time() - start_time,
+            streamed=on_delta is not None
+        )
+        return TurnResult(text="".join(chunks).strip(), tool_calls=tool_calls)
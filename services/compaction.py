@@ -0,0 +1,168 @@
+import asyncio
+from typing import Any, Dict, List, Sequence, Tuple
+
+import structlog
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from config_reader import bot_config
+from models.novel import NovelMessage, NovelState
+from utils.db import session_maker
+from utils.metrics import register_stats
+from utils.openai_helper import openai_client
+from utils.openai_resilience import call_openai
+from utils.openai_transport import op_timeout
+
+logger = structlog.get_logger()
+
+SUMMARY_PROMPT = """Ты ведёшь конспект интерактивной визуальной новеллы.
+Обнови краткое содержание истории с учётом новых событий. Сохрани имя игрока,
+персонажей и отношения с ними, принятые игроком решения, текущую сцену и
+незакрытые сюжетные линии. Пиши кратко, в прошедшем времени, не более 300 слов.
+Верни только текст краткого содержания."""
+
+def format_summary_instructions(summary: str) -> str:
+    """Краткое содержание сжатой части истории для подстановки в промпт"""
+    return f"Краткое содержание предыдущих событий новеллы:\n{summary}"
+
+class ContextCompactor:
+    """
+    Сжатие истории длинных новелл.
+
+    Когда в новелле набирается every_turns ходов сверх keep_messages последних
+    сообщений, старые сообщения пересказываются моделью в NovelState.summary.
+    Дальше в контекст идут только краткое содержание и последние сообщения,
+    поэтому время хода перестаёт расти вместе с длиной истории.
+    """
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker,
+        every_turns: int = 10,
+        keep_messages: int = 6,
+        model: str = "gpt-4o-mini"
+    ):
+        self.session_maker = session_maker
+        self.every_turns = every_turns
+        self.keep_messages = keep_messages
+        self.model = model
+        self._in_progress: set[int] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self._compactions = 0
+        self._failures = 0
+        self._compacted_turns = 0
+        self._tokens_saved = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.every_turns > 0
+
+    def record_turn(self, novel_state: NovelState) -> None:
+        """Учитывает ход, выполненный с кратким содержанием вместо полной истории"""
+        if novel_state.summary:
+            self._compacted_turns += 1
+            self._tokens_saved += novel_state.summary_saved_tokens or 0
+
+    def schedule(self, novel_state_id: int) -> None:
+        """Запускает сжатие в фоне, не задерживая ответ пользователю"""
+        if not self.enabled or novel_state_id in self._in_progress:
+            return
+        task = asyncio.create_task(self.maybe_compact(novel_state_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def maybe_compact(self, novel_state_id: int) -> bool:
+        """Сжимает историю новеллы, если накопилось достаточно новых ходов"""
+        if novel_state_id in self._in_progress:
+            return False
+        self._in_progress.add(novel_state_id)
+        try:
+            async with self.session_maker() as session:
+                novel_state = await session.get(NovelState, novel_state_id)
+                if novel_state is None:
+                    return False
+
+                messages = (await session.scalars(
+                    select(NovelMessage)
+                    .where(
+                        NovelMessage.novel_state_id == novel_state_id,
+                        NovelMessage.id > (novel_state.summarized_until_id or 0)
+                    )
+                    .order_by(NovelMessage.id)
+                )).all()
+                # Ход - это пара сообщений игрока и ассистента
+                if len(messages) < self.keep_messages + self.every_turns * 2:
+                    return False
+
+                older = messages[:-self.keep_messages] if self.keep_messages else messages
+                thread_id = novel_state.thread_id
+                summary, saved_tokens = await self.summarize(novel_state.summary, older)
+
+                # Пока шёл пересказ, новеллу могли перезапустить - он относится к прошлой истории
+                await session.refresh(novel_state)
+                if novel_state.thread_id != thread_id:
+                    return False
+
+                novel_state.summary = summary
+                novel_state.summarized_until_id = older[-1].id
+                novel_state.summary_saved_tokens = max(0, (novel_state.summary_saved_tokens or 0) + saved_tokens)
+                await session.commit()
+
+            self._compactions += 1
+            logger.info(
+                f"Compacted {len(older)} messages of novel {novel_state_id}, "
+                f"saving ~{saved_tokens} tokens per turn"
+            )
+            return True
+        except Exception as e:
+            self._failures += 1
+            logger.error(f"Error compacting novel {novel_state_id}: {e}")
+            return False
+        finally:
+            self._in_progress.discard(novel_state_id)
+
+    async def summarize(self, previous: str | None, messages: Sequence[NovelMessage]) -> Tuple[str, int]:
+        """
+        Пересказывает сообщения вместе с предыдущим кратким содержанием.
+        Возвращает новое краткое содержание и изменение экономии токенов на ход.
+        """
+        transcript: List[str] = []
+        if previous:
+            transcript.append(f"Краткое содержание до этого момента:\n{previous}\n")
+        transcript.extend(
+            f"{'Игрок' if item.is_user else 'Рассказчик'}: {item.content}" for item in messages
+        )
+
+        completion = await call_openai(
+            openai_client.chat.completions.create,
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": "\n".join(transcript)}
+            ],
+            timeout=op_timeout("create")
+        )
+        summary = completion.choices[0].message.content.strip()
+
+        # В промпт пересказа входят прежнее краткое содержание и новые сообщения, на выходе - новое
+        # краткое содержание: разница - на сколько дополнительно сократился контекст каждого хода
+        usage = completion.usage
+        saved_tokens = usage.prompt_tokens - usage.completion_tokens if usage else 0
+        return summary, saved_tokens
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики сжатия истории"""
+        return {
+            "compactions": self._compactions,
+            "failures": self._failures,
+            "compacted_turns": self._compacted_turns,
+            "tokens_saved": self._tokens_saved
+        }
+
+context_compactor = ContextCompactor(
+    session_maker,
+    every_turns=bot_config.compaction_every_turns,
+    keep_messages=bot_config.compaction_keep_messages,
+    model=bot_config.compaction_model
+)
+register_stats("compaction", context_compactor.get_stats)
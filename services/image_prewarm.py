@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+import structlog
+from aiogram import Bot
+from aiogram.types import BufferedInputFile
+
+from config_reader import bot_config
+from utils.db import create_db
+from utils.image_download import is_image
+from utils.metrics import register_stats
+from utils.openai_helper import download_image, image_cache, image_downloader
+from utils.telegram_files import telegram_files
+from utils.text_utils import image_patterns
+
+logger = structlog.get_logger()
+
+def scenario_image_ids(text: str) -> List[str]:
+    """ID изображений Google Drive из сценария, без повторов и в порядке появления"""
+    found = []
+    for pattern in image_patterns:
+        compiled = re.compile(pattern, re.DOTALL)
+        if not compiled.groups:
+            continue
+        found.extend((match.start(), match.group(1)) for match in compiled.finditer(text) if match.group(1))
+    return list(dict.fromkeys(image_id for _, image_id in sorted(found)))
+
+@dataclass
+class PrewarmReport:
+    """Результат прогрева изображений"""
+    total: int = 0
+    cached: int = 0  # Уже были в кэше на диске
+    downloaded: int = 0
+    uploaded: int = 0  # Загружены в чат-хранилище ради file_id
+    failed: Dict[str, str] = field(default_factory=dict)  # image_id -> ошибка
+    duration: float = 0.0
+
+    def format(self) -> str:
+        lines = [
+            f"Изображений в сценарии: {self.total}",
+            f"Уже в кэше: {self.cached}, скачано: {self.downloaded}, загружено в Telegram: {self.uploaded}",
+            f"Время: {self.duration:.1f} сек."
+        ]
+        if self.failed:
+            lines.append(f"Недоступны или повреждены ({len(self.failed)}):")
+            lines.extend(f"  {image_id}: {error}" for image_id, error in self.failed.items())
+        return "\n".join(lines)
+
+class ImagePrewarmer:
+    """
+    Прогрев изображений сценария.
+
+    Все изображения из scenario.txt скачиваются в ImageCache не больше
+    concurrency одновременно, чтобы первый игрок в сцене не ждал Google
+    Drive. Если задан чат-хранилище, каждое изображение без file_id один
+    раз отправляется туда, и file_id сохраняется для отправки игрокам.
+    """
+
+    def __init__(self, concurrency: int = 8, storage_chat_id: int | None = None):
+        self.concurrency = concurrency
+        self.storage_chat_id = storage_chat_id
+        self.last_report: PrewarmReport | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self, bot: Bot | None = None) -> None:
+        """Запускает прогрев в фоне"""
+        self._task = asyncio.create_task(self._run_background(bot))
+
+    async def _run_background(self, bot: Bot | None) -> None:
+        try:
+            await self.run(bot)
+        except Exception as e:
+            logger.error(f"Image prewarm failed: {e}")
+
+    async def run(self, bot: Bot | None = None, scenario_path: str = "scenario.txt") -> PrewarmReport:
+        started = time.monotonic()
+        with open(scenario_path, "r", encoding="utf-8") as file:
+            image_ids = scenario_image_ids(file.read())
+
+        report = PrewarmReport(total=len(image_ids))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        upload_bot = bot if self.storage_chat_id else None
+
+        async def warm(image_id: str) -> None:
+            async with semaphore:
+                try:
+                    data = await image_cache.get(image_id)
+                    if data and is_image(data):
+                        report.cached += 1
+                    else:
+                        data = await download_image(image_id)
+                        report.downloaded += 1
+                    if upload_bot and not await telegram_files.contains(image_id):
+                        await self._upload(upload_bot, image_id, data)
+                        report.uploaded += 1
+                except Exception as e:
+                    report.failed[image_id] = str(e) or type(e).__name__
+
+        await asyncio.gather(*(warm(image_id) for image_id in image_ids))
+        report.duration = time.monotonic() - started
+        self.last_report = report
+
+        logger.info(
+            f"Prewarmed {report.total - len(report.failed)} of {report.total} scenario images "
+            f"in {report.duration:.1f}s"
+        )
+        for image_id, error in report.failed.items():
+            logger.warning(f"Scenario image {image_id} is unavailable: {error}")
+        return report
+
+    async def _upload(self, bot: Bot, image_id: str, data: bytes) -> None:
+        """Загружает изображение в чат-хранилище и запоминает file_id"""
+        sent = await bot.send_photo(
+            self.storage_chat_id,
+            BufferedInputFile(data, filename=f"{image_id}.jpg"),
+            caption=image_id,
+            disable_notification=True
+        )
+        await telegram_files.remember(image_id, sent.photo[-1].file_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики последнего прогрева"""
+        report = self.last_report
+        if report is None:
+            return {"total": 0}
+        return {
+            "total": report.total,
+            "cached": report.cached,
+            "downloaded": report.downloaded,
+            "uploaded": report.uploaded,
+            "failed": len(report.failed),
+            "duration": report.duration
+        }
+
+image_prewarmer = ImagePrewarmer(
+    concurrency=bot_config.image_prewarm_concurrency,
+    storage_chat_id=bot_config.image_storage_chat_id
+)
+register_stats("image_prewarm", image_prewarmer.get_stats)
+
+async def _run_cli(args: argparse.Namespace) -> int:
+    await create_db()
+    image_prewarmer.concurrency = args.concurrency
+    bot = None
+    if args.upload and image_prewarmer.storage_chat_id:
+        bot = Bot(token=bot_config.token.get_secret_value())
+    try:
+        report = await image_prewarmer.run(bot, scenario_path=args.scenario)
+    finally:
+        if bot is not None:
+            await bot.session.close()
+        # Без фоновой задачи кэша индекс сам не сохранится
+        await image_cache.save_index()
+        await image_downloader.close()
+    print(report.format())
+    return 1 if report.failed else 0
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Прогрев изображений сценария")
+    parser.add_argument("--scenario", default="scenario.txt")
+    parser.add_argument("--concurrency", type=int, default=bot_config.image_prewarm_concurrency)
+    parser.add_argument(
+        "--upload",
+        action="store_true",
+        help="Загрузить изображения в BOT_IMAGE_STORAGE_CHAT_ID и сохранить file_id"
+    )
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_run_cli(args)))
+
+if __name__ == "__main__":
+    main()
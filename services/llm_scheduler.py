@@ -0,0 +1,212 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, AsyncIterator, Dict, List
+
+import structlog
+
+from config_reader import bot_config
+from models.novel import NovelState
+from utils.metrics import register_stats
+from utils.openai_transport import RateLimitState, rate_limits
+
+logger = structlog.get_logger()
+
+class Priority(IntEnum):
+    """Приоритет хода: меньше - раньше"""
+    OWNER = 0  # Владельцы и админы из bot_config.owners
+    PAID = 1  # Недавно оплатившие рестарт
+    ACTIVE = 2  # Игроки посреди истории
+    DEFAULT = 3
+
+class LLMQueueFullError(Exception):
+    """Ожидание хода дольше допустимого"""
+
+    def __init__(self, estimated_wait: float):
+        self.estimated_wait = estimated_wait
+        super().__init__(f"Estimated LLM queue wait {estimated_wait:.0f}s")
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    user_id: int = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(default_factory=time.monotonic, compare=False)
+
+class LLMScheduler:
+    """
+    Очередь ходов перед генерацией ответа.
+
+    Одновременно выполняется не больше max_concurrent ходов, а новый ход
+    начинается, только если по заголовкам x-ratelimit-* у OpenAI остались
+    запросы и токены на него. Ожидающие ходы выдаются по приоритету
+    (владельцы, оплатившие, активные игроки, остальные), внутри приоритета -
+    по порядку. Если оценка ожидания больше max_wait, ход сразу отклоняется.
+    """
+
+    def __init__(
+        self,
+        limits: RateLimitState,
+        max_concurrent: int = 50,
+        max_wait: float = 60.0,
+        turn_tokens: int = 4000,
+        paid_ttl: float = 1800
+    ):
+        self.limits = limits
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self.turn_tokens = turn_tokens
+        self.paid_ttl = paid_ttl
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._running = 0
+        self._paid: Dict[int, float] = {}
+        self._durations: deque = deque(maxlen=200)
+        self._retry_handle: asyncio.TimerHandle | None = None
+        self._granted = 0
+        self._queued = 0
+        self._rejected = 0
+        self._waits: deque = deque(maxlen=1000)
+
+    def mark_paid(self, user_id: int) -> None:
+        """Поднимает приоритет пользователя после оплаты на paid_ttl секунд"""
+        self._paid[user_id] = time.monotonic() + self.paid_ttl
+
+    def priority_for(self, user_id: int, novel_state: NovelState | None = None) -> Priority:
+        if user_id in bot_config.owners:
+            return Priority.OWNER
+        paid_until = self._paid.get(user_id)
+        if paid_until is not None:
+            if paid_until > time.monotonic():
+                return Priority.PAID
+            del self._paid[user_id]
+        if novel_state is not None and novel_state.player_name:
+            return Priority.ACTIVE
+        return Priority.DEFAULT
+
+    def queue_position(self, user_id: int) -> int | None:
+        """Место хода пользователя в очереди (с 1) или None, если он не ждёт"""
+        for position, waiter in enumerate(sorted(self._queue), start=1):
+            if waiter.user_id == user_id:
+                return position
+        return None
+
+    def _turn_duration(self) -> float:
+        return sum(self._durations) / len(self._durations) if self._durations else 10.0
+
+    def estimate_wait(self, priority: Priority = Priority.DEFAULT) -> float:
+        """Оценка ожидания нового хода с приоритетом priority, секунды"""
+        ahead = sum(1 for waiter in self._queue if waiter.priority <= priority)
+        budget_wait = self.limits.wait_time(self.turn_tokens * (ahead + 1), pending_requests=self._running + ahead)
+        # Ходов впереди больше, чем свободных мест - ждём, пока освободятся
+        overflow = self._running + ahead + 1 - self.max_concurrent
+        slots_wait = 0.0
+        if overflow > 0:
+            # Места освобождаются волнами по max_concurrent, первая - в среднем через полхода
+            slots_wait = (math.ceil(overflow / self.max_concurrent) - 0.5) * self._turn_duration()
+        return max(budget_wait, slots_wait)
+
+    def _budget_wait(self) -> float:
+        return self.limits.wait_time(self.turn_tokens, pending_requests=self._running)
+
+    def _can_start(self) -> bool:
+        return self._running < self.max_concurrent and self._budget_wait() <= 0
+
+    async def acquire(self, user_id: int, priority: Priority) -> None:
+        """Ждёт своей очереди на ход; LLMQueueFullError - ждать слишком долго"""
+        if not self._queue and self._can_start():
+            self._running += 1
+            self._granted += 1
+            self._waits.append(0.0)
+            return
+
+        estimated = self.estimate_wait(priority)
+        if estimated > self.max_wait:
+            self._rejected += 1
+            logger.warning(f"Rejecting turn of user {user_id}: estimated wait {estimated:.0f}s")
+            raise LLMQueueFullError(estimated)
+
+        waiter = _Waiter(
+            priority=int(priority),
+            seq=next(self._seq),
+            user_id=user_id,
+            future=asyncio.get_running_loop().create_future()
+        )
+        heapq.heappush(self._queue, waiter)
+        self._queued += 1
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Место уже выдано - возвращаем его следующему
+                self.release()
+            else:
+                self._queue.remove(waiter)
+                heapq.heapify(self._queue)
+            raise
+        self._waits.append(time.monotonic() - waiter.enqueued_at)
+
+    def release(self, duration: float | None = None) -> None:
+        self._running -= 1
+        if duration is not None:
+            self._durations.append(duration)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Выдаёт места ожидающим ходам в порядке приоритета"""
+        while self._queue and self._can_start():
+            waiter = heapq.heappop(self._queue)
+            if waiter.future.done():
+                continue
+            self._running += 1
+            self._granted += 1
+            waiter.future.set_result(None)
+
+        if self._queue and self._running < self.max_concurrent and self._retry_handle is None:
+            # Ждём восстановления лимитов OpenAI
+            delay = max(0.05, self._budget_wait())
+            self._retry_handle = asyncio.get_running_loop().call_later(delay, self._retry)
+
+    def _retry(self) -> None:
+        self._retry_handle = None
+        self._dispatch()
+
+    @asynccontextmanager
+    async def turn(self, user_id: int, priority: Priority) -> AsyncIterator[None]:
+        """Место для одного хода на время генерации ответа"""
+        await self.acquire(user_id, priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики очереди ходов"""
+        waits = list(self._waits)
+        return {
+            "running": self._running,
+            "queued": len(self._queue),
+            "granted": self._granted,
+            "waited": self._queued,
+            "rejected": self._rejected,
+            "wait_max": max(waits, default=0.0),
+            "estimated_wait": self.estimate_wait()
+        }
+
+llm_scheduler = LLMScheduler(
+    rate_limits,
+    max_concurrent=bot_config.llm_max_concurrent_turns,
+    max_wait=bot_config.llm_max_queue_wait,
+    turn_tokens=bot_config.llm_turn_tokens,
+    paid_ttl=bot_config.llm_paid_priority_minutes * 60
+)
+register_stats("llm_scheduler", llm_scheduler.get_stats)
@@ -1,18 +1,30 @@
-import asyncio
+import math
 import structlog
-from sqlalchemy import select
+from functools import partial
+from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from aiogram.types import Message
 from config_reader import bot_config
-import time
 
 from models.novel import NovelState, NovelMessage
-from utils.openai_helper import openai_client, send_assistant_response, handle_tool_calls
+from utils.openai_helper import send_assistant_response, handle_tool_calls
 from keyboards.menu import get_main_menu
 from utils.text_utils import clean_assistant_message
+from utils.openai_resilience import OpenAIUnavailableError, openai_resilience
+from utils.outbound import outbound
+from utils.streaming import StreamingResponder
+from services.backends import LLMBackend, TurnCancelledError, llm_backend
+from services.compaction import context_compactor
+from services.llm_scheduler import LLMQueueFullError, llm_scheduler
+from services.opening import OPENING_PROMPT, Opening, character_prompt, opening_cache
+from services.thread_cleanup import thread_deletion_queue
 
 logger = structlog.get_logger()
 
+def opening_history_text(opening: Opening) -> str:
+    """Текст вступления в том виде, в каком он хранится в истории новеллы"""
+    return clean_assistant_message(opening.text) or opening.text
+
 # В начале файла
 SKIP_COMMANDS = {
     "🎮 Новелла", "📖 Продолжить", "🔄 Рестарт", 
@@ -21,8 +33,9 @@ SKIP_COMMANDS = {
 }
 
 class NovelService:
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, backend: LLMBackend | None = None):
         self.session = session
+        self.backend = backend or llm_backend
 
     async def get_novel_state(self, user_id: int) -> NovelState | None:
         """Получение состояния новеллы пользователя"""
@@ -44,35 +57,22 @@ class NovelService:
                 
             # Если есть старое состояние без требования оплаты - удаляем его
             if old_state:
-                # Сначала удаляем тред в OpenAI
-                try:
-                    if old_state.thread_id:
-                        await openai_client.beta.threads.delete(thread_id=old_state.thread_id)
-                except Exception as e:
-                    logger.error(f"Error deleting thread: {e}")
-                    # Продолжаем выполнение даже при ошибке удаления
-                    
-                # Затем удаляем запись из БД
+                # Ран старой новеллы больше не нужен
+                await self.backend.cancel_turn(user_id)
+                # Диалог освобождается в той же транзакции (тред OpenAI удалится в фоне)
+                await self.backend.release_conversation(self.session, old_state.thread_id)
                 await self.session.delete(old_state)
                 await self.session.commit()
+                thread_deletion_queue.wake()
             
-            # Создаем новый тред в OpenAI с повторными попытками
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    thread = await openai_client.beta.threads.create()
-                    break
-                except Exception as e:
-                    if attempt == max_retries - 1:
-                        logger.error(f"Failed to create thread after {max_retries} attempts: {e}")
-                        raise
-                    logger.warning(f"Attempt {attempt + 1} failed: {e}")
-                    await asyncio.sleep(1)
+            # Создаём диалог, уже содержащий готовое вступление (для Assistants API - тред из пула)
+            opening = await opening_cache.get(self.backend)
+            thread_id = await self.backend.create_conversation(opening)
             
             # Создаем новое состояние
             novel_state = NovelState(
                 user_id=user_id,
-                thread_id=thread.id,
+                thread_id=thread_id,
                 current_scene=0,
                 is_completed=False,
                 needs_payment=False
@@ -82,6 +82,10 @@ class NovelService:
             await self.session.commit()
             await self.session.refresh(novel_state)
             
+            if opening:
+                # Вступление сразу попадает в историю, первый ход обойдётся без рана
+                await self.save_message(novel_state, opening_history_text(opening))
+            
             return novel_state
             
         except Exception as e:
@@ -89,6 +93,33 @@ class NovelService:
             await self.session.rollback()
             raise
 
+    async def start_new_story(self, novel_state: NovelState) -> NovelState:
+        """
+        Начинает новую историю в существующем состоянии (рестарт, в т.ч. после оплаты).
+        Прежний диалог освобождается, этап ввода имени начинается заново.
+        """
+        await self.backend.cancel_turn(novel_state.user_id)
+        await self.backend.release_conversation(self.session, novel_state.thread_id)
+        # Новый диалог засевается вступлением так же, как при первом запуске
+        opening = await opening_cache.get(self.backend)
+        novel_state.thread_id = await self.backend.create_conversation(opening)
+        novel_state.current_scene = 0
+        novel_state.is_completed = False
+        novel_state.needs_payment = False
+        novel_state.player_name = None
+        # Краткое содержание прошлой истории к новой не относится
+        novel_state.summary = None
+        novel_state.summarized_until_id = None
+        novel_state.summary_saved_tokens = 0
+        # История прошлой новеллы не должна попадать в промпт новой (Chat Completions собирает его из NovelMessage)
+        await self.session.execute(delete(NovelMessage).where(NovelMessage.novel_state_id == novel_state.id))
+        await self.session.commit()
+        thread_deletion_queue.wake()
+        if opening:
+            await self.save_message(novel_state, opening_history_text(opening))
+        logger.info(f"Started new story for user {novel_state.user_id}")
+        return novel_state
+
     async def save_message(self, novel_state: NovelState, content: str, is_user: bool = False) -> NovelMessage:
         """Сохранение сообщения в базу"""
         message = NovelMessage(
@@ -114,195 +145,174 @@ class NovelService:
         message = result.scalar_one_or_none()
         return message.content if message else None
 
+    async def send_character_intro(self, message: Message, novel_state: NovelState, player_name: str) -> bool:
+        """
+        Отправляет знакомство с персонажами из готового шаблона с именем игрока
+        и добавляет его в диалог как ответ ассистента. False - шаблона нет, нужен обычный ран.
+        """
+        intro = await opening_cache.get_characters(self.backend)
+        if intro is None or not intro.personalized:
+            return False
+
+        rendered = intro.render(player_name)
+        try:
+            await self.backend.append_turn(novel_state, player_name, rendered)
+        except Exception as e:
+            logger.error(f"Failed to add character intro to conversation: {e}")
+            return False
+
+        await self.save_message(novel_state, clean_assistant_message(rendered) or rendered)
+        # Фотографии уже лежат в кэше изображений, скачивать их не нужно
+        await send_assistant_response(
+            message=message,
+            assistant_message=rendered,
+            reply_markup=get_main_menu(has_active_novel=True)
+        )
+        logger.info("Character intro sent from template")
+        return True
+
     async def process_message(self, message: Message, novel_state: NovelState, initial_message: bool = False) -> None:
         """Обработка сообщения пользователя"""
         try:
-            if not bot_config.assistant_id:
-                raise ValueError("Assistant ID is not set")
-                
-            # Проверяем существование треда перед использованием
-            try:
-                thread = await openai_client.beta.threads.retrieve(thread_id=novel_state.thread_id)
-                if not thread:
-                    raise Exception("Thread not found")
-            except Exception as e:
-                logger.error(f"Thread validation failed: {e}")
-                thread = await openai_client.beta.threads.create()
-                novel_state.thread_id = thread.id
-                await self.session.commit()
-                logger.info(f"Created new thread: {thread.id}")
+            # OpenAI недоступен - сразу просим подождать, не ставя ран в очередь
+            if not openai_resilience.breaker.available:
+                raise OpenAIUnavailableError(openai_resilience.breaker.recovery_timeout)
 
             text = message.text
             logger.info(f"Processing message: {text}")
 
             if initial_message:
+                # Диалог засеян готовым вступлением - отправляем его без обращения к модели
+                opening = await opening_cache.get(self.backend)
+                if opening and await self.get_last_assistant_message(novel_state) == opening_history_text(opening):
+                    await send_assistant_response(
+                        message=message,
+                        assistant_message=opening.text,
+                        reply_markup=get_main_menu(has_active_novel=True)
+                    )
+                    logger.info("Cached opening sent to user")
+                    return
+
                 # Для первого сообщения отправляем специальный промпт
-                initial_prompt = "Начни с краткого введения и спроси моё имя."
-                await openai_client.beta.threads.messages.create(
-                    thread_id=novel_state.thread_id,
-                    role="user",
-                    content=initial_prompt
-                )
-                logger.info(f"Sent initial prompt: {initial_prompt}")
+                user_content = OPENING_PROMPT
+                logger.info(f"Sending initial prompt: {user_content}")
             else:
                 # Сохраняем сообщение пользователя
                 await self.save_message(novel_state, text, is_user=True)
                 logger.info("User message saved")
                 
-                # Проверяем количество сообщений в треде
-                messages = await openai_client.beta.threads.messages.list(
-                    thread_id=novel_state.thread_id
-                )
-                
-                if len(messages.data) == 2:  # Первый вопрос и первый ответ (имя)
+                # Первый ответ после введения - имя игрока
+                if novel_state.player_name is None:
                     logger.info("Processing name response")
-                    await message.answer(
+                    novel_state.player_name = text
+                    await self.session.commit()
+
+                    # Знакомство с персонажами собирается из шаблона без рана
+                    if await self.send_character_intro(message, novel_state, text):
+                        return
+
+                    await outbound.send(message.chat.id, partial(
+                        message.answer,
                         "Создаю персонажей...",
                         reply_markup=get_main_menu(has_active_novel=True),
                         parse_mode="HTML"
-                    )
+                    ))
 
-                    character_prompt = f"""Теперь представь персонажей, строго следуя формату из сценария, и только после этого начни первую сцену. 
-                    
-                    ВАЖНО: Замени все упоминания "Игрок", "Саша" и подобные на имя игрока "{text}". История должна быть полностью персонализирована под это имя.
-                    
-                    Каждый персонаж должен быть представлен с фотографией на отдельной строке в формате [AI отправляет фото: ![название](ссылка)]"""
-                    
-                    await openai_client.beta.threads.messages.create(
-                        thread_id=novel_state.thread_id,
-                        role="user",
-                        content=character_prompt
-                    )
-                    logger.info("Sent character introduction prompt")
+                    user_content = character_prompt(text)
+                    logger.info("Sending character introduction prompt")
                 else:
                     # Обычное сообщение
-                    await openai_client.beta.threads.messages.create(
-                        thread_id=novel_state.thread_id,
-                        role="user",
-                        content=text
-                    )
-                    logger.info("Sent regular message")
+                    user_content = text
+                    logger.info("Sending regular message")
 
-            max_attempts = 3  # Максимальное количество попыток
-            attempt = 0
-            
-            while attempt < max_attempts:
-                attempt += 1
-                logger.info(f"Attempt {attempt}/{max_attempts} to get assistant response")
-                
-                # Проверяем, не был ли тред удален
-                if not novel_state.thread_id:
-                    logger.info("Thread was deleted, stopping message processing")
-                    return  # Добавляем return для полного завершения
-                
-                # Запускаем ассистента
-                try:
-                    run = await openai_client.beta.threads.runs.create(
-                        thread_id=novel_state.thread_id,
-                        assistant_id=bot_config.assistant_id
-                    )
-                    logger.info(f"Started run {run.id}")
-                except Exception as e:
-                    if "No thread found" in str(e):
-                        logger.info("Thread was deleted, stopping message processing")
-                        return
-                    raise e
+            use_compaction = context_compactor.enabled and self.backend.supports_compaction
+            if use_compaction:
+                context_compactor.record_turn(novel_state)
 
-                # Ожидаем завершения
-                start_time = time.time()
-                timeout = 180
-                
-                while True:
-                    if not novel_state.thread_id:
-                        logger.info("Thread was deleted during run, stopping processing")
-                        return
-                    
+            # Ход ждёт своей очереди по приоритету и лимитам OpenAI
+            priority = llm_scheduler.priority_for(novel_state.user_id, novel_state)
+            estimated_wait = llm_scheduler.estimate_wait(priority)
+            if estimated_wait >= bot_config.llm_queue_notice_after:
+                await outbound.send(message.chat.id, partial(
+                    message.answer,
+                    f"⏳ Сейчас много игроков, ответ начнётся примерно через {estimated_wait:.0f} сек.",
+                    reply_markup=get_main_menu(has_active_novel=True)
+                ))
+
+            async with llm_scheduler.turn(novel_state.user_id, priority):
+                if bot_config.stream_responses:
+                    # Ответ показывается по мере генерации
+                    responder = StreamingResponder(
+                        message,
+                        reply_markup=get_main_menu(has_active_novel=True),
+                        edit_interval=bot_config.stream_edit_interval
+                    )
+                    await responder.start()
                     try:
-                        run = await openai_client.beta.threads.runs.retrieve(
-                            thread_id=novel_state.thread_id,
-                            run_id=run.id
+                        result = await self.backend.generate(
+                            self.session, novel_state, user_content, on_delta=responder.feed
                         )
-                    except Exception as e:
-                        if "No thread found" in str(e):
-                            logger.info("Thread was deleted, stopping run retrieval")
-                            return
-                        raise e
+                    except TurnCancelledError:
+                        # Недописанный ответ отменённого хода не досылаем
+                        await responder.finish(flush=False)
+                        raise
+                    except Exception:
+                        await responder.finish()
+                        raise
+                    await responder.finish()
+                else:
+                    result = await self.backend.generate(self.session, novel_state, user_content)
 
-                    if run.status == "completed":
-                        break
-                    elif run.status == "requires_action":
-                        logger.info(
-                            "Run requires action",
-                            run_id=run.id,
-                            thread_id=novel_state.thread_id
-                        )
-                        
-                        # Получаем сообщение перед вызовом end_story
-                        messages = await openai_client.beta.threads.messages.list(
-                            thread_id=novel_state.thread_id
-                        )
-                        if messages.data:
-                            assistant_message = messages.data[0].content[0].text.value
-                            # Сохраняем и отправляем сообщение
-                            await self.save_message(novel_state, assistant_message)
-                            await send_assistant_response(message, assistant_message)
-                        
-                        # Обрабатываем tool calls
-                        await handle_tool_calls(run, novel_state.thread_id, self, novel_state, message)
-                        return  # Завершаем обработку, так как история закончена
-                    elif run.status == "failed":
-                        if attempt < max_attempts:
-                            logger.warning(f"Assistant run failed on attempt {attempt}, retrying...")
-                            await asyncio.sleep(2)
-                            break
-                        else:
-                            raise Exception(f"Assistant run failed after {max_attempts} attempts")
-                    elif run.status == "expired":
-                        raise Exception("Assistant run expired")
-                    elif time.time() - start_time > timeout:
-                        raise Exception(f"Assistant run timeout after {timeout} seconds. Last status: {run.status}")
-                    
-                    # Логируем статус каждые 10 секунд
-                    if int(time.time() - start_time) % 10 == 0:
-                        logger.info(f"Waiting for assistant response... Status: {run.status}, Time elapsed: {int(time.time() - start_time)}s")
-                    
-                    await asyncio.sleep(1)
+            assistant_message = result.text
+            if assistant_message:
+                logger.info(f"Raw assistant response:\n{assistant_message}")
                 
-                # Если выполнение успешно завершено, выходим из цикла попыток
-                if run.status == "completed":
-                    break
+                # Сохраняем ответ ассистента (если текст пустой после очистки, сохраняем оригинал)
+                clean_message = clean_assistant_message(assistant_message)
+                message_to_save = clean_message if clean_message else assistant_message
+                await self.save_message(novel_state, message_to_save)
+                logger.info("Assistant message saved to database")
+                
+                if not bot_config.stream_responses:
+                    # Отправляем ответ с клавиатурой активной новеллы
+                    await send_assistant_response(
+                        message=message,
+                        assistant_message=assistant_message,
+                        reply_markup=get_main_menu(has_active_novel=True)
+                    )
+                    logger.info("Response sent to user")
 
-            duration = time.time() - start_time
-            logger.info(f"Run completed in {duration:.2f} seconds")
+            # Обрабатываем вызовы функций (end_story)
+            if result.tool_calls:
+                await handle_tool_calls(result.tool_calls, novel_state.thread_id, self, novel_state, message)
+            elif use_compaction:
+                # Сжимаем накопившуюся историю в фоне
+                context_compactor.schedule(novel_state.id)
 
-            # Получаем и обрабатываем ответ ассистента
-            messages = await openai_client.beta.threads.messages.list(
-                thread_id=novel_state.thread_id
-            )
-            assistant_message = messages.data[0].content[0].text.value
-            
-            logger.info(f"Raw assistant response:\n{assistant_message}")
-            
-            # Сохраняем ответ ассистента (если текст пустой после очистки, сохраняем оригинал)
-            clean_message = clean_assistant_message(assistant_message)
-            message_to_save = clean_message if clean_message else assistant_message
-            await self.save_message(novel_state, message_to_save)
-            logger.info("Assistant message saved to database")
-            
-            # Отправляем ответ с клавиатурой активной новеллы
-            await send_assistant_response(
-                message=message,
-                assistant_message=assistant_message,
+        except TurnCancelledError:
+            # Новеллу перезапустили или завершили во время хода - отвечать уже не нужно
+            logger.info(f"Turn of user {novel_state.user_id} was cancelled")
+        except LLMQueueFullError as e:
+            logger.warning(f"LLM queue is full, rejecting message: {e}")
+            await outbound.send(message.chat.id, partial(
+                message.answer,
+                f"Сейчас слишком много игроков. Пожалуйста, попробуйте через {max(1, math.ceil(e.estimated_wait / 60))} мин.",
                 reply_markup=get_main_menu(has_active_novel=True)
-            )
-            logger.info("Response sent to user")
-
+            ))
+        except OpenAIUnavailableError as e:
+            logger.warning(f"OpenAI unavailable, rejecting message: {e}")
+            await outbound.send(message.chat.id, partial(
+                message.answer,
+                "Сервис временно перегружен. Пожалуйста, попробуйте через пару минут.",
+                reply_markup=get_main_menu(has_active_novel=True)
+            ))
         except Exception as e:
             logger.error(f"Error processing message: {e}")
-            await message.answer(
+            await outbound.send(message.chat.id, partial(
+                message.answer,
                 "Произошла ошибка при обработке сообщения. Пожалуйста, попробуйте позже.",
                 reply_markup=get_main_menu(has_active_novel=True)
-            )
+            ))
 
     async def end_story(self, novel_state: NovelState, message: Message, silent: bool = False) -> None:
         """Завершает новеллу и очищает данные"""
@@ -323,6 +333,12 @@ class NovelService:
             novel_state.needs_payment = True
             novel_state.is_completed = True
             
+            # Останавливаем ран, если он ещё идёт
+            await self.backend.cancel_turn(novel_state.user_id)
+            
+            # Тред в OpenAI удаляется в фоне, не дожидаясь ответа API
+            await self.backend.release_conversation(self.session, novel_state.thread_id)
+            
             try:
                 await self.session.commit()
                 logger.info(
@@ -341,36 +357,23 @@ class NovelService:
                 )
                 raise
             
-            # Удаляем тред в OpenAI
-            try:
-                logger.info(
-                    "Deleting OpenAI thread",
-                    user_id=message.from_user.id,
-                    thread_id=novel_state.thread_id
-                )
-                await openai_client.beta.threads.delete(thread_id=novel_state.thread_id)
-                logger.info(
-                    "OpenAI thread deleted successfully",
-                    user_id=message.from_user.id,
-                    thread_id=novel_state.thread_id
-                )
-            except Exception as e:
-                logger.error(
-                    "Error deleting OpenAI thread",
-                    user_id=message.from_user.id,
-                    thread_id=novel_state.thread_id,
-                    error=str(e)
-                )
+            thread_deletion_queue.wake()
+            logger.info(
+                "Conversation released",
+                user_id=message.from_user.id,
+                thread_id=novel_state.thread_id
+            )
             
             if not silent:
                 logger.info(
                     "Sending completion message",
                     user_id=message.from_user.id
                 )
-                await message.answer(
+                await outbound.send(message.chat.id, partial(
+                    message.answer,
                     "История завершена! Чтобы начать новую, нажмите '🎮 Новелла'",
                     reply_markup=get_main_menu(has_active_novel=False)
-                )
+                ))
                 logger.info(
                     "Completion message sent",
                     user_id=message.from_user.id
@@ -0,0 +1,262 @@
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Tuple
+
+import structlog
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from config_reader import bot_config
+from models.novel import OpeningTranscript
+from utils.db import session_maker
+from utils.metrics import register_stats
+from utils.openai_helper import download_image, load_story_instructions
+from utils.text_utils import extract_images_and_clean_text
+
+if TYPE_CHECKING:
+    from services.backends.base import LLMBackend
+
+logger = structlog.get_logger()
+
+# Первый запрос каждой новеллы, ответ на него одинаков для всех игроков
+OPENING_PROMPT = "Начни с краткого введения и спроси моё имя."
+
+# Подставляется вместо имени игрока при генерации шаблона знакомства с персонажами
+PLAYER_NAME_PLACEHOLDER = "[[ИМЯ]]"
+
+CHARACTER_PROMPT = """Теперь представь персонажей, строго следуя формату из сценария, и только после этого начни первую сцену.
+
+                    ВАЖНО: Замени все упоминания "Игрок", "Саша" и подобные на имя игрока "{name}". История должна быть полностью персонализирована под это имя.
+
+                    Каждый персонаж должен быть представлен с фотографией на отдельной строке в формате [AI отправляет фото: ![название](ссылка)]"""
+
+# Виды сохраняемых переписок
+OPENING_KIND = "opening"
+CHARACTERS_KIND = "characters"
+
+def character_prompt(name: str) -> str:
+    """Запрос знакомства с персонажами для игрока с именем name"""
+    return CHARACTER_PROMPT.format(name=name)
+
+@dataclass(frozen=True)
+class Opening:
+    """Готовое вступление новеллы"""
+    version: str  # Хэш сценария, движка/ассистента и промпта
+    text: str  # Сырой ответ модели (с пометками изображений)
+
+    @property
+    def messages(self) -> List[Dict[str, str]]:
+        """Переписка вступления для засева треда или истории"""
+        return [
+            {"role": "user", "content": OPENING_PROMPT},
+            {"role": "assistant", "content": self.text}
+        ]
+
+@dataclass(frozen=True)
+class CharacterIntro:
+    """Шаблон знакомства с персонажами, имя игрока подставляется локально"""
+    version: str
+    template: str  # Сырой ответ модели с PLAYER_NAME_PLACEHOLDER вместо имени
+
+    @property
+    def personalized(self) -> bool:
+        """Сохранила ли модель метку имени (иначе шаблон не годится для подстановки)"""
+        return PLAYER_NAME_PLACEHOLDER in self.template
+
+    def render(self, name: str) -> str:
+        return self.template.replace(PLAYER_NAME_PLACEHOLDER, name)
+
+    @property
+    def image_ids(self) -> List[str]:
+        return [image_id for _, image_id in extract_images_and_clean_text(self.template) if image_id]
+
+class OpeningCache:
+    """
+    Кэш одинаковых для всех игроков ответов начала новеллы.
+
+    Вступление (ответ на OPENING_PROMPT) и шаблон знакомства с персонажами
+    генерируются один раз на версию (scenario.txt, ассистент или модель
+    движка, промпт) и хранятся в таблице opening_transcripts. Новая новелла
+    получает диалог, уже содержащий вступление, а знакомство с персонажами
+    собирается из шаблона подстановкой имени - без ранов. При смене сценария
+    или ассистента версия меняется, и ответы генерируются заново.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker, enabled: bool = True):
+        self.session_maker = session_maker
+        self.enabled = enabled
+        self._versions: Dict[Tuple[str, str], str | None] = {}
+        self._opening: Opening | None = None
+        self._characters: CharacterIntro | None = None
+        self._hits = 0
+        self._misses = 0
+        self._generated = 0
+        self._task: asyncio.Task | None = None
+
+    def version_for(self, backend: "LLMBackend", prompt: str = OPENING_PROMPT) -> str | None:
+        """Версия ответа на prompt для движка; None, если сценарий недоступен"""
+        key = (backend.opening_key, prompt)
+        if key not in self._versions:
+            try:
+                instructions = load_story_instructions()
+            except OSError as e:
+                logger.warning(f"Opening cache disabled, scenario is not readable: {e}")
+                self._versions[key] = None
+            else:
+                digest = hashlib.sha256()
+                for part in (instructions, *key):
+                    digest.update(part.encode("utf-8"))
+                    digest.update(b"\0")
+                self._versions[key] = digest.hexdigest()
+        return self._versions[key]
+
+    async def _load(self, version: str) -> str | None:
+        try:
+            async with self.session_maker() as session:
+                content = await session.scalar(
+                    select(OpeningTranscript.content).where(OpeningTranscript.version == version)
+                )
+        except Exception as e:
+            logger.error(f"Error loading cached transcript {version[:12]}: {e}")
+            content = None
+
+        if content is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+        return content
+
+    async def _generate(
+        self,
+        backend: "LLMBackend",
+        kind: str,
+        version: str,
+        prompt: str,
+        opening: Opening | None = None
+    ) -> str | None:
+        """Генерирует ответ на prompt и заменяет им сохранённые ответы прежних версий"""
+        logger.info(f"Generating cached {kind} transcript for version {version[:12]}")
+        async with self.session_maker() as session:
+            text = await backend.generate_transcript(session, prompt, opening)
+            if not text:
+                logger.error(f"Backend returned an empty {kind} transcript, cache not updated")
+                return None
+            await session.execute(delete(OpeningTranscript).where(
+                OpeningTranscript.kind == kind,
+                OpeningTranscript.version != version
+            ))
+            session.add(OpeningTranscript(version=version, kind=kind, content=text))
+            await session.commit()
+
+        self._generated += 1
+        return text
+
+    async def get(self, backend: "LLMBackend") -> Opening | None:
+        """Вступление текущей версии или None, если его ещё нет"""
+        if not self.enabled:
+            return None
+        version = self.version_for(backend)
+        if version is None:
+            return None
+        if self._opening is not None and self._opening.version == version:
+            self._hits += 1
+            return self._opening
+
+        content = await self._load(version)
+        if content is None:
+            return None
+        self._opening = Opening(version=version, text=content)
+        return self._opening
+
+    async def get_characters(self, backend: "LLMBackend") -> CharacterIntro | None:
+        """Шаблон знакомства с персонажами текущей версии или None"""
+        if not self.enabled:
+            return None
+        version = self.version_for(backend, character_prompt(PLAYER_NAME_PLACEHOLDER))
+        if version is None:
+            return None
+        if self._characters is not None and self._characters.version == version:
+            self._hits += 1
+            return self._characters
+
+        content = await self._load(version)
+        if content is None:
+            return None
+        self._characters = CharacterIntro(version=version, template=content)
+        return self._characters
+
+    def start(
+        self,
+        backend: "LLMBackend",
+        on_ready: Callable[[Opening | None], None] | None = None
+    ) -> None:
+        """
+        Готовит вступление в фоне, не задерживая запуск бота.
+        Пока оно не готово, новеллы начинаются обычным раном.
+        """
+        self._task = asyncio.create_task(self._run_background(backend, on_ready))
+
+    async def _run_background(
+        self,
+        backend: "LLMBackend",
+        on_ready: Callable[[Opening | None], None] | None
+    ) -> None:
+        opening = None
+        try:
+            opening = await self.warm(backend)
+        except Exception as e:
+            logger.error(f"Failed to prepare novel opening, starting without cache: {e}")
+        if on_ready is not None:
+            on_ready(opening)
+
+    async def warm(self, backend: "LLMBackend") -> Opening | None:
+        """Готовит вступление и шаблон знакомства с персонажами, если их ещё нет"""
+        opening = await self.get(backend)
+        if opening is None and self.enabled:
+            version = self.version_for(backend)
+            if version is None:
+                return None
+            text = await self._generate(backend, OPENING_KIND, version, OPENING_PROMPT)
+            if text is None:
+                return None
+            opening = self._opening = Opening(version=version, text=text)
+
+        if opening is not None:
+            try:
+                await self.warm_characters(backend, opening)
+            except Exception as e:
+                # Без шаблона знакомство с персонажами просто пойдёт обычным раном
+                logger.error(f"Failed to prepare character intro template: {e}")
+        return opening
+
+    async def warm_characters(self, backend: "LLMBackend", opening: Opening) -> CharacterIntro | None:
+        """Генерирует шаблон знакомства с персонажами и заранее скачивает его изображения"""
+        intro = await self.get_characters(backend)
+        if intro is None:
+            prompt = character_prompt(PLAYER_NAME_PLACEHOLDER)
+            version = self.version_for(backend, prompt)
+            text = await self._generate(backend, CHARACTERS_KIND, version, prompt, opening)
+            if text is None:
+                return None
+            intro = self._characters = CharacterIntro(version=version, template=text)
+            if not intro.personalized:
+                # Шаблон всё равно сохраняется, чтобы не генерировать его при каждом запуске
+                logger.warning("Character intro has no name placeholder, falling back to regular runs")
+
+        # Фотографии персонажей к первому игроку уже лежат в кэше изображений
+        await asyncio.gather(*(download_image(image_id) for image_id in intro.image_ids), return_exceptions=True)
+        return intro
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики кэша начала новеллы"""
+        return {
+            "version": self._opening.version[:12] if self._opening else "",
+            "characters_version": self._characters.version[:12] if self._characters else "",
+            "hits": self._hits,
+            "misses": self._misses,
+            "generated": self._generated
+        }
+
+opening_cache = OpeningCache(session_maker, enabled=bot_config.opening_cache_enabled)
+register_stats("opening", opening_cache.get_stats)
@@ -0,0 +1,232 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Tuple
+
+import structlog
+from openai import NotFoundError
+from openai.types.beta.threads import Run
+
+from config_reader import bot_config
+from utils.metrics import register_stats
+from utils.openai_helper import openai_client
+from utils.openai_resilience import call_openai
+from utils.openai_transport import op_timeout
+from utils.rate_limit import TokenBucket
+
+logger = structlog.get_logger()
+
+# Статусы, после которых ран больше не меняется сам по себе
+TERMINAL_STATUSES = {"completed", "requires_action", "failed", "expired", "cancelled", "incomplete"}
+
+@dataclass
+class PolledRun:
+    """Ран, ожидающий завершения"""
+    thread_id: str
+    run_id: str
+    future: asyncio.Future
+    interval: float
+    registered_at: float = field(default_factory=time.monotonic)
+    next_poll_at: float = field(default_factory=time.monotonic)
+    polls: int = 0
+    errors: int = 0
+    in_progress: bool = False
+    status: str | None = None  # Последний известный статус рана
+    first_change_at: float | None = None  # Когда опрос впервые увидел смену статуса
+
+    @property
+    def time_to_first_change(self) -> float | None:
+        """Секунды от регистрации рана до первой замеченной смены статуса"""
+        if self.first_change_at is None:
+            return None
+        return self.first_change_at - self.registered_at
+
+class RunPoller:
+    """
+    Единый фоновый опрос статусов всех активных ранов.
+
+    Каждый ран опрашивается с нарастающим интервалом: часто в начале, реже для
+    долгих ранов, со случайным разбросом, чтобы запросы не шли пачками.
+    Все запросы runs.retrieve расходуют общий бюджет запросов в секунду.
+    Ожидающая корутина получает финальный Run через future.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: float = 10.0,
+        initial_interval: float = 0.5,
+        max_interval: float = 5.0,
+        backoff: float = 1.5,
+        jitter: float = 0.2,
+        max_errors: int = 5
+    ):
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.max_errors = max_errors
+        self._budget = TokenBucket(requests_per_second, requests_per_second)
+        self._runs: Dict[str, PolledRun] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._poll_tasks: set[asyncio.Task] = set()
+        self._polls = 0
+        self._errors = 0
+        self._finished = 0
+        self._finished_polls = 0
+        self._started_at = time.monotonic()
+
+    async def wait(self, thread_id: str, run_id: str, timeout: float = 180) -> Run:
+        """
+        Регистрирует ран и ждёт его перехода в финальный статус.
+
+        Raises:
+            asyncio.TimeoutError: ран не завершился за timeout секунд
+            openai.NotFoundError: тред или ран удалены
+        """
+        run, _ = await self.wait_tracked(thread_id, run_id, timeout=timeout)
+        return run
+
+    async def wait_tracked(
+        self,
+        thread_id: str,
+        run_id: str,
+        timeout: float = 180,
+        status: str | None = None
+    ) -> Tuple[Run, PolledRun]:
+        """
+        То же, что wait, но вместе с Run возвращает данные опроса
+        (число запросов, время до первой смены статуса).
+        status - статус рана на момент создания.
+        """
+        future = asyncio.get_running_loop().create_future()
+        polled = PolledRun(
+            thread_id=thread_id,
+            run_id=run_id,
+            future=future,
+            interval=self.initial_interval,
+            next_poll_at=time.monotonic() + self.initial_interval,
+            status=status
+        )
+        self._runs[run_id] = polled
+        self._ensure_running()
+        try:
+            return await asyncio.wait_for(future, timeout=timeout), polled
+        finally:
+            self._runs.pop(run_id, None)
+
+    def _ensure_running(self) -> None:
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def _loop(self) -> None:
+        while self._runs:
+            self._wakeup.clear()
+            now = time.monotonic()
+            due = sorted(
+                (run for run in self._runs.values() if not run.in_progress and run.next_poll_at <= now),
+                key=lambda run: run.next_poll_at
+            )
+            for polled in due:
+                await self._budget.acquire()
+                if polled.run_id in self._runs:
+                    polled.in_progress = True
+                    # Ссылка на задачу держится до её завершения, иначе её может собрать GC
+                    task = asyncio.create_task(self._poll(polled))
+                    self._poll_tasks.add(task)
+                    task.add_done_callback(self._poll_tasks.discard)
+
+            if not due:
+                waiting = [run.next_poll_at for run in self._runs.values() if not run.in_progress]
+                delay = max(0.0, min(waiting) - time.monotonic()) if waiting else self.max_interval
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def close(self) -> None:
+        """Останавливает опрос и отменяет запросы, ещё не получившие ответ"""
+        tasks = list(self._poll_tasks)
+        if self._task is not None:
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._poll_tasks.clear()
+        self._task = None
+
+    async def _poll(self, polled: PolledRun) -> None:
+        try:
+            # Повторы делает сам поллер по своему расписанию
+            run = await call_openai(
+                openai_client.beta.threads.runs.retrieve,
+                thread_id=polled.thread_id,
+                run_id=polled.run_id,
+                timeout=op_timeout("retrieve"),
+                max_attempts=1
+            )
+            self._polls += 1
+            polled.polls += 1
+        except NotFoundError as e:
+            self._resolve(polled, error=e)
+            return
+        except Exception as e:
+            self._errors += 1
+            polled.errors += 1
+            logger.warning(f"Error polling run {polled.run_id}: {e}")
+            if polled.errors >= self.max_errors:
+                self._resolve(polled, error=e)
+                return
+            run = None
+        finally:
+            polled.in_progress = False
+
+        if run is not None and run.status != polled.status:
+            if polled.status is not None and polled.first_change_at is None:
+                polled.first_change_at = time.monotonic()
+            polled.status = run.status
+
+        if run is not None and run.status in TERMINAL_STATUSES:
+            self._resolve(polled, run=run)
+            return
+
+        polled.interval = min(self.max_interval, polled.interval * self.backoff)
+        spread = polled.interval * self.jitter
+        polled.next_poll_at = time.monotonic() + polled.interval + random.uniform(-spread, spread)
+        self._wakeup.set()
+
+    def abort(self, run_id: str, error: Exception) -> bool:
+        """Сразу будит корутину, ожидающую ран, с ошибкой error (например, ран отменён)"""
+        polled = self._runs.get(run_id)
+        if polled is None:
+            return False
+        self._resolve(polled, error=error)
+        return True
+
+    def _resolve(self, polled: PolledRun, run: Run | None = None, error: Exception | None = None) -> None:
+        self._runs.pop(polled.run_id, None)
+        self._finished += 1
+        self._finished_polls += polled.polls
+        if polled.future.done():
+            return
+        if error is not None:
+            polled.future.set_exception(error)
+        else:
+            polled.future.set_result(run)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики опроса: сколько запросов тратится на ожидание ранов"""
+        uptime = max(1.0, time.monotonic() - self._started_at)
+        return {
+            "in_flight": len(self._runs),
+            "polls": self._polls,
+            "poll_errors": self._errors,
+            "polls_per_second": self._polls / uptime,
+            "finished_runs": self._finished,
+            "polls_per_run": self._finished_polls / self._finished if self._finished else 0.0
+        }
+
+run_poller = RunPoller(requests_per_second=bot_config.run_poll_rps)
+register_stats("run_poller", run_poller.get_stats)
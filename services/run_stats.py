@@ -0,0 +1,135 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+import structlog
+from openai.types.beta.threads import Run
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.novel import NovelRun
+from utils.metrics import percentile
+
+logger = structlog.get_logger()
+
+# user_id служебных ранов без игрока (генерация вступления и шаблона персонажей).
+# Они не попадают в статистику: долгие и затратные, они исказили бы задержки ходов игроков
+SERVICE_USER_ID = 0
+
+async def record_turn(
+    session: AsyncSession,
+    user_id: int,
+    thread_id: str,
+    run_id: str,
+    status: str,
+    duration: float,
+    streamed: bool = False,
+    queue_time: float | None = None,
+    polls: int | None = None,
+    first_status_time: float | None = None,
+    first_token_time: float | None = None,
+    prompt_tokens: int | None = None,
+    completion_tokens: int | None = None
+) -> None:
+    """Сохраняет задержки и расход токенов одного хода"""
+    if user_id == SERVICE_USER_ID:
+        return
+    try:
+        session.add(NovelRun(
+            user_id=user_id,
+            thread_id=thread_id,
+            run_id=run_id,
+            status=status,
+            streamed=streamed,
+            queue_time=queue_time,
+            first_status_time=first_status_time,
+            first_token_time=first_token_time,
+            duration=duration,
+            polls=polls,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens
+        ))
+        await session.commit()
+    except Exception as e:
+        # Статистика не должна ломать ответ пользователю
+        logger.error(f"Failed to record run {run_id} stats: {e}")
+        await session.rollback()
+
+async def record_run(
+    session: AsyncSession,
+    user_id: int,
+    run: Run,
+    duration: float,
+    streamed: bool = False,
+    polls: int | None = None,
+    first_status_time: float | None = None,
+    first_token_time: float | None = None
+) -> None:
+    """Сохраняет задержки и расход токенов завершённого рана Assistants API"""
+    queue_time = None
+    if run.created_at and run.started_at:
+        queue_time = float(run.started_at - run.created_at)
+
+    usage = run.usage
+    await record_turn(
+        session,
+        user_id=user_id,
+        thread_id=run.thread_id,
+        run_id=run.id,
+        status=run.status,
+        duration=duration,
+        streamed=streamed,
+        queue_time=queue_time,
+        polls=polls,
+        first_status_time=first_status_time,
+        first_token_time=first_token_time,
+        prompt_tokens=usage.prompt_tokens if usage else None,
+        completion_tokens=usage.completion_tokens if usage else None
+    )
+
+async def get_daily_run_stats(session: AsyncSession, days: int = 7) -> List[Dict[str, Any]]:
+    """Перцентили задержек и токены на ход по дням за последние days дней"""
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).replace(tzinfo=None)
+    runs = (await session.scalars(
+        select(NovelRun)
+        .where(NovelRun.created_at >= since, NovelRun.user_id != SERVICE_USER_ID)
+        .order_by(NovelRun.created_at)
+    )).all()
+
+    by_day = defaultdict(list)
+    for run in runs:
+        by_day[run.created_at.date()].append(run)
+
+    report = []
+    for day, day_runs in sorted(by_day.items(), reverse=True):
+        durations = [run.duration for run in day_runs]
+        queue_times = [run.queue_time for run in day_runs if run.queue_time is not None]
+        prompt_tokens = [run.prompt_tokens for run in day_runs if run.prompt_tokens is not None]
+        completion_tokens = [run.completion_tokens for run in day_runs if run.completion_tokens is not None]
+        report.append({
+            "day": day,
+            "runs": len(day_runs),
+            "failed": sum(1 for run in day_runs if run.status == "failed"),
+            "p50": percentile(durations, 50),
+            "p95": percentile(durations, 95),
+            "p99": percentile(durations, 99),
+            "queue_p95": percentile(queue_times, 95),
+            "prompt_tokens": sum(prompt_tokens) / len(prompt_tokens) if prompt_tokens else 0.0,
+            "completion_tokens": sum(completion_tokens) / len(completion_tokens) if completion_tokens else 0.0
+        })
+    return report
+
+def format_run_stats(report: List[Dict[str, Any]]) -> str:
+    """Форматирует отчёт по ранам для отправки в Telegram"""
+    if not report:
+        return "Данных о ранах пока нет"
+
+    lines = ["<b>Раны ассистента по дням</b>"]
+    for row in report:
+        lines.append(
+            f"\n<b>{row['day']:%d.%m}</b>: {row['runs']} ранов, ошибок {row['failed']}\n"
+            f"  длительность p50/p95/p99: {row['p50']:.1f} / {row['p95']:.1f} / {row['p99']:.1f} с\n"
+            f"  очередь OpenAI p95: {row['queue_p95']:.1f} с\n"
+            f"  токенов на ход: {row['prompt_tokens']:.0f} вход / {row['completion_tokens']:.0f} выход"
+        )
+    return "\n".join(lines)
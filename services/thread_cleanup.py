@@ -0,0 +1,166 @@
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable
+
+import structlog
+from openai import NotFoundError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from config_reader import bot_config
+from models.novel import ThreadDeletion
+from utils.db import session_maker
+from utils.metrics import register_stats
+from utils.openai_helper import openai_client
+from utils.openai_resilience import call_openai
+from utils.openai_transport import op_timeout
+
+logger = structlog.get_logger()
+
+def utcnow() -> datetime:
+    """Текущее время в UTC без часового пояса (как хранит SQLite)"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+async def enqueue_thread_deletion(session: AsyncSession, thread_id: str | None) -> None:
+    """
+    Ставит тред в очередь на удаление в рамках текущей транзакции.
+    Коммит остаётся за вызывающим кодом.
+    """
+    if not thread_id:
+        return
+    exists = await session.scalar(
+        select(ThreadDeletion.id).where(ThreadDeletion.thread_id == thread_id)
+    )
+    if not exists:
+        session.add(ThreadDeletion(thread_id=thread_id, attempts=0, next_attempt_at=utcnow()))
+
+class ThreadDeletionQueue:
+    """
+    Очередь удаления тредов OpenAI.
+
+    Треды записываются в таблицу thread_deletions и удаляются фоновой задачей
+    пачками. Неудачные попытки повторяются с экспоненциальной задержкой,
+    запись удаляется из таблицы только после успешного удаления треда
+    (или если тред уже не существует).
+    """
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker,
+        batch_size: int = 20,
+        base_delay: float = 30,
+        max_delay: float = 6 * 3600,
+        poll_interval: float = 60
+    ):
+        self.session_maker = session_maker
+        self.batch_size = batch_size
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._deleted = 0
+        self._failures = 0
+
+    def start(self) -> None:
+        """Запускает фоновую обработку очереди"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def wake(self) -> None:
+        """Просит обработать очередь, не дожидаясь следующего опроса"""
+        self._wakeup.set()
+
+    async def enqueue(self, thread_ids: Iterable[str]) -> None:
+        """Ставит треды в очередь в отдельной сессии"""
+        async with self.session_maker() as session:
+            for thread_id in thread_ids:
+                await enqueue_thread_deletion(session, thread_id)
+            await session.commit()
+        self.wake()
+
+    def _retry_delay(self, attempts: int) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    async def process_batch(self) -> int:
+        """Удаляет одну пачку тредов, у которых подошло время. Возвращает размер пачки"""
+        async with self.session_maker() as session:
+            batch = (await session.scalars(
+                select(ThreadDeletion)
+                .where(ThreadDeletion.next_attempt_at <= utcnow())
+                .order_by(ThreadDeletion.next_attempt_at)
+                .limit(self.batch_size)
+            )).all()
+            if not batch:
+                return 0
+
+            results = await asyncio.gather(
+                *(
+                    call_openai(
+                        openai_client.beta.threads.delete,
+                        thread_id=item.thread_id,
+                        timeout=op_timeout("delete"),
+                        max_attempts=1  # Повторы - через очередь
+                    )
+                    for item in batch
+                ),
+                return_exceptions=True
+            )
+
+            for item, result in zip(batch, results):
+                if not isinstance(result, Exception) or isinstance(result, NotFoundError):
+                    await session.delete(item)
+                    self._deleted += 1
+                    continue
+
+                self._failures += 1
+                item.attempts = (item.attempts or 0) + 1
+                item.last_error = str(result)[:1000]
+                item.next_attempt_at = utcnow() + timedelta(seconds=self._retry_delay(item.attempts))
+                logger.warning(
+                    f"Failed to delete thread {item.thread_id} "
+                    f"(attempt {item.attempts}): {result}"
+                )
+
+            await session.commit()
+            return len(batch)
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                # Разбираем все подошедшие записи пачками
+                while await self.process_batch() >= self.batch_size:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error processing thread deletion queue: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики очереди удаления тредов"""
+        return {
+            "deleted": self._deleted,
+            "failed_attempts": self._failures
+        }
+
+thread_deletion_queue = ThreadDeletionQueue(
+    session_maker,
+    batch_size=bot_config.thread_delete_batch_size
+)
+register_stats("thread_deletion", thread_deletion_queue.get_stats)
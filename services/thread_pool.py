@@ -0,0 +1,212 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict
+
+import structlog
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from config_reader import bot_config
+from models.novel import SpareThread
+from services.opening import Opening
+from services.thread_cleanup import thread_deletion_queue
+from utils.db import session_maker
+from utils.metrics import register_stats
+from utils.openai_helper import openai_client
+from utils.openai_resilience import call_openai
+from utils.openai_transport import op_timeout
+
+logger = structlog.get_logger()
+
+class ThreadPool:
+    """
+    Пул заранее созданных тредов OpenAI.
+
+    Запуск новеллы забирает готовый тред из базы вместо запроса к OpenAI.
+    Фоновая задача держит в пуле size тредов, запасные треды хранятся
+    в таблице spare_threads и переживают перезапуск бота. Треды старше
+    max_age удаляются и заменяются новыми. Если задано вступление (opening),
+    треды создаются уже с его перепиской, а треды другой версии вступления
+    считаются устаревшими.
+    """
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker,
+        size: int = 5,
+        max_age: timedelta = timedelta(days=7),
+        prune_interval: float = 3600
+    ):
+        self.session_maker = session_maker
+        self.size = size
+        self.max_age = max_age
+        self.prune_interval = prune_interval
+        self._lock = asyncio.Lock()
+        self._refill_needed = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.opening: Opening | None = None
+        self._hits = 0
+        self._misses = 0
+        self._created = 0
+        self._dropped = 0
+
+    def start(self) -> None:
+        """Запускает фоновое пополнение пула"""
+        if self.size > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def set_opening(self, opening: Opening | None) -> None:
+        """Меняет вступление, которым засеваются новые треды"""
+        self.opening = opening
+        self._refill_needed.set()
+
+    def _stale_before(self) -> datetime:
+        # SQLite хранит CURRENT_TIMESTAMP в UTC без часового пояса
+        return (datetime.now(timezone.utc) - self.max_age).replace(tzinfo=None)
+
+    @staticmethod
+    def _same_opening(opening: Opening | None):
+        if opening is None:
+            return SpareThread.opening_version.is_(None)
+        return SpareThread.opening_version == opening.version
+
+    @staticmethod
+    def _other_opening(opening: Opening | None):
+        if opening is None:
+            return SpareThread.opening_version.is_not(None)
+        return or_(SpareThread.opening_version.is_(None), SpareThread.opening_version != opening.version)
+
+    async def acquire(self, opening: Opening | None = None) -> str:
+        """
+        Возвращает ID свободного треда с переданным вступлением:
+        из пула, а если подходящих нет - создаёт новый
+        """
+        async with self._lock:
+            async with self.session_maker() as session:
+                spare = await session.scalar(
+                    select(SpareThread)
+                    .where(
+                        SpareThread.created_at >= self._stale_before(),
+                        self._same_opening(opening)
+                    )
+                    .order_by(SpareThread.created_at)
+                    .limit(1)
+                )
+                if spare:
+                    await session.delete(spare)
+                    await session.commit()
+
+        self._refill_needed.set()
+        if spare:
+            self._hits += 1
+            return spare.thread_id
+
+        self._misses += 1
+        logger.info("Thread pool is empty, creating thread on demand")
+        return await self.create_thread(opening)
+
+    async def create_thread(self, opening: Opening | None = None) -> str:
+        """Создаёт тред в OpenAI (с перепиской вступления, если оно передано)"""
+        params = {"timeout": op_timeout("create")}
+        if opening is not None:
+            params["messages"] = opening.messages
+        try:
+            thread = await call_openai(openai_client.beta.threads.create, **params)
+        except Exception as e:
+            logger.error(f"Failed to create thread: {e}")
+            raise
+        self._created += 1
+        return thread.id
+
+    async def fill(self) -> int:
+        """Досоздаёт недостающие треды, возвращает количество созданных"""
+        async with self.session_maker() as session:
+            available = await session.scalar(
+                select(func.count())
+                .select_from(SpareThread)
+                .where(
+                    SpareThread.created_at >= self._stale_before(),
+                    self._same_opening(self.opening)
+                )
+            )
+
+        missing = self.size - available
+        if missing <= 0:
+            return 0
+
+        opening = self.opening
+        results = await asyncio.gather(
+            *(self.create_thread(opening) for _ in range(missing)),
+            return_exceptions=True
+        )
+        thread_ids = [result for result in results if isinstance(result, str)]
+        if thread_ids:
+            async with self.session_maker() as session:
+                session.add_all(
+                    SpareThread(thread_id=thread_id, opening_version=opening.version if opening else None)
+                    for thread_id in thread_ids
+                )
+                await session.commit()
+            logger.info(f"Thread pool refilled with {len(thread_ids)} threads")
+        return len(thread_ids)
+
+    async def prune(self) -> int:
+        """Убирает из пула старые треды и треды другой версии вступления, ставит их в очередь на удаление"""
+        async with self._lock:
+            async with self.session_maker() as session:
+                stale = (await session.scalars(
+                    select(SpareThread.thread_id).where(or_(
+                        SpareThread.created_at < self._stale_before(),
+                        self._other_opening(self.opening)
+                    ))
+                )).all()
+                if not stale:
+                    return 0
+                await session.execute(delete(SpareThread).where(SpareThread.thread_id.in_(stale)))
+                await session.commit()
+
+        await thread_deletion_queue.enqueue(stale)
+        self._dropped += len(stale)
+        logger.info(f"Dropped {len(stale)} stale threads from pool")
+        return len(stale)
+
+    async def _run(self) -> None:
+        while True:
+            self._refill_needed.clear()
+            try:
+                await self.prune()
+                await self.fill()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error refilling thread pool: {e}")
+
+            try:
+                await asyncio.wait_for(self._refill_needed.wait(), timeout=self.prune_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики пула тредов"""
+        return {
+            "size": self.size,
+            "hits": self._hits,
+            "misses": self._misses,
+            "created": self._created,
+            "dropped_stale": self._dropped
+        }
+
+thread_pool = ThreadPool(
+    session_maker,
+    size=bot_config.thread_pool_size,
+    max_age=timedelta(hours=bot_config.thread_pool_max_age_hours)
+)
+register_stats("thread_pool", thread_pool.get_stats)
@@ -0,0 +1,118 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from openai import AsyncOpenAI
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from models.novel import AssistantRecord
+from services.assistant_bootstrap import AssistantBootstrap
+from utils.fake_openai import FakeOpenAIServer
+
+PARAMS = {"name": "Novel", "instructions": "Сценарий v1", "model": "gpt-4o", "tools": []}
+
+@pytest.fixture
+async def setup(engine):
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_maker() as session:
+        await session.execute(delete(AssistantRecord))
+        await session.commit()
+
+    async with FakeOpenAIServer() as server:
+        client = AsyncOpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+        with patch("services.assistant_bootstrap.openai_client", client), \
+                patch("utils.openai_helper.openai_client", client), \
+                patch("utils.openai_helper.load_story_instructions", return_value="Сценарий"):
+            yield session_maker, server
+        await client.close()
+
+@pytest.mark.asyncio
+async def test_unchanged_fingerprint_skips_remote_check(setup):
+    """Test the stored assistant is reused without a blocking OpenAI request"""
+    session_maker, server = setup
+    with patch("services.assistant_bootstrap.assistant_params", return_value=dict(PARAMS)):
+        # Настроенного ассистента нет - создаётся новый и запоминается
+        assistant_id = await AssistantBootstrap(session_maker).ensure("asst_configured")
+        assert assistant_id in server.assistants
+
+        requests = server.requests
+        bootstrap = AssistantBootstrap(session_maker)
+        assert await bootstrap.ensure("asst_configured") == assistant_id
+        assert server.requests == requests
+        await bootstrap._verify_task
+
+    assert bootstrap.get_stats()["skipped_checks"] == 1
+    assert len(server.assistants) == 1
+
+@pytest.mark.asyncio
+async def test_changed_scenario_updates_assistant(setup):
+    """Test a changed configuration updates the existing assistant instead of creating one"""
+    session_maker, server = setup
+    with patch("services.assistant_bootstrap.assistant_params", return_value=dict(PARAMS)):
+        assistant_id = await AssistantBootstrap(session_maker).ensure("asst_configured")
+
+    bootstrap = AssistantBootstrap(session_maker)
+    with patch("services.assistant_bootstrap.assistant_params", return_value={**PARAMS, "instructions": "Сценарий v2"}):
+        assert await bootstrap.ensure("asst_configured") == assistant_id
+
+    assert bootstrap.get_stats()["updated"] == 1
+    assert server.assistants[assistant_id]["instructions"] == "Сценарий v2"
+    assert len(server.assistants) == 1
+
+@pytest.mark.asyncio
+async def test_deleted_assistant_is_recreated_in_background(setup):
+    """Test the background check replaces an assistant deleted in OpenAI"""
+    session_maker, server = setup
+    with patch("services.assistant_bootstrap.assistant_params", return_value=dict(PARAMS)):
+        assistant_id = await AssistantBootstrap(session_maker).ensure("asst_configured")
+        server.assistants.clear()
+
+        bootstrap = AssistantBootstrap(session_maker)
+        with patch("services.assistant_bootstrap.update_assistant_id") as update_id:
+            assert await bootstrap.ensure("asst_configured") == assistant_id
+            await bootstrap._verify_task
+
+        new_id = update_id.call_args[0][0]
+        assert new_id != assistant_id and new_id in server.assistants
+        # Следующий запуск сразу берёт нового ассистента
+        restarted = AssistantBootstrap(session_maker)
+        assert await restarted.ensure("asst_configured") == new_id
+        await restarted._verify_task
+
+@pytest.mark.asyncio
+async def test_configured_assistant_is_adopted_unchanged(setup):
+    """Test the first start keeps the operator's assistant as is and updates it only after a change"""
+    session_maker, server = setup
+    client = AsyncOpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+    existing = await client.beta.assistants.create(model="gpt-4o", instructions="Рабочие инструкции")
+    await client.close()
+
+    bootstrap = AssistantBootstrap(session_maker)
+    with patch("services.assistant_bootstrap.assistant_params", return_value=dict(PARAMS)):
+        assert await bootstrap.ensure(existing.id) == existing.id
+    assert bootstrap.get_stats()["adopted"] == 1
+    assert bootstrap.get_stats()["updated"] == 0
+    assert server.assistants[existing.id]["instructions"] == "Рабочие инструкции"
+
+    # Изменение сценария после первого запуска обновляет ассистента
+    bootstrap = AssistantBootstrap(session_maker)
+    with patch("services.assistant_bootstrap.assistant_params", return_value={**PARAMS, "instructions": "Сценарий v2"}):
+        assert await bootstrap.ensure(existing.id) == existing.id
+    assert server.assistants[existing.id]["instructions"] == "Сценарий v2"
+    assert len(server.assistants) == 1
+
+@pytest.mark.asyncio
+async def test_unreachable_api_on_first_start_keeps_configured_assistant(setup):
+    """Test a failed check on first start falls back to the configured assistant instead of aborting"""
+    session_maker, server = setup
+    bootstrap = AssistantBootstrap(session_maker)
+    with patch("services.assistant_bootstrap.assistant_params", return_value=dict(PARAMS)), \
+            patch("services.assistant_bootstrap.openai_client") as client:
+        client.beta.assistants.retrieve = AsyncMock(side_effect=Exception("Connection error"))
+        assert await bootstrap.ensure("asst_configured") == "asst_configured"
+        await bootstrap._verify_task
+
+    assert bootstrap.get_stats()["created"] == 0
+    assert bootstrap.get_stats()["verify_failures"] == 2
+    assert not server.assistants
+    # Хэш не сохранён - следующий запуск проверит ассистента снова
+    assert await bootstrap._load("asst_configured") is None
@@ -0,0 +1,110 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from models.novel import NovelMessage, NovelState
+from services.backends import ChatCompletionsBackend, FakeBackend
+from services.novel import NovelService
+
+def make_message(text: str, user_id: int):
+    message = MagicMock()
+    message.text = text
+    message.chat.id = user_id
+    message.from_user.id = user_id
+    message.answer = AsyncMock()
+    return message
+
+def chunk(content=None, tool_call=None, usage=None):
+    choices = []
+    if content is not None or tool_call is not None:
+        delta = SimpleNamespace(content=content, tool_calls=[tool_call] if tool_call else None)
+        choices = [SimpleNamespace(delta=delta)]
+    return SimpleNamespace(id="chatcmpl_1", choices=choices, usage=usage)
+
+class FakeStream:
+    """Async stream of chat completion chunks"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for item in self.chunks:
+            yield item
+
+@pytest.mark.asyncio
+async def test_chat_backend_builds_prompt_from_history(db_session):
+    """Test the prompt is scenario + stored history, with the current turn replaced by user_content"""
+    novel_state = NovelState(user_id=556001, thread_id="chat_1", player_name="Аня")
+    db_session.add(novel_state)
+    await db_session.commit()
+    db_session.add_all([
+        NovelMessage(novel_state_id=novel_state.id, content="Как тебя зовут?", is_user=False),
+        NovelMessage(novel_state_id=novel_state.id, content="Аня", is_user=True)
+    ])
+    await db_session.commit()
+
+    backend = ChatCompletionsBackend(model="gpt-test")
+    backend._instructions = "Сценарий"
+    messages = await backend.build_messages(db_session, novel_state, "Представь персонажей для Ани")
+
+    assert [m["role"] for m in messages] == ["system", "assistant", "user"]
+    assert messages[-1]["content"] == "Представь персонажей для Ани"
+
+@pytest.mark.asyncio
+async def test_chat_backend_streams_text_and_end_story_call(db_session):
+    """Test one streaming completion yields text deltas and a collected end_story call"""
+    novel_state = NovelState(user_id=556002, thread_id="chat_2", player_name="Аня")
+    db_session.add(novel_state)
+    await db_session.commit()
+
+    def tool_part(index, call_id=None, name=None, arguments=None):
+        return SimpleNamespace(index=index, id=call_id, function=SimpleNamespace(name=name, arguments=arguments))
+
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(return_value=FakeStream([
+        chunk("Рассвет "),
+        chunk("над рекой."),
+        chunk(tool_call=tool_part(0, "call_1", "end_story", '{"reason": ')),
+        chunk(tool_call=tool_part(0, arguments='"final_scene"}')),
+        chunk(usage=SimpleNamespace(prompt_tokens=900, completion_tokens=40))
+    ]))
+    deltas = []
+
+    async def on_delta(text):
+        deltas.append(text)
+
+    backend = ChatCompletionsBackend(model="gpt-test")
+    backend._instructions = "Сценарий"
+    with patch("services.backends.chat.openai_client", client):
+        result = await backend.generate(db_session, novel_state, "Дальше", on_delta=on_delta)
+
+    assert deltas == ["Рассвет ", "над рекой."]
+    assert result.text == "Рассвет над рекой."
+    [call] = result.tool_calls
+    assert call.function.name == "end_story"
+    assert call.function.arguments == '{"reason": "final_scene"}'
+    client.chat.completions.create.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_fake_backend_turn_through_novel_service(db_session):
+    """Test NovelService works end to end on the local fake backend"""
+    novel_state = NovelState(user_id=556003, thread_id="fake_1", player_name="Аня")
+    db_session.add(novel_state)
+    await db_session.commit()
+
+    service = NovelService(db_session, backend=FakeBackend())
+    with patch("services.novel.send_assistant_response", AsyncMock()) as send_response, \
+            patch("services.novel.bot_config.stream_responses", False):
+        await service.process_message(make_message("Привет", 556003), novel_state)
+
+    send_response.assert_awaited_once()
+    assert await service.get_last_assistant_message(novel_state) == "Ответ на: Привет"
@@ -0,0 +1,79 @@
+import asyncio
+import datetime
+import pytest
+from aiogram.types import Chat, Message, Update, User
+
+from middlewares.coalescer import MessageCoalescerMiddleware
+
+def make_update(update_id: int, text: str, user_id: int = 1) -> Update:
+    message = Message(
+        message_id=update_id,
+        date=datetime.datetime.now(),
+        chat=Chat(id=user_id, type="private"),
+        from_user=User(id=user_id, is_bot=False, first_name="Test"),
+        text=text
+    )
+    return Update(update_id=update_id, message=message)
+
+@pytest.mark.asyncio
+async def test_messages_during_turn_are_combined():
+    """Test messages sent during an active turn become one follow-up turn"""
+    coalescer = MessageCoalescerMiddleware(window=0.02)
+    handled = []
+
+    async def handler(event, data):
+        handled.append(event.message.text)
+        await asyncio.sleep(0.05)
+
+    first = asyncio.create_task(coalescer(handler, make_update(1, "Привет"), {}))
+    await asyncio.sleep(0.01)
+    results = await asyncio.gather(
+        coalescer(handler, make_update(2, "Я иду"), {}),
+        coalescer(handler, make_update(3, "налево"), {})
+    )
+    await first
+
+    assert results == [None, None]
+    assert handled == ["Привет", "Я иду\nналево"]
+    assert coalescer.get_stats()["follow_up_turns"] == 1
+    assert coalescer.get_stats()["active_turns"] == 0
+
+@pytest.mark.asyncio
+async def test_commands_and_menu_buttons_are_not_buffered():
+    """Test commands and menu buttons bypass the buffer during a turn"""
+    coalescer = MessageCoalescerMiddleware(window=0.02, skip_texts={"🔄 Рестарт"})
+    handled = []
+
+    async def handler(event, data):
+        handled.append(event.message.text)
+        await asyncio.sleep(0.03)
+
+    first = asyncio.create_task(coalescer(handler, make_update(1, "Привет"), {}))
+    await asyncio.sleep(0.01)
+    await coalescer(handler, make_update(2, "/end_novel"), {})
+    await coalescer(handler, make_update(3, "🔄 Рестарт"), {})
+    await first
+
+    assert handled == ["Привет", "/end_novel", "🔄 Рестарт"]
+    assert coalescer.get_stats()["coalesced"] == 0
+
+@pytest.mark.asyncio
+async def test_discard_during_drain_drops_buffer():
+    """Test interrupting while the buffer is draining drops it without a follow-up turn"""
+    coalescer = MessageCoalescerMiddleware(window=0.05)
+    handled = []
+
+    async def handler(event, data):
+        handled.append(event.message.text)
+        await asyncio.sleep(0.02)
+
+    first = asyncio.create_task(coalescer(handler, make_update(1, "Привет"), {}))
+    await asyncio.sleep(0.01)
+    await coalescer(handler, make_update(2, "Я иду"), {})
+    # Ход закончился, идёт пауза перед отправкой буфера
+    await asyncio.sleep(0.03)
+    assert coalescer.discard(1) == 1
+    await first
+
+    assert handled == ["Привет"]
+    assert coalescer.get_stats()["follow_up_turns"] == 0
@@ -0,0 +1,129 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from models.novel import NovelMessage, NovelState
+from services.backends import AssistantsBackend, ChatCompletionsBackend
+from services.compaction import ContextCompactor
+from services.novel import NovelService
+
+def make_client(summary: str):
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(return_value=SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=summary))],
+        usage=SimpleNamespace(prompt_tokens=2000, completion_tokens=150)
+    ))
+    return client
+
+@pytest.mark.asyncio
+async def test_old_messages_are_summarized(engine):
+    """Test older messages are replaced by a summary and only the last ones stay in the prompt"""
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_maker() as session:
+        novel_state = NovelState(user_id=557001, thread_id="chat_1", player_name="Аня")
+        session.add(novel_state)
+        await session.commit()
+        session.add_all(
+            NovelMessage(novel_state_id=novel_state.id, content=f"Сообщение {i}", is_user=i % 2 == 1)
+            for i in range(10)
+        )
+        await session.commit()
+
+    compactor = ContextCompactor(session_maker, every_turns=3, keep_messages=4)
+    client = make_client("Аня познакомилась с Катей.")
+    with patch("services.compaction.openai_client", client):
+        assert await compactor.maybe_compact(novel_state.id)
+        # Новых ходов после сжатия не было
+        assert not await compactor.maybe_compact(novel_state.id)
+
+    client.chat.completions.create.assert_awaited_once()
+    async with session_maker() as session:
+        novel_state = await session.get(NovelState, novel_state.id)
+        assert novel_state.summary == "Аня познакомилась с Катей."
+        assert novel_state.summary_saved_tokens == 1850
+
+        backend = ChatCompletionsBackend(model="gpt-test")
+        backend._instructions = "Сценарий"
+        messages = await backend.build_messages(session, novel_state, "Дальше")
+
+    assert "Аня познакомилась с Катей." in messages[1]["content"]
+    assert [m["content"] for m in messages[2:-1]] == [f"Сообщение {i}" for i in range(6, 9)]
+
+    compactor.record_turn(novel_state)
+    assert compactor.get_stats()["tokens_saved"] == 1850
+
+@pytest.mark.asyncio
+async def test_restart_clears_summary(db_session):
+    """Test a new story does not inherit the summary and truncation of the previous one"""
+    novel_state = NovelState(
+        user_id=557002,
+        thread_id="thread_old",
+        player_name="Аня",
+        summary="Аня познакомилась с Катей.",
+        summarized_until_id=42,
+        summary_saved_tokens=1850
+    )
+    db_session.add(novel_state)
+    await db_session.commit()
+
+    backend = AssistantsBackend()
+    opening = MagicMock()
+    opening.get = AsyncMock(return_value=None)
+    with patch("services.novel.opening_cache", opening), \
+            patch("services.backends.assistants.thread_pool.acquire", AsyncMock(return_value="thread_new")):
+        await NovelService(db_session, backend=backend).start_new_story(novel_state)
+
+    assert novel_state.summary is None
+    assert novel_state.summarized_until_id is None
+    assert novel_state.summary_saved_tokens == 0
+
+    client = MagicMock()
+    client.beta.threads.runs.create = AsyncMock()
+    with patch("services.backends.assistants.openai_client", client):
+        await backend.create_run(db_session, novel_state, "Привет")
+    params = client.beta.threads.runs.create.call_args.kwargs
+    assert params["thread_id"] == "thread_new"
+    assert "additional_instructions" not in params
+    assert "truncation_strategy" not in params
+
+@pytest.mark.asyncio
+async def test_chat_prompt_after_restart_has_only_new_story(db_session):
+    """Test the Chat Completions prompt after a restart holds the opening and not the previous story"""
+    backend = ChatCompletionsBackend(model="gpt-test")
+    backend._instructions = "Сценарий"
+    opening = MagicMock()
+    opening.get = AsyncMock(return_value=SimpleNamespace(text="Добро пожаловать! Как тебя зовут?"))
+
+    with patch("services.novel.opening_cache", opening):
+        service = NovelService(db_session, backend=backend)
+        novel_state = await service.create_novel_state(557003)
+        await service.save_message(novel_state, "Аня", is_user=True)
+        await service.save_message(novel_state, "Старая история")
+        await service.start_new_story(novel_state)
+
+    messages = await backend.build_messages(db_session, novel_state, "Маша")
+    assert [m["content"] for m in messages[1:]] == ["Добро пожаловать! Как тебя зовут?", "Маша"]
+
+@pytest.mark.asyncio
+async def test_run_window_covers_messages_after_summary(db_session):
+    """Test the Assistants run keeps every message not yet summarized, not just keep_messages"""
+    novel_state = NovelState(user_id=557004, thread_id="thread_1", player_name="Аня", summary="Аня познакомилась с Катей.")
+    db_session.add(novel_state)
+    await db_session.commit()
+    messages = [
+        NovelMessage(novel_state_id=novel_state.id, content=f"Сообщение {i}", is_user=i % 2 == 1)
+        for i in range(20)
+    ]
+    db_session.add_all(messages)
+    await db_session.commit()
+    novel_state.summarized_until_id = messages[5].id
+    await db_session.commit()
+
+    client = MagicMock()
+    client.beta.threads.runs.create = AsyncMock()
+    with patch("services.backends.assistants.openai_client", client):
+        await AssistantsBackend().create_run(db_session, novel_state, "Дальше")
+    params = client.beta.threads.runs.create.call_args.kwargs
+    # 14 сообщений после краткого содержания и новое сообщение игрока
+    assert params["truncation_strategy"] == {"type": "last_messages", "last_messages": 15}
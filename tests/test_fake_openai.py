@@ -0,0 +1,107 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+from openai import AsyncOpenAI
+
+from models.novel import NovelState
+from services.backends import AssistantsBackend, ChatCompletionsBackend
+from utils.fake_openai import END_STORY_TRIGGER, FakeOpenAIConfig, FakeOpenAIServer
+from utils.openai_resilience import openai_resilience
+
+@pytest.fixture
+async def fake_api():
+    server = FakeOpenAIServer(FakeOpenAIConfig(
+        latency=0.05,
+        queue_latency=0.01,
+        replies=["Добро пожаловать в историю"],
+        image_url="https://drive.google.com/uc?id=abc123",
+        seed=1
+    ))
+    async with server:
+        client = AsyncOpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+        yield server, client
+        await client.close()
+
+@pytest.mark.asyncio
+async def test_polled_run_produces_scripted_reply(fake_api):
+    """Test a polled run completes with the scripted reply and image marker"""
+    server, client = fake_api
+    thread = await client.beta.threads.create(messages=[{"role": "user", "content": "Начни"}])
+    run = await client.beta.threads.runs.create(thread_id=thread.id, assistant_id="asst_1")
+    assert run.status == "queued"
+
+    while run.status not in ("completed", "failed"):
+        await asyncio.sleep(0.02)
+        run = await client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
+
+    messages = await client.beta.threads.messages.list(thread_id=thread.id, run_id=run.id, limit=1)
+    text = messages.data[0].content[0].text.value
+    assert run.status == "completed"
+    assert run.usage.completion_tokens > 0
+    assert text.startswith("Добро пожаловать в историю")
+    assert "[AI отправляет фото: ![сцена](https://drive.google.com/uc?id=abc123)]" in text
+
+@pytest.mark.asyncio
+async def test_assistants_backend_streams_against_fake_api(fake_api, db_session):
+    """Test the Assistants backend streams text and end_story calls from the fake API"""
+    server, client = fake_api
+    thread = await client.beta.threads.create()
+    novel_state = NovelState(user_id=557001, thread_id=thread.id)
+    chunks = []
+
+    async def on_delta(text):
+        chunks.append(text)
+
+    backend = AssistantsBackend()
+    with patch("services.backends.assistants.openai_client", client), \
+            patch("services.backends.assistants.bot_config.assistant_id", "asst_1"):
+        result = await backend.generate(db_session, novel_state, "Привет", on_delta=on_delta)
+        ended = await backend.generate(db_session, novel_state, END_STORY_TRIGGER, on_delta=on_delta)
+
+    assert len(chunks) > 1
+    assert "".join(chunks) == result.text
+    assert result.text.startswith("Добро пожаловать")
+    assert ended.tool_calls[0].function.name == "end_story"
+
+@pytest.mark.asyncio
+async def test_chat_backend_against_fake_api(fake_api, db_session):
+    """Test the Chat Completions backend gets a streamed reply with usage"""
+    server, client = fake_api
+    novel_state = NovelState(user_id=557002, thread_id="chat_1")
+    backend = ChatCompletionsBackend(model="gpt-4o-mini")
+    backend._instructions = "Сценарий"
+
+    with patch("services.backends.chat.openai_client", client):
+        result = await backend.generate(db_session, novel_state, "Привет")
+
+    assert result.text.startswith("Добро пожаловать в историю")
+    assert not result.tool_calls
+
+@pytest.mark.asyncio
+async def test_failed_streamed_run_is_retried(fake_api, db_session):
+    """Test a streamed run failing with server_error is retried like a polled one"""
+    server, client = fake_api
+    server.config.failure_rate = 1.0
+    thread = await client.beta.threads.create()
+    novel_state = NovelState(user_id=557002, thread_id=thread.id)
+    chunks = []
+
+    async def on_delta(text):
+        chunks.append(text)
+
+    def backoff(attempt, error=None):
+        # Следующий ран уже завершится успешно
+        server.config.failure_rate = 0.0
+        return 0.0
+
+    backend = AssistantsBackend()
+    with patch("services.backends.assistants.openai_client", client), \
+            patch("services.backends.assistants.bot_config.assistant_id", "asst_1"), \
+            patch.object(openai_resilience, "backoff", side_effect=backoff):
+        result = await backend.generate(db_session, novel_state, "Привет", on_delta=on_delta)
+
+    assert result.text.startswith("Добро пожаловать")
+    assert "".join(chunks) == result.text
+    # Сообщение игрока добавлено в тред один раз
+    user_messages = [item for item in server.messages[thread.id] if item["role"] == "user"]
+    assert len(user_messages) == 1
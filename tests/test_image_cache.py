@@ -0,0 +1,74 @@
+import pytest
+from unittest.mock import patch
+
+from utils.image_cache import ImageCache
+
+@pytest.mark.asyncio
+async def test_hot_images_are_served_from_memory(tmp_path):
+    """Test repeated reads skip the disk and a memory miss is filled from disk"""
+    cache = ImageCache(str(tmp_path / "images"), memory_limit=1024)
+    await cache.put("katya", b"k" * 100)
+
+    with patch("utils.image_cache.aiofiles.open") as open_file:
+        assert await cache.get("katya") == b"k" * 100
+    open_file.assert_not_called()
+
+    # Новый процесс: память пуста, первое чтение идёт с диска
+    restarted = ImageCache(str(tmp_path / "images"), memory_limit=1024)
+    assert await restarted.get("katya") == b"k" * 100
+    assert await restarted.get("katya") == b"k" * 100
+    assert await restarted.get("misha") is None
+
+    stats = restarted.get_stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 1)
+
+@pytest.mark.asyncio
+async def test_memory_tier_evicts_least_recently_used(tmp_path):
+    """Test the byte budget evicts the least recently requested image"""
+    cache = ImageCache(str(tmp_path / "images"), memory_limit=250)
+    await cache.put("a", b"a" * 100)
+    await cache.put("b", b"b" * 100)
+    await cache.get("a")
+    await cache.put("c", b"c" * 100)
+
+    assert list(cache._memory) == ["a", "c"]
+    stats = cache.get_stats()
+    assert stats["memory_bytes"] == 200
+    assert stats["evictions"] == 1
+    # Вытесненное изображение остаётся на диске
+    assert await cache.get("b") == b"b" * 100
+
+@pytest.mark.asyncio
+async def test_disk_tier_is_capped_and_expires_unused_files(tmp_path):
+    """Test eviction removes expired files and then the least recently used over the cap"""
+    cache = ImageCache(str(tmp_path / "images"), memory_limit=0, max_bytes=250, ttl=3600)
+    for image_id in ["a", "b", "c", "old"]:
+        await cache.put(image_id, image_id.encode() * 100)
+    cache._index["old"]["accessed"] -= 7200
+    cache._index["a"]["accessed"] -= 60
+    await cache.get("b")
+
+    assert await cache.evict() == 2
+    assert sorted(cache._index) == ["b", "c"]
+    assert not cache._get_cache_path("a").exists()
+    stats = cache.get_stats()
+    assert stats["disk_bytes"] == 200
+    assert (stats["expired"], stats["disk_evictions"]) == (1, 1)
+
+    # Индекс переживает перезапуск, промах не обращается к диску
+    restarted = ImageCache(str(tmp_path / "images"), memory_limit=0)
+    assert sorted(restarted._index) == ["b", "c"]
+    with patch("utils.image_cache.aiofiles.open") as open_file:
+        assert await restarted.get("a") is None
+    open_file.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_interrupted_write_is_not_a_hit(tmp_path):
+    """Test a write that fails midway leaves neither a cache file nor an index entry"""
+    cache = ImageCache(str(tmp_path / "images"), memory_limit=0)
+    with patch("utils.image_cache.aiofiles.os.replace", side_effect=OSError("disk full")):
+        assert await cache.put("katya", b"k" * 100) is False
+
+    assert not cache._get_cache_path("katya").exists()
+    assert list(cache.tmp_dir.iterdir()) == []
+    assert await cache.get("katya") is None
@@ -0,0 +1,103 @@
+import asyncio
+import pytest
+from aiohttp import web
+from unittest.mock import patch
+
+from utils.image_download import ImageDownloader
+
+PNG = b"\x89PNG\r\n\x1a\n"
+
+class MemoryCache:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, image_id):
+        return self.data.get(image_id)
+
+    async def put(self, image_id, data):
+        self.data[image_id] = data
+        return True
+
+@pytest.fixture
+async def drive():
+    """Локальная замена Google Drive, считающая запросы"""
+    requests = []
+
+    async def handle(request):
+        image_id = request.query["id"]
+        requests.append(image_id)
+        await asyncio.sleep(0.05)
+        if image_id == "missing":
+            return web.Response(status=404)
+        if image_id == "private":
+            # Страница входа Google вместо файла
+            return web.Response(text="<html>Sign in</html>", content_type="text/html")
+        return web.Response(body=PNG + image_id.encode(), content_type="image/png")
+
+    app = web.Application()
+    app.router.add_get("/uc", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    with patch("utils.image_download.DRIVE_DOWNLOAD_URL", f"http://127.0.0.1:{port}/uc?id={{image_id}}"):
+        yield requests
+    await runner.cleanup()
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_download(drive):
+    """Test concurrent requests for the same image wait on a single download"""
+    cache = MemoryCache()
+    downloader = ImageDownloader(cache)
+    try:
+        results = await asyncio.gather(*(downloader.fetch("katya") for _ in range(20)))
+        assert set(results) == {PNG + b"katya"}
+        assert drive == ["katya"]
+
+        # Следующее обращение берёт изображение из кэша
+        assert await downloader.fetch("katya") == PNG + b"katya"
+        session = downloader._session
+        await downloader.fetch("misha")
+        assert downloader._session is session
+    finally:
+        await downloader.close()
+
+    stats = downloader.get_stats()
+    assert stats["downloads"] == 2
+    assert stats["coalesced"] == 19
+    assert stats["cache_hits"] == 1
+    assert stats["in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_failed_download_is_shared_and_not_cached(drive):
+    """Test a failed download fails all waiters and is retried on the next miss"""
+    cache = MemoryCache()
+    downloader = ImageDownloader(cache)
+    try:
+        results = await asyncio.gather(
+            *(downloader.fetch("missing") for _ in range(3)), return_exceptions=True
+        )
+        assert all("404" in str(result) for result in results)
+        with pytest.raises(Exception):
+            await downloader.fetch("missing")
+    finally:
+        await downloader.close()
+
+    assert drive == ["missing", "missing"]
+    assert "missing" not in cache.data
+    assert downloader.get_stats()["failures"] == 2
+
+@pytest.mark.asyncio
+async def test_html_page_is_not_cached_as_image(drive):
+    """Test a Drive HTML page answered with 200 fails the download instead of being cached"""
+    cache = MemoryCache()
+    downloader = ImageDownloader(cache)
+    try:
+        with pytest.raises(Exception, match="Not an image: text/html"):
+            await downloader.fetch("private")
+    finally:
+        await downloader.close()
+
+    assert "private" not in cache.data
+    assert downloader.get_stats()["failures"] == 1
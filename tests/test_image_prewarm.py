@@ -0,0 +1,115 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from services.image_prewarm import ImagePrewarmer, _run_cli, scenario_image_ids
+
+SCENARIO = """
+СЦЕНА 1: Знакомство
+[AI отправляет фото: ![Катя](https://drive.google.com/file/d/katya/view?usp=sharing)]
+СЦЕНА 2: Прогулка
+![Миша](https://drive.google.com/file/d/misha/view?usp=drive_link)
+[AI отправляет фото: https://drive.google.com/file/d/park/view?usp=sharing]
+Катя снова здесь: ![Катя](https://drive.google.com/file/d/katya/view?usp=sharing)
+[AI отправляет фото: https://drive.google.com/file/d/broken/view?usp=sharing]
+"""
+
+JPEG = b"\xff\xd8\xff\xe0image"
+
+def test_scenario_image_ids_are_unique_and_ordered():
+    assert scenario_image_ids(SCENARIO) == ["katya", "misha", "park", "broken"]
+
+@pytest.mark.asyncio
+async def test_prewarm_downloads_with_bounded_concurrency(tmp_path):
+    """Test images are downloaded at most `concurrency` at a time and failures are reported"""
+    scenario = tmp_path / "scenario.txt"
+    scenario.write_text(SCENARIO, encoding="utf-8")
+
+    running = 0
+    peak = 0
+
+    async def download(image_id):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if image_id == "broken":
+            raise Exception("Failed to download image: 404")
+        return JPEG
+
+    cache = MagicMock()
+    cache.get = AsyncMock(side_effect=lambda image_id: JPEG if image_id == "katya" else None)
+    with patch("services.image_prewarm.download_image", AsyncMock(side_effect=download)), \
+            patch("services.image_prewarm.image_cache", cache):
+        report = await ImagePrewarmer(concurrency=2).run(scenario_path=str(scenario))
+
+    assert peak == 2
+    assert report.total == 4
+    assert report.cached == 1 and report.downloaded == 2
+    assert report.failed == {"broken": "Failed to download image: 404"}
+    assert "broken" in report.format()
+
+@pytest.mark.asyncio
+async def test_prewarm_uploads_images_without_file_id(tmp_path):
+    """Test each image lacking a file_id is uploaded to the storage chat once"""
+    scenario = tmp_path / "scenario.txt"
+    scenario.write_text(SCENARIO, encoding="utf-8")
+
+    files = MagicMock()
+    files.contains = AsyncMock(side_effect=lambda image_id: image_id == "misha")
+    files.remember = AsyncMock()
+    bot = MagicMock()
+    bot.send_photo = AsyncMock(side_effect=lambda chat_id, photo, **kwargs: SimpleNamespace(
+        photo=[SimpleNamespace(file_id=f"file_{photo.filename}")]
+    ))
+    cache = MagicMock()
+    cache.get = AsyncMock(return_value=JPEG)
+    with patch("services.image_prewarm.image_cache", cache), \
+            patch("services.image_prewarm.telegram_files", files):
+        report = await ImagePrewarmer(storage_chat_id=-100).run(bot, scenario_path=str(scenario))
+
+    assert report.uploaded == 3
+    assert {call.args[0] for call in bot.send_photo.call_args_list} == {-100}
+    files.remember.assert_any_await("katya", "file_katya.jpg")
+
+@pytest.mark.asyncio
+async def test_cli_saves_cache_index_and_closes_downloader(tmp_path):
+    """Test the CLI run persists the image cache index and closes the download session before exiting"""
+    scenario = tmp_path / "scenario.txt"
+    scenario.write_text(SCENARIO, encoding="utf-8")
+    args = SimpleNamespace(scenario=str(scenario), concurrency=2, upload=False)
+
+    cache = MagicMock()
+    cache.get = AsyncMock(return_value=JPEG)
+    cache.save_index = AsyncMock()
+    downloader = MagicMock()
+    downloader.close = AsyncMock()
+    with patch("services.image_prewarm.image_cache", cache), \
+            patch("services.image_prewarm.image_downloader", downloader), \
+            patch("services.image_prewarm.create_db", AsyncMock()):
+        assert await _run_cli(args) == 0
+
+    cache.save_index.assert_awaited_once()
+    downloader.close.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_cached_page_is_downloaded_again_and_reported(tmp_path):
+    """Test a cached non-image is not counted as cached and a bad download is reported as broken"""
+    scenario = tmp_path / "scenario.txt"
+    scenario.write_text(SCENARIO, encoding="utf-8")
+
+    async def download(image_id):
+        if image_id == "park":
+            raise Exception("Not an image: text/html")
+        return JPEG
+
+    cache = MagicMock()
+    cache.get = AsyncMock(side_effect=lambda image_id: b"<html>Sign in</html>" if image_id == "park" else JPEG)
+    with patch("services.image_prewarm.download_image", AsyncMock(side_effect=download)), \
+            patch("services.image_prewarm.image_cache", cache):
+        report = await ImagePrewarmer().run(scenario_path=str(scenario))
+
+    assert report.cached == 3
+    assert report.failed == {"park": "Not an image: text/html"}
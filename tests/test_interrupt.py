@@ -0,0 +1,40 @@
+import datetime
+import pytest
+from unittest.mock import AsyncMock, patch
+from aiogram.types import Chat, Message, Update, User
+
+from filters.is_admin import IsAdminFilter
+from middlewares.interrupt import TurnInterruptMiddleware
+
+def make_update(text: str, user_id: int) -> Update:
+    message = Message(
+        message_id=1,
+        date=datetime.datetime.now(),
+        chat=Chat(id=user_id, type="private"),
+        from_user=User(id=user_id, is_bot=False, first_name="Test"),
+        text=text
+    )
+    return Update(update_id=1, message=message)
+
+@pytest.mark.asyncio
+async def test_admin_command_interrupts_only_for_admins():
+    """Test an admin-only command does not cancel the turn of a regular user"""
+    on_interrupt = AsyncMock(return_value=True)
+    middleware = TurnInterruptMiddleware(
+        texts={"🔄 Рестарт": None, "/end_novel": IsAdminFilter(is_admin=True)},
+        on_interrupt=on_interrupt
+    )
+    handler = AsyncMock()
+
+    with patch("filters.is_admin.bot_config.owners", [1]):
+        await middleware(handler, make_update("/end_novel", 2), {})
+        on_interrupt.assert_not_awaited()
+
+        await middleware(handler, make_update("/end_novel@test_bot", 1), {})
+        on_interrupt.assert_awaited_once_with(1)
+
+        await middleware(handler, make_update("🔄 Рестарт", 2), {})
+        on_interrupt.assert_awaited_with(2)
+
+    # Сама команда обрабатывается в любом случае
+    assert handler.await_count == 3
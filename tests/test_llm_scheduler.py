@@ -0,0 +1,80 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+
+from models.novel import NovelState
+from services.llm_scheduler import LLMQueueFullError, LLMScheduler, Priority
+from utils.openai_transport import RateLimitState, parse_reset_duration
+
+def test_parse_reset_duration():
+    """Test x-ratelimit-reset-* values are converted to seconds"""
+    assert parse_reset_duration("1s") == 1
+    assert parse_reset_duration("6m0s") == 360
+    assert parse_reset_duration("20ms") == pytest.approx(0.02)
+    assert parse_reset_duration("") is None
+
+def test_priority_order():
+    """Test owners go first, then paying and then active players"""
+    scheduler = LLMScheduler(RateLimitState())
+    with patch("services.llm_scheduler.bot_config") as config:
+        config.owners = [1]
+        assert scheduler.priority_for(1) == Priority.OWNER
+        scheduler.mark_paid(2)
+        assert scheduler.priority_for(2) == Priority.PAID
+        assert scheduler.priority_for(3, NovelState(user_id=3, player_name="Аня")) == Priority.ACTIVE
+        assert scheduler.priority_for(4, NovelState(user_id=4)) == Priority.DEFAULT
+
+@pytest.mark.asyncio
+async def test_waiting_turns_are_granted_by_priority():
+    """Test a freed slot goes to the highest priority waiter"""
+    scheduler = LLMScheduler(RateLimitState(), max_concurrent=1)
+    await scheduler.acquire(1, Priority.DEFAULT)
+
+    order = []
+
+    async def wait_turn(user_id, priority):
+        async with scheduler.turn(user_id, priority):
+            order.append(user_id)
+
+    tasks = [
+        asyncio.create_task(wait_turn(2, Priority.DEFAULT)),
+        asyncio.create_task(wait_turn(3, Priority.PAID))
+    ]
+    await asyncio.sleep(0)
+    assert scheduler.queue_position(3) == 1
+    assert scheduler.queue_position(2) == 2
+
+    scheduler.release()
+    await asyncio.gather(*tasks)
+    assert order == [3, 2]
+    assert scheduler.get_stats()["running"] == 0
+
+@pytest.mark.asyncio
+async def test_turn_waits_for_rate_limit_reset():
+    """Test a turn waits for the token budget reported in response headers"""
+    limits = RateLimitState()
+    limits.update({
+        "x-ratelimit-remaining-requests": "100",
+        "x-ratelimit-remaining-tokens": "1000",
+        "x-ratelimit-reset-tokens": "200ms"
+    })
+    scheduler = LLMScheduler(limits, turn_tokens=4000)
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await asyncio.wait_for(scheduler.acquire(1, Priority.DEFAULT), timeout=0.25)
+    # Сработал повтор после сброса лимита, а не сразу
+    assert loop.time() - started >= 0.15
+    scheduler.release()
+
+@pytest.mark.asyncio
+async def test_turn_is_rejected_when_wait_is_too_long():
+    """Test a turn is rejected early instead of waiting past max_wait"""
+    limits = RateLimitState()
+    limits.update({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "5m0s"})
+    scheduler = LLMScheduler(limits, max_wait=60)
+
+    with pytest.raises(LLMQueueFullError) as error:
+        await scheduler.acquire(1, Priority.DEFAULT)
+    assert error.value.estimated_wait > 60
+    assert scheduler.get_stats()["rejected"] == 1
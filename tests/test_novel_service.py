@@ -0,0 +1,163 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from sqlalchemy import select
+
+from models.novel import NovelRun, NovelState
+from services.backends import AssistantsBackend, FakeBackend
+from services.novel import NovelService
+from services.run_poller import RunPoller
+
+def make_message(text: str, user_id: int):
+    message = MagicMock()
+    message.text = text
+    message.chat.id = user_id
+    message.from_user.id = user_id
+    message.answer = AsyncMock()
+    return message
+
+def make_openai_client(reply: str):
+    client = MagicMock()
+    client.beta.threads.runs.create = AsyncMock(return_value=SimpleNamespace(id="run_1", status="queued"))
+    client.beta.threads.messages.list = AsyncMock(return_value=SimpleNamespace(data=[
+        SimpleNamespace(content=[SimpleNamespace(text=SimpleNamespace(value=reply))])
+    ]))
+    return client
+
+def make_poller():
+    """Run poller mock returning a completed run with usage"""
+    run = SimpleNamespace(
+        id="run_1",
+        thread_id="thread_1",
+        status="completed",
+        created_at=1000,
+        started_at=1002,
+        usage=SimpleNamespace(prompt_tokens=1200, completion_tokens=300)
+    )
+    poller = MagicMock()
+    poller.wait_tracked = AsyncMock(return_value=(run, SimpleNamespace(polls=4, time_to_first_change=0.6)))
+    return poller
+
+@pytest.mark.asyncio
+async def test_turn_uses_run_with_additional_messages(db_session):
+    """Test a regular turn folds the user message into the run and reads only its output"""
+    novel_state = NovelState(user_id=555001, thread_id="thread_1", player_name="Аня")
+    db_session.add(novel_state)
+    await db_session.commit()
+
+    client = make_openai_client("Ответ ассистента")
+    poller = make_poller()
+
+    with patch("services.backends.assistants.openai_client", client), \
+            patch("services.backends.assistants.run_poller", poller), \
+            patch("services.novel.send_assistant_response", AsyncMock()) as send_response, \
+            patch("services.novel.context_compactor.schedule"), \
+            patch("services.novel.bot_config.stream_responses", False):
+        await NovelService(db_session).process_message(make_message("Привет", 555001), novel_state)
+
+    create_kwargs = client.beta.threads.runs.create.call_args.kwargs
+    assert create_kwargs["additional_messages"] == [{"role": "user", "content": "Привет"}]
+    client.beta.threads.retrieve.assert_not_called()
+    client.beta.threads.messages.create.assert_not_called()
+    list_kwargs = client.beta.threads.messages.list.call_args.kwargs
+    assert list_kwargs["run_id"] == "run_1"
+    assert list_kwargs["limit"] == 1
+    send_response.assert_awaited_once()
+
+    recorded = await db_session.scalar(select(NovelRun).where(NovelRun.user_id == 555001))
+    assert recorded.polls == 4
+    assert recorded.queue_time == 2
+    assert recorded.prompt_tokens == 1200
+
+@pytest.mark.asyncio
+async def test_first_answer_is_stored_as_player_name(db_session):
+    """Test onboarding progress is tracked on NovelState instead of counting thread messages"""
+    novel_state = NovelState(user_id=555002, thread_id="thread_2")
+    db_session.add(novel_state)
+    await db_session.commit()
+
+    client = make_openai_client("Знакомьтесь с персонажами")
+    poller = make_poller()
+
+    with patch("services.backends.assistants.openai_client", client), \
+            patch("services.backends.assistants.run_poller", poller), \
+            patch("services.novel.send_assistant_response", AsyncMock()), \
+            patch("services.novel.outbound.send", AsyncMock()), \
+            patch("services.novel.context_compactor.schedule"), \
+            patch("services.novel.bot_config.stream_responses", False):
+        await NovelService(db_session).process_message(make_message("Маша", 555002), novel_state)
+
+    assert novel_state.player_name == "Маша"
+    content = client.beta.threads.runs.create.call_args.kwargs["additional_messages"][0]["content"]
+    assert "Маша" in content
+
+@pytest.mark.asyncio
+async def test_restart_cancels_active_run(db_session):
+    """Test cancelling a turn stops the run and wakes the waiting turn at once"""
+    novel_state = NovelState(user_id=555003, thread_id="thread_3", player_name="Аня")
+    db_session.add(novel_state)
+    await db_session.commit()
+
+    client = make_openai_client("Ответ ассистента")
+    client.beta.threads.runs.create = AsyncMock(return_value=SimpleNamespace(id="run_3", status="queued"))
+    client.beta.threads.runs.cancel = AsyncMock()
+    backend = AssistantsBackend()
+    # Опрос не успеет начаться: будить ожидающего должна отмена
+    poller = RunPoller(initial_interval=60)
+
+    with patch("services.backends.assistants.openai_client", client), \
+            patch("services.backends.assistants.run_poller", poller), \
+            patch("services.novel.outbound.send", AsyncMock()) as send, \
+            patch("services.novel.bot_config.stream_responses", False):
+        turn = asyncio.create_task(
+            NovelService(db_session, backend=backend).process_message(make_message("Привет", 555003), novel_state)
+        )
+        while backend.get_stats()["active_runs"] == 0 or not backend._active[555003].run_id:
+            await asyncio.sleep(0.01)
+
+        assert await backend.cancel_turn(555003)
+        await asyncio.wait_for(turn, timeout=1)
+
+    client.beta.threads.runs.cancel.assert_awaited_once()
+    assert client.beta.threads.runs.cancel.call_args.kwargs["run_id"] == "run_3"
+    send.assert_not_called()
+    assert backend.get_stats()["cancelled_runs"] == 1
+    assert not await backend.cancel_turn(555003)
+
+    recorded = await db_session.scalar(select(NovelRun).where(NovelRun.user_id == 555003))
+    assert recorded.status == "cancelled"
+
+@pytest.mark.asyncio
+async def test_paid_restart_asks_for_name_again(db_session):
+    """Test a restart after payment starts onboarding over on the reused state"""
+    backend = FakeBackend(latency=0)
+    opening = MagicMock()
+    opening.get = AsyncMock(return_value=None)
+    opening.get_characters = AsyncMock(return_value=None)
+
+    with patch("services.novel.opening_cache", opening), \
+            patch("services.novel.send_assistant_response", AsyncMock()), \
+            patch("services.novel.outbound.send", AsyncMock()) as send, \
+            patch("services.novel.context_compactor.schedule"), \
+            patch("services.novel.bot_config.stream_responses", False):
+        service = NovelService(db_session, backend=backend)
+        novel_state = await service.create_novel_state(555004)
+        await service.process_message(make_message("Аня", 555004), novel_state)
+        first_thread = novel_state.thread_id
+        await service.end_story(novel_state, make_message("", 555004), silent=True)
+
+        # Оплата рестарта
+        novel_state.needs_payment = False
+        await db_session.commit()
+        await service.start_new_story(novel_state)
+        assert novel_state.player_name is None
+        assert novel_state.thread_id != first_thread
+        assert not novel_state.is_completed
+
+        send.reset_mock()
+        await service.process_message(make_message("Маша", 555004), novel_state)
+
+    assert novel_state.player_name == "Маша"
+    assert send.call_args_list[0].args[1].args[0] == "Создаю персонажей..."
@@ -0,0 +1,94 @@
+import asyncio
+import httpx
+import pytest
+from unittest.mock import AsyncMock, patch
+from openai import InternalServerError, NotFoundError, RateLimitError
+
+from utils.openai_resilience import (
+    CircuitBreaker,
+    ErrorKind,
+    OpenAIResilience,
+    OpenAIUnavailableError,
+    classify_error,
+    get_retry_after
+)
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/threads/runs")
+
+def status_error(cls, status: int, headers: dict = None, body: dict = None):
+    response = httpx.Response(status, headers=headers or {}, request=REQUEST)
+    return cls("error", response=response, body=body)
+
+def make_resilience(threshold: int = 5) -> OpenAIResilience:
+    return OpenAIResilience(CircuitBreaker(failure_threshold=threshold, recovery_timeout=60), base_delay=0.01)
+
+def test_errors_are_classified():
+    assert classify_error(status_error(RateLimitError, 429)) == ErrorKind.RATE_LIMIT
+    assert classify_error(status_error(RateLimitError, 429, body={"code": "insufficient_quota"})) == ErrorKind.QUOTA
+    assert classify_error(status_error(InternalServerError, 503)) == ErrorKind.SERVER
+    assert classify_error(status_error(NotFoundError, 404)) == ErrorKind.NOT_FOUND
+    assert get_retry_after(status_error(RateLimitError, 429, {"retry-after-ms": "1500"})) == 1.5
+
+@pytest.mark.asyncio
+async def test_rate_limit_retried_after_header_delay():
+    """Test a 429 is retried after the Retry-After pause"""
+    resilience = make_resilience()
+    fn = AsyncMock(side_effect=[status_error(RateLimitError, 429, {"retry-after": "2"}), "ok"])
+
+    with patch("utils.openai_resilience.asyncio.sleep", AsyncMock()) as sleep:
+        assert await resilience.call(fn, timeout=1) == "ok"
+
+    sleep.assert_awaited_once_with(2.0)
+    assert resilience.get_stats()["retries"] == 1
+
+@pytest.mark.asyncio
+async def test_not_found_is_not_retried():
+    resilience = make_resilience()
+    fn = AsyncMock(side_effect=status_error(NotFoundError, 404))
+
+    with pytest.raises(NotFoundError):
+        await resilience.call(fn)
+    assert fn.await_count == 1
+    assert resilience.breaker.state == CircuitBreaker.CLOSED
+
+@pytest.mark.asyncio
+async def test_breaker_opens_and_rejects_fast():
+    """Test repeated 5xx errors open the breaker and further calls fail without a request"""
+    resilience = make_resilience(threshold=2)
+    fn = AsyncMock(side_effect=status_error(InternalServerError, 500))
+
+    with patch("utils.openai_resilience.asyncio.sleep", AsyncMock()):
+        with pytest.raises(OpenAIUnavailableError):
+            await resilience.call(fn)
+    assert fn.await_count == 2
+
+    with pytest.raises(OpenAIUnavailableError):
+        await resilience.call(fn)
+    assert fn.await_count == 2
+
+    stats = resilience.get_stats()
+    assert stats["breaker_state"] == "open"
+    assert stats["breaker_rejected"] == 2
+    assert stats["errors_server"] == 2
+
+@pytest.mark.asyncio
+async def test_cancelled_probe_releases_breaker():
+    """Test a probe cancelled mid-request lets the next call probe again instead of blocking forever"""
+    resilience = make_resilience(threshold=1)
+    resilience.breaker.record_failure()
+    resilience.breaker._opened_at -= 60
+    started = asyncio.Event()
+
+    async def hang(**kwargs):
+        started.set()
+        await asyncio.sleep(10)
+
+    probe = asyncio.create_task(resilience.call(hang))
+    await started.wait()
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+
+    assert resilience.breaker.state == CircuitBreaker.HALF_OPEN
+    assert await resilience.call(AsyncMock(return_value="ok")) == "ok"
+    assert resilience.breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,39 @@
+import httpx
+import pytest
+from aiohttp import web
+
+from utils.openai_transport import TransportMetrics, op_timeout
+
+@pytest.fixture
+async def server_url():
+    async def handler(request):
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app.router.add_get("/", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/"
+    await runner.cleanup()
+
+@pytest.mark.asyncio
+async def test_keepalive_connections_are_reused(server_url):
+    """Test sequential requests reuse one pooled connection and are counted"""
+    metrics = TransportMetrics()
+    async with httpx.AsyncClient(event_hooks={"request": [metrics.on_request]}) as client:
+        for _ in range(3):
+            response = await client.get(server_url)
+            assert response.status_code == 200
+
+    stats = metrics.get_stats()
+    assert stats["requests"] == 3
+    assert stats["new_connections"] == 1
+    assert stats["reuse_ratio"] == pytest.approx(2 / 3)
+
+def test_operation_timeouts_differ():
+    assert op_timeout("stream").read > op_timeout("retrieve").read
+    with pytest.raises(KeyError):
+        op_timeout("unknown")
@@ -0,0 +1,180 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from models.novel import OpeningTranscript, SpareThread
+from services.backends import FakeBackend
+from services.novel import NovelService
+from services.opening import OPENING_PROMPT, PLAYER_NAME_PLACEHOLDER, OpeningCache
+from services.thread_pool import ThreadPool
+
+@pytest.fixture(autouse=True)
+def no_image_downloads():
+    with patch("services.opening.download_image", AsyncMock()) as download:
+        yield download
+
+@pytest.fixture
+async def session_maker(engine):
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_maker() as session:
+        await session.execute(delete(OpeningTranscript))
+        await session.execute(delete(SpareThread))
+        await session.commit()
+    return session_maker
+
+@pytest.mark.asyncio
+async def test_opening_is_generated_once_per_version(session_maker):
+    """Test the opening is generated once and regenerated when the scenario changes"""
+    backend = FakeBackend()
+    with patch("services.opening.load_story_instructions", return_value="Сценарий v1"):
+        cache = OpeningCache(session_maker)
+        first = await cache.warm(backend)
+        assert await cache.warm(backend) == first
+        # Новый процесс берёт вступление из базы
+        assert await OpeningCache(session_maker).get(backend) == first
+
+    assert first.text == f"Ответ на: {OPENING_PROMPT}"
+    assert backend.turns == 2  # Вступление и шаблон знакомства с персонажами
+
+    with patch("services.opening.load_story_instructions", return_value="Сценарий v2"):
+        cache = OpeningCache(session_maker)
+        assert await cache.get(backend) is None
+        second = await cache.warm(backend)
+
+    assert second.version != first.version
+    assert backend.turns == 4
+    async with session_maker() as session:
+        versions = (await session.scalars(
+            select(OpeningTranscript.version).where(OpeningTranscript.kind == "opening")
+        )).all()
+    assert versions == [second.version]
+
+@pytest.mark.asyncio
+async def test_pool_threads_are_seeded_with_opening(session_maker):
+    """Test pooled threads are created holding the opening transcript"""
+    with patch("services.opening.load_story_instructions", return_value="Сценарий"):
+        opening = await OpeningCache(session_maker).warm(FakeBackend())
+
+    counter = iter(range(1000))
+    client = AsyncMock()
+    client.beta.threads.create = AsyncMock(
+        side_effect=lambda **kwargs: SimpleNamespace(id=f"thread_{next(counter)}")
+    )
+    pool = ThreadPool(session_maker, size=2)
+    pool.set_opening(opening)
+    with patch("services.thread_pool.openai_client", client), \
+            patch("services.thread_pool.thread_deletion_queue") as queue:
+        queue.enqueue = AsyncMock()
+        await pool.fill()
+        assert client.beta.threads.create.call_args.kwargs["messages"] == opening.messages
+
+        assert await pool.acquire(opening) == "thread_0"
+        assert pool.get_stats()["hits"] == 1
+
+        # Смена вступления делает засеянные треды устаревшими
+        pool.set_opening(None)
+        assert await pool.prune() == 1
+
+    queue.enqueue.assert_awaited_once_with(["thread_1"])
+
+@pytest.mark.asyncio
+async def test_novel_start_sends_cached_opening_without_run(db_session, session_maker):
+    """Test a new novel gets the cached opening instantly instead of a run"""
+    backend = FakeBackend()
+    with patch("services.opening.load_story_instructions", return_value="Сценарий"):
+        cache = OpeningCache(session_maker)
+        opening = await cache.warm(backend)
+
+        service = NovelService(db_session, backend=backend)
+        message = MagicMock()
+        message.chat.id = 556101
+        message.from_user.id = 556101
+        with patch("services.novel.opening_cache", cache), \
+                patch("services.novel.send_assistant_response", AsyncMock()) as send_response:
+            novel_state = await service.create_novel_state(556101)
+            await service.process_message(message, novel_state, initial_message=True)
+
+    assert backend.turns == 2  # Только генерация кэша
+    assert send_response.call_args.kwargs["assistant_message"] == opening.text
+    assert await service.get_last_assistant_message(novel_state) == opening.text
+
+@pytest.mark.asyncio
+async def test_character_intro_is_rendered_from_template(db_session, session_maker, no_image_downloads):
+    """Test the name turn renders the cached intro template instead of a run"""
+    backend = FakeBackend()
+    with patch("services.opening.load_story_instructions", return_value="Сценарий"):
+        cache = OpeningCache(session_maker)
+        await cache.warm(backend)
+        intro = await cache.get_characters(backend)
+
+        service = NovelService(db_session, backend=backend)
+        message = MagicMock()
+        message.text = "Аня"
+        message.chat.id = 556102
+        message.from_user.id = 556102
+        with patch("services.novel.opening_cache", cache), \
+                patch("services.novel.send_assistant_response", AsyncMock()) as send_response, \
+                patch.object(backend, "append_turn", AsyncMock()) as append_turn:
+            novel_state = await service.create_novel_state(556102)
+            await service.process_message(message, novel_state)
+
+    assert intro.personalized
+    assert no_image_downloads.await_count == len(intro.image_ids)
+    assert backend.turns == 2
+    rendered = send_response.call_args.kwargs["assistant_message"]
+    assert PLAYER_NAME_PLACEHOLDER not in rendered and "Аня" in rendered
+    append_turn.assert_awaited_once_with(novel_state, "Аня", rendered)
+    assert novel_state.player_name == "Аня"
+
+@pytest.mark.asyncio
+async def test_restart_seeds_new_conversation_with_opening(db_session, session_maker):
+    """Test a restart on an existing state opens a new seeded conversation before sending the opening"""
+    backend = FakeBackend()
+    with patch("services.opening.load_story_instructions", return_value="Сценарий"):
+        cache = OpeningCache(session_maker)
+        opening = await cache.warm(backend)
+
+        service = NovelService(db_session, backend=backend)
+        message = MagicMock()
+        message.chat.id = 556103
+        message.from_user.id = 556103
+        with patch("services.novel.opening_cache", cache), \
+                patch("services.novel.send_assistant_response", AsyncMock()) as send_response, \
+                patch.object(backend, "release_conversation", AsyncMock()) as release:
+            novel_state = await service.create_novel_state(556103)
+            old_thread = novel_state.thread_id
+            await service.save_message(novel_state, "Ответ из прошлой истории")
+
+            with patch.object(backend, "create_conversation", AsyncMock(return_value="fake_new")) as create:
+                await service.start_new_story(novel_state)
+            await service.process_message(message, novel_state, initial_message=True)
+
+    release.assert_awaited_once_with(db_session, old_thread)
+    create.assert_awaited_once_with(opening)
+    assert novel_state.thread_id == "fake_new"
+    assert backend.turns == 2  # Только генерация кэша
+    assert send_response.call_args.kwargs["assistant_message"] == opening.text
+
+@pytest.mark.asyncio
+async def test_background_warm_does_not_block_start(session_maker):
+    """Test the opening is prepared in the background and handed over once ready"""
+    backend = FakeBackend()
+    ready = asyncio.Event()
+    received = []
+
+    def on_ready(opening):
+        received.append(opening)
+        ready.set()
+
+    with patch("services.opening.load_story_instructions", return_value="Сценарий"):
+        cache = OpeningCache(session_maker)
+        cache.start(backend, on_ready=on_ready)
+        # Пока вступление не готово, новелла начинается обычным раном
+        assert await cache.get(backend) is None
+        await asyncio.wait_for(ready.wait(), timeout=5)
+        assert await cache.get(backend) == received[0]
+
+    assert received[0].text == f"Ответ на: {OPENING_PROMPT}"
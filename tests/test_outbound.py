@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from utils.outbound import OutboundSender
+
+@pytest.mark.asyncio
+async def test_chat_order_preserved():
+    """Test messages of one chat are delivered in the order they were queued"""
+    sender = OutboundSender(global_rate=1000, chat_rate=1000, chat_burst=1000)
+    delivered = []
+
+    async def send(i):
+        await asyncio.sleep(0.001 * (5 - i))
+        delivered.append(i)
+        return i
+
+    futures = [sender.send(1, lambda i=i: send(i)) for i in range(5)]
+    results = await asyncio.gather(*futures)
+
+    assert delivered == [0, 1, 2, 3, 4]
+    assert results == [0, 1, 2, 3, 4]
+    assert sender.get_stats()["sent"] == 5
+
+@pytest.mark.asyncio
+async def test_retry_after_is_honoured():
+    """Test 429 response blocks the chat for retry_after and repeats the send"""
+    sender = OutboundSender(global_rate=1000, chat_rate=1000, chat_burst=1000)
+    calls = 0
+
+    async def send():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise TelegramRetryAfter(
+                method=SendMessage(chat_id=1, text="test"),
+                message="Too Many Requests",
+                retry_after=0
+            )
+        return "ok"
+
+    assert await sender.send(1, send) == "ok"
+    assert calls == 2
+    assert sender.get_stats()["throttled"] == 1
+
+@pytest.mark.asyncio
+async def test_fire_and_forget_errors_are_not_raised():
+    """Test background sends report failures through stats only"""
+    sender = OutboundSender(global_rate=1000, chat_rate=1000, chat_burst=1000)
+
+    async def send():
+        raise RuntimeError("boom")
+
+    future = sender.send(1, send, wait=False)
+    await asyncio.wait([future])
+
+    assert sender.get_stats()["failed"] == 1
+    assert sender.queue_depth() == 0
@@ -0,0 +1,101 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from services.run_poller import RunPoller
+
+def make_poller() -> RunPoller:
+    return RunPoller(requests_per_second=1000, initial_interval=0.01, max_interval=0.05)
+
+@pytest.mark.asyncio
+async def test_run_completion_delivered_to_waiter():
+    """Test the waiting coroutine receives the run once it reaches a terminal status"""
+    poller = make_poller()
+    statuses = iter(["queued", "in_progress", "completed"])
+
+    async def retrieve(thread_id, run_id, **kwargs):
+        return SimpleNamespace(id=run_id, status=next(statuses))
+
+    with patch("services.run_poller.openai_client") as client:
+        client.beta.threads.runs.retrieve = AsyncMock(side_effect=retrieve)
+        run = await poller.wait("thread_1", "run_1", timeout=5)
+
+    assert run.status == "completed"
+    stats = poller.get_stats()
+    assert stats["polls"] == 3
+    assert stats["in_flight"] == 0
+    assert stats["polls_per_run"] == 3
+
+@pytest.mark.asyncio
+async def test_many_runs_share_one_poller():
+    """Test several concurrent runs are all resolved by the same background loop"""
+    poller = make_poller()
+
+    async def retrieve(thread_id, run_id, **kwargs):
+        return SimpleNamespace(id=run_id, status="completed")
+
+    with patch("services.run_poller.openai_client") as client:
+        client.beta.threads.runs.retrieve = AsyncMock(side_effect=retrieve)
+        runs = await asyncio.gather(*(
+            poller.wait(f"thread_{i}", f"run_{i}", timeout=5) for i in range(10)
+        ))
+
+    assert [run.id for run in runs] == [f"run_{i}" for i in range(10)]
+    assert poller.get_stats()["finished_runs"] == 10
+
+@pytest.mark.asyncio
+async def test_timeout_unregisters_run():
+    """Test a run that never finishes times out and is removed from polling"""
+    poller = make_poller()
+
+    async def retrieve(thread_id, run_id, **kwargs):
+        return SimpleNamespace(id=run_id, status="in_progress")
+
+    with patch("services.run_poller.openai_client") as client:
+        client.beta.threads.runs.retrieve = AsyncMock(side_effect=retrieve)
+        with pytest.raises(asyncio.TimeoutError):
+            await poller.wait("thread_1", "run_1", timeout=0.1)
+
+    assert poller.get_stats()["in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_first_status_change_is_tracked():
+    """Test poll data reports polls and when the run first left its initial status"""
+    poller = make_poller()
+    statuses = iter(["queued", "in_progress", "completed"])
+
+    async def retrieve(thread_id, run_id, **kwargs):
+        return SimpleNamespace(id=run_id, status=next(statuses))
+
+    with patch("services.run_poller.openai_client") as client:
+        client.beta.threads.runs.retrieve = AsyncMock(side_effect=retrieve)
+        run, polled = await poller.wait_tracked("thread_1", "run_1", timeout=5, status="queued")
+
+    assert run.status == "completed"
+    assert polled.polls == 3
+    assert polled.time_to_first_change is not None
+
+@pytest.mark.asyncio
+async def test_close_cancels_pending_polls():
+    """Test close cancels the loop and in-flight poll requests instead of leaving them behind"""
+    poller = make_poller()
+    started = asyncio.Event()
+
+    async def retrieve(thread_id, run_id, **kwargs):
+        started.set()
+        await asyncio.sleep(10)
+
+    with patch("services.run_poller.openai_client") as client:
+        client.beta.threads.runs.retrieve = AsyncMock(side_effect=retrieve)
+        waiter = asyncio.create_task(poller.wait("thread_1", "run_1", timeout=5))
+        await asyncio.wait_for(started.wait(), timeout=1)
+        assert len(poller._poll_tasks) == 1
+        polls = list(poller._poll_tasks)
+
+        await poller.close()
+
+    assert all(task.cancelled() for task in polls)
+    assert not poller._poll_tasks
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
@@ -0,0 +1,58 @@
+import pytest
+from sqlalchemy import delete, select
+
+from models.novel import NovelRun
+from services.run_stats import SERVICE_USER_ID, format_run_stats, get_daily_run_stats, record_turn
+
+@pytest.mark.asyncio
+async def test_daily_report_percentiles(db_session):
+    """Test runs are grouped by day with latency percentiles and tokens per turn"""
+    await db_session.execute(delete(NovelRun))
+    db_session.add_all(
+        NovelRun(
+            user_id=1,
+            thread_id="thread_1",
+            run_id=f"run_{i}",
+            status="completed",
+            duration=float(i),
+            prompt_tokens=1000,
+            completion_tokens=200
+        )
+        for i in range(1, 101)
+    )
+    # Служебный ран генерации вступления в отчёт не входит
+    db_session.add(NovelRun(
+        user_id=SERVICE_USER_ID,
+        thread_id="thread_opening",
+        run_id="run_opening",
+        status="completed",
+        duration=600.0,
+        prompt_tokens=50000,
+        completion_tokens=4000
+    ))
+    await db_session.commit()
+
+    [today] = await get_daily_run_stats(db_session)
+
+    assert today["runs"] == 100
+    assert today["p50"] == pytest.approx(50, abs=1)
+    assert today["p99"] == pytest.approx(99, abs=1)
+    assert today["prompt_tokens"] == 1000
+    assert "p50/p95/p99" in format_run_stats([today])
+
+@pytest.mark.asyncio
+async def test_service_runs_are_not_recorded(db_session):
+    """Test runs without a player (opening generation) are not stored with player turns"""
+    await db_session.execute(delete(NovelRun))
+    for user_id, run_id in ((SERVICE_USER_ID, "run_1"), (1, "run_2")):
+        await record_turn(
+            db_session,
+            user_id=user_id,
+            thread_id="thread_1",
+            run_id=run_id,
+            status="completed",
+            duration=30.0
+        )
+
+    runs = (await db_session.scalars(select(NovelRun))).all()
+    assert [run.run_id for run in runs] == ["run_2"]
@@ -0,0 +1,140 @@
+import asyncio
+import datetime
+import pytest
+from aiogram.types import CallbackQuery, Chat, Message, PreCheckoutQuery, Update, User
+
+from middlewares.scheduler import UpdateSchedulerMiddleware
+
+def make_data(user_id: int) -> dict:
+    return {"event_from_user": User(id=user_id, is_bot=False, first_name="Test")}
+
+def make_update(user_id: int) -> Update:
+    return Update(update_id=1, message=Message(
+        message_id=1,
+        date=datetime.datetime.now(),
+        chat=Chat(id=user_id, type="private"),
+        from_user=User(id=user_id, is_bot=False, first_name="Test"),
+        text="Привет"
+    ))
+
+@pytest.mark.asyncio
+async def test_same_user_updates_run_in_order():
+    """Test updates of one user are processed sequentially in FIFO order"""
+    scheduler = UpdateSchedulerMiddleware(max_concurrent=10)
+    order = []
+    active = 0
+    max_active = 0
+
+    async def handler(event, data):
+        nonlocal active, max_active
+        active += 1
+        max_active = max(max_active, active)
+        await asyncio.sleep(0.01)
+        order.append(event)
+        active -= 1
+
+    await asyncio.gather(*(scheduler(handler, i, make_data(1)) for i in range(5)))
+
+    assert order == [0, 1, 2, 3, 4]
+    assert max_active == 1
+    assert scheduler.get_stats()["active_users"] == 0
+
+@pytest.mark.asyncio
+async def test_different_users_respect_global_limit():
+    """Test updates of different users run in parallel up to the global cap"""
+    scheduler = UpdateSchedulerMiddleware(max_concurrent=2)
+    active = 0
+    max_active = 0
+
+    async def handler(event, data):
+        nonlocal active, max_active
+        active += 1
+        max_active = max(max_active, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+
+    await asyncio.gather(*(scheduler(handler, i, make_data(i)) for i in range(6)))
+
+    assert max_active == 2
+    assert scheduler.get_stats()["processed"] == 6
+
+@pytest.mark.asyncio
+async def test_queue_depth_reported():
+    """Test queue depth counts updates waiting behind the running one"""
+    scheduler = UpdateSchedulerMiddleware(max_concurrent=10)
+    release = asyncio.Event()
+
+    async def handler(event, data):
+        await release.wait()
+
+    tasks = [asyncio.create_task(scheduler(handler, i, make_data(7))) for i in range(3)]
+    await asyncio.sleep(0)
+
+    assert scheduler.queue_depth(7) == 2
+    assert scheduler.get_stats()["queued"] == 2
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert scheduler.queue_depth() == 0
+
+@pytest.mark.asyncio
+async def test_pre_checkout_query_skips_user_queue():
+    """Test a pre-checkout query is answered while the same user's long turn is running"""
+    scheduler = UpdateSchedulerMiddleware(max_concurrent=1)
+    turn_started = asyncio.Event()
+    finish_turn = asyncio.Event()
+
+    async def long_turn(event, data):
+        turn_started.set()
+        await finish_turn.wait()
+
+    async def answer(event, data):
+        return "answered"
+
+    turn = asyncio.create_task(scheduler(long_turn, make_update(1), make_data(1)))
+    await turn_started.wait()
+
+    checkout = Update(update_id=2, pre_checkout_query=PreCheckoutQuery(
+        id="q1",
+        from_user=User(id=1, is_bot=False, first_name="Test"),
+        currency="XTR",
+        total_amount=100,
+        invoice_payload="restart_1"
+    ))
+    assert await asyncio.wait_for(scheduler(answer, checkout, make_data(1)), timeout=1) == "answered"
+
+    finish_turn.set()
+    await turn
+    assert scheduler.get_stats()["bypassed"] == 1
+
+@pytest.mark.asyncio
+async def test_callback_query_waits_for_user_turn():
+    """Test an inline button press of the same user waits for the running turn"""
+    scheduler = UpdateSchedulerMiddleware(max_concurrent=10)
+    turn_started = asyncio.Event()
+    finish_turn = asyncio.Event()
+
+    async def long_turn(event, data):
+        turn_started.set()
+        await finish_turn.wait()
+
+    async def answer(event, data):
+        return "answered"
+
+    turn = asyncio.create_task(scheduler(long_turn, make_update(1), make_data(1)))
+    await turn_started.wait()
+
+    button = Update(update_id=2, callback_query=CallbackQuery(
+        id="c1",
+        from_user=User(id=1, is_bot=False, first_name="Test"),
+        chat_instance="1",
+        data="start_novel"
+    ))
+    pressed = asyncio.create_task(scheduler(answer, button, make_data(1)))
+    await asyncio.sleep(0.05)
+    assert not pressed.done()
+
+    finish_turn.set()
+    await turn
+    assert await pressed == "answered"
+    assert scheduler.get_stats()["bypassed"] == 0
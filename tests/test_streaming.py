@@ -0,0 +1,87 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from utils.outbound import OutboundSender
+from utils.streaming import StreamingResponder, find_complete_images_end, get_preview_text
+
+IMAGE_MARKER = "[AI отправляет фото: ![Катя](https://drive.google.com/file/d/abc123/view?usp=sharing)]"
+
+@pytest.fixture(autouse=True)
+def fast_outbound():
+    """Outbound queue without Telegram rate limits"""
+    with patch("utils.streaming.outbound", OutboundSender(global_rate=1000, chat_rate=1000, chat_burst=1000)):
+        yield
+
+def make_message():
+    """Message mock that records sent and edited texts"""
+    message = MagicMock()
+    message.chat.id = 1
+    sent = []
+
+    async def answer(text, **kwargs):
+        bot_message = MagicMock()
+        bot_message.texts = [text]
+
+        async def edit_text(new_text, **kwargs):
+            bot_message.texts.append(new_text)
+
+        bot_message.edit_text = edit_text
+        bot_message.delete = AsyncMock()
+        sent.append(bot_message)
+        return bot_message
+
+    message.answer = answer
+    return message, sent
+
+def test_preview_hides_incomplete_image_marker():
+    text = "Катя улыбается.\n[AI отправляет фото: ![Катя](https://drive.google"
+    assert get_preview_text(text) == "Катя улыбается."
+    assert find_complete_images_end(text) == 0
+
+def test_complete_marker_detected_only_with_following_text():
+    assert find_complete_images_end("Текст " + IMAGE_MARKER) == 0
+    assert find_complete_images_end("Текст " + IMAGE_MARKER + "\n") > 0
+
+@pytest.mark.asyncio
+async def test_streaming_splits_text_around_images():
+    """Test text before an image is finalized, photo sent, and the rest goes to a new message"""
+    message, sent = make_message()
+    responder = StreamingResponder(message, edit_interval=0)
+
+    with patch("utils.streaming.fetch_image_for_send", AsyncMock(return_value=b"image")), \
+            patch("utils.streaming.send_photo_or_notice", AsyncMock()) as send_photo:
+        await responder.start()
+        for chunk in ["Катя ", "улыбается.\n", IMAGE_MARKER[:30], IMAGE_MARKER[30:], "\nПривет!"]:
+            await responder.feed(chunk)
+        await responder.finish()
+
+    send_photo.assert_awaited_once()
+    assert send_photo.call_args[0][2] == "abc123"
+    assert sent[0].texts[-1] == "Катя улыбается."
+    assert sent[-1].texts[-1] == "Привет!"
+    assert responder.text.endswith("Привет!")
+
+@pytest.mark.asyncio
+async def test_empty_response_removes_placeholder():
+    """Test placeholder is deleted when the assistant produced no text"""
+    message, sent = make_message()
+    responder = StreamingResponder(message, edit_interval=0)
+
+    await responder.start()
+    await responder.finish()
+
+    sent[0].delete.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_cancelled_turn_does_not_flush_pending_text():
+    """Test the unsent rest of a cancelled answer is dropped along with the placeholder"""
+    message, sent = make_message()
+    responder = StreamingResponder(message, edit_interval=60)
+
+    await responder.start()
+    await responder.feed("Катя начинает рассказ")
+    await responder.finish(flush=False)
+
+    assert len(sent) == 1
+    assert sent[0].texts == ["✍️ ..."]
+    sent[0].delete.assert_awaited_once()
@@ -0,0 +1,69 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from models.novel import TelegramFile
+from utils.openai_helper import send_photo_or_notice
+from utils.telegram_files import TelegramFileCache
+
+@pytest.fixture
+async def file_cache(engine):
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_maker() as session:
+        await session.execute(delete(TelegramFile))
+        await session.commit()
+    cache = TelegramFileCache(session_maker)
+    with patch("utils.openai_helper.telegram_files", cache):
+        yield cache
+
+def make_message(file_ids):
+    """Сообщение, answer_photo которого возвращает фото с очередным file_id"""
+    message = MagicMock()
+    message.answer = AsyncMock()
+    message.answer_photo = AsyncMock(side_effect=lambda photo, **kwargs: SimpleNamespace(
+        photo=[SimpleNamespace(file_id="small"), SimpleNamespace(file_id=next(file_ids))]
+    ))
+    return message
+
+@pytest.mark.asyncio
+async def test_photo_is_uploaded_once_and_sent_by_file_id(file_cache):
+    """Test the first send uploads bytes and later sends reuse the stored file_id"""
+    message = make_message(iter(["file_1"]))
+    with patch("utils.openai_helper.download_image", AsyncMock(return_value=b"image")) as download:
+        await send_photo_or_notice(message, b"image", "img1")
+        await send_photo_or_notice(message, None, "img1")
+
+    download.assert_not_awaited()
+    first, second = message.answer_photo.call_args_list
+    assert isinstance(first.args[0], BufferedInputFile)
+    assert second.args[0] == "file_1"
+
+    # Соответствие переживает перезапуск
+    restarted = TelegramFileCache(file_cache.session_maker)
+    assert await restarted.get("img1") == "file_1"
+    assert file_cache.get_stats()["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_invalid_file_id_is_replaced_by_new_upload(file_cache):
+    """Test a rejected file_id is forgotten and the image is uploaded again"""
+    await file_cache.remember("img2", "stale")
+    message = make_message(iter(["fresh"]))
+    answer_photo = message.answer_photo.side_effect
+
+    def reject_stale(photo, **kwargs):
+        if photo == "stale":
+            raise TelegramBadRequest(method=MagicMock(), message="Bad Request: wrong file identifier")
+        return answer_photo(photo, **kwargs)
+
+    message.answer_photo.side_effect = reject_stale
+    with patch("utils.openai_helper.download_image", AsyncMock(return_value=b"image")) as download:
+        await send_photo_or_notice(message, None, "img2")
+
+    download.assert_awaited_once_with("img2")
+    message.answer.assert_not_awaited()
+    assert await file_cache.get("img2") == "fresh"
+    assert file_cache.get_stats()["invalidated"] == 1
@@ -0,0 +1,59 @@
+import httpx
+import pytest
+from unittest.mock import AsyncMock, patch
+from openai import APIConnectionError, NotFoundError
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from models.novel import ThreadDeletion
+from services.thread_cleanup import ThreadDeletionQueue
+
+@pytest.fixture
+async def queue(engine):
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_maker() as session:
+        await session.execute(delete(ThreadDeletion))
+        await session.commit()
+    return ThreadDeletionQueue(session_maker, batch_size=10)
+
+async def pending(queue):
+    async with queue.session_maker() as session:
+        return (await session.scalars(select(ThreadDeletion))).all()
+
+@pytest.mark.asyncio
+async def test_queued_threads_are_deleted(queue):
+    """Test queued threads are deleted in one batch and removed from the table"""
+    await queue.enqueue(["thread_1", "thread_2", "thread_1"])
+
+    with patch("services.thread_cleanup.openai_client") as client:
+        client.beta.threads.delete = AsyncMock()
+        assert await queue.process_batch() == 2
+
+    assert client.beta.threads.delete.await_count == 2
+    assert await pending(queue) == []
+
+@pytest.mark.asyncio
+async def test_failed_deletion_is_retried_later(queue):
+    """Test failed deletes stay in the queue with backoff, missing threads count as deleted"""
+    request = httpx.Request("DELETE", "https://api.openai.com/v1/threads/x")
+    errors = {
+        "thread_gone": NotFoundError(
+            "not found", response=httpx.Response(404, request=request), body=None
+        ),
+        "thread_down": APIConnectionError(request=request)
+    }
+
+    async def delete_thread(thread_id, **kwargs):
+        raise errors[thread_id]
+
+    await queue.enqueue(["thread_gone", "thread_down"])
+    with patch("services.thread_cleanup.openai_client") as client:
+        client.beta.threads.delete = AsyncMock(side_effect=delete_thread)
+        await queue.process_batch()
+        # Повтор ещё не наступил
+        assert await queue.process_batch() == 0
+
+    [left] = await pending(queue)
+    assert left.thread_id == "thread_down"
+    assert left.attempts == 1
+    assert left.last_error
@@ -0,0 +1,62 @@
+import pytest
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from models.novel import SpareThread
+from services.thread_pool import ThreadPool
+
+@pytest.fixture
+async def pool(engine):
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_maker() as session:
+        await session.execute(delete(SpareThread))
+        await session.commit()
+    return ThreadPool(session_maker, size=3)
+
+def make_client():
+    counter = iter(range(1000))
+    client = AsyncMock()
+    client.beta.threads.create = AsyncMock(
+        side_effect=lambda **kwargs: SimpleNamespace(id=f"thread_{next(counter)}")
+    )
+    return client
+
+@pytest.mark.asyncio
+async def test_acquire_pops_pooled_thread(pool):
+    """Test filled pool hands out stored threads without calling OpenAI"""
+    client = make_client()
+    with patch("services.thread_pool.openai_client", client):
+        assert await pool.fill() == 3
+        client.beta.threads.create.reset_mock()
+
+        thread_id = await pool.acquire()
+
+    assert thread_id == "thread_0"
+    client.beta.threads.create.assert_not_called()
+    assert pool.get_stats()["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_empty_pool_creates_thread_on_demand(pool):
+    """Test acquire falls back to creating a thread when the pool is empty"""
+    client = make_client()
+    with patch("services.thread_pool.openai_client", client):
+        thread_id = await pool.acquire()
+
+    assert thread_id == "thread_0"
+    assert pool.get_stats()["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_stale_threads_are_pruned(pool):
+    """Test threads older than max_age are dropped and queued for deletion"""
+    client = make_client()
+    with patch("services.thread_pool.openai_client", client), \
+            patch("services.thread_pool.thread_deletion_queue") as queue:
+        queue.enqueue = AsyncMock()
+        await pool.fill()
+        pool.max_age = timedelta(seconds=-60)
+        assert await pool.prune() == 3
+
+    assert sorted(queue.enqueue.call_args[0][0]) == ["thread_0", "thread_1", "thread_2"]
@@ -1,9 +1,45 @@
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from models.base import Base
-from models.novel import NovelState, NovelMessage
+from models.novel import NovelState, NovelMessage, SpareThread, ThreadDeletion, NovelRun, OpeningTranscript, AssistantRecord, TelegramFile
 from models.referral import ReferralLink, Referral, PendingReferral, ReferralReward
 import structlog
 
+DATABASE_URL = "sqlite+aiosqlite:///bot.db"
+
+# Общий движок и фабрика сессий для обработчиков и фоновых сервисов
+engine = create_async_engine(DATABASE_URL, echo=False)
+session_maker = async_sessionmaker(engine, expire_on_commit=False)
+
+# SQL для заполнения колонок, добавленных в уже существующие таблицы
+COLUMN_BACKFILLS = {
+    # Новеллы, начатые до появления колонки, уже прошли этап ввода имени
+    ("novel_states", "player_name"): "UPDATE novel_states SET player_name = '' WHERE player_name IS NULL",
+}
+
+def add_missing_columns(conn) -> list[str]:
+    """
+    Добавляет в существующие таблицы колонки, которых там ещё нет.
+    create_all создаёт только новые таблицы, поэтому новые поля моделей
+    добавляются через ALTER TABLE.
+    """
+    inspector = inspect(conn)
+    added = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            backfill = COLUMN_BACKFILLS.get((table.name, column.name))
+            if backfill:
+                conn.execute(text(backfill))
+            added.append(f"{table.name}.{column.name}")
+    return added
+
 async def create_db():
     """Create database tables"""
     logger = structlog.get_logger()
@@ -16,6 +52,9 @@ async def create_db():
     try:
         async with engine.begin() as conn:
             await logger.ainfo("Creating database tables")
+            added_columns = await conn.run_sync(add_missing_columns)
+            if added_columns:
+                await logger.ainfo("Added missing columns", columns=added_columns)
             await conn.run_sync(Base.metadata.create_all)
             await logger.ainfo("Database tables created successfully")
     except Exception as e:
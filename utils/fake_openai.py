@@ -0,0 +1,526 @@
+"""
+Локальная замена OpenAI API для нагрузочных прогонов и интеграционных тестов.
+
+Поддерживает то, чем пользуется бот: ассистентов, треды, сообщения, раны
+(опрос, стриминг, requires_action с вызовом end_story, отмену) и Chat
+Completions. Задержки, доля сбоев и ответы настраиваются через FakeOpenAIConfig.
+
+Запуск отдельным процессом:
+    python -m utils.fake_openai --port 8090 --latency 2 --failure-rate 0.05
+и BOT_OPENAI_BASE_URL=http://127.0.0.1:8090/v1 в .env бота.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+import structlog
+from aiohttp import web
+
+logger = structlog.get_logger()
+
+# Сообщение игрока, на которое ассистент всегда вызывает end_story
+END_STORY_TRIGGER = "/end_story"
+
+@dataclass
+class FakeOpenAIConfig:
+    """Поведение фейкового API"""
+    latency: float = 1.0  # Длительность генерации ответа (сек)
+    queue_latency: float = 0.1  # Время рана в статусе queued
+    failure_rate: float = 0.0  # Доля ранов, завершающихся failed (server_error)
+    http_error_rate: float = 0.0  # Доля запросов, получающих ответ 500
+    tool_call_rate: float = 0.0  # Доля ранов, вызывающих end_story
+    replies: List[str] = field(default_factory=list)  # Ответы по кругу; пусто - эхо запроса
+    image_url: str | None = None  # Добавлять к ответу пометку [AI отправляет фото: ...]
+    chunk_size: int = 3  # Слов в одном фрагменте стриминга
+    seed: int | None = None
+
+def _now() -> int:
+    return int(time.time())
+
+def _new_id(prefix: str) -> str:
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+def _tokens(text: str) -> int:
+    # Грубая оценка: ~4 символа на токен
+    return max(1, len(text) // 4)
+
+class FakeOpenAIServer:
+    """
+    aiohttp-приложение, отвечающее в формате OpenAI API.
+
+    Состояние ранов вычисляется по времени при каждом обращении: ран
+    queued до queue_latency, затем in_progress до latency, после чего
+    завершается заранее выбранным исходом.
+    """
+
+    def __init__(self, config: FakeOpenAIConfig | None = None):
+        self.config = config or FakeOpenAIConfig()
+        self.random = random.Random(self.config.seed)
+        self.assistants: Dict[str, Dict[str, Any]] = {}
+        self.threads: Dict[str, Dict[str, Any]] = {}
+        self.messages: Dict[str, List[Dict[str, Any]]] = {}
+        self.runs: Dict[str, Dict[str, Any]] = {}
+        self._run_state: Dict[str, Dict[str, Any]] = {}
+        self._reply_index = 0
+        self.requests = 0
+        self.app = self._create_app()
+        self._runner: web.AppRunner | None = None
+        self.base_url = ""
+
+    def _create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._faults])
+        app.router.add_post("/v1/assistants", self.create_assistant)
+        app.router.add_get("/v1/assistants/{assistant_id}", self.get_assistant)
+        app.router.add_post("/v1/assistants/{assistant_id}", self.update_assistant)
+        app.router.add_post("/v1/threads", self.create_thread)
+        app.router.add_get("/v1/threads/{thread_id}", self.get_thread)
+        app.router.add_delete("/v1/threads/{thread_id}", self.delete_thread)
+        app.router.add_post("/v1/threads/{thread_id}/messages", self.create_message)
+        app.router.add_get("/v1/threads/{thread_id}/messages", self.list_messages)
+        app.router.add_post("/v1/threads/{thread_id}/runs", self.create_run)
+        app.router.add_get("/v1/threads/{thread_id}/runs/{run_id}", self.get_run)
+        app.router.add_post("/v1/threads/{thread_id}/runs/{run_id}/cancel", self.cancel_run)
+        app.router.add_post(
+            "/v1/threads/{thread_id}/runs/{run_id}/submit_tool_outputs", self.submit_tool_outputs
+        )
+        app.router.add_post("/v1/chat/completions", self.chat_completion)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запускает сервер и возвращает base_url для клиента OpenAI"""
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}/v1"
+        logger.info(f"Fake OpenAI API listening on {self.base_url}")
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "FakeOpenAIServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.stop()
+
+    @web.middleware
+    async def _faults(self, request: web.Request, handler) -> web.StreamResponse:
+        self.requests += 1
+        if self.config.http_error_rate and self.random.random() < self.config.http_error_rate:
+            return self._error(500, "server_error", "The server had an error while processing your request.")
+        return await handler(request)
+
+    @staticmethod
+    def _error(status: int, code: str, message: str) -> web.Response:
+        return web.json_response(
+            {"error": {"message": message, "type": code, "param": None, "code": code}},
+            status=status
+        )
+
+    def _not_found(self, what: str, object_id: str) -> web.Response:
+        return self._error(404, "not_found", f"No {what} found with id '{object_id}'.")
+
+    def next_reply(self, user_content: str) -> str:
+        """Текст очередного ответа ассистента"""
+        if self.config.replies:
+            reply = self.config.replies[self._reply_index % len(self.config.replies)]
+            self._reply_index += 1
+        else:
+            reply = f"Ответ на: {user_content}"
+        if self.config.image_url:
+            reply += f"\n[AI отправляет фото: ![сцена]({self.config.image_url})]"
+        return reply
+
+    # Ассистенты
+
+    async def create_assistant(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        assistant = {
+            "id": _new_id("asst"),
+            "object": "assistant",
+            "created_at": _now(),
+            "name": body.get("name"),
+            "description": body.get("description"),
+            "model": body.get("model", "gpt-4o"),
+            "instructions": body.get("instructions"),
+            "tools": body.get("tools", []),
+            "metadata": body.get("metadata", {}),
+            "top_p": 1.0,
+            "temperature": 1.0,
+            "response_format": "auto"
+        }
+        self.assistants[assistant["id"]] = assistant
+        return web.json_response(assistant)
+
+    async def get_assistant(self, request: web.Request) -> web.Response:
+        assistant = self.assistants.get(request.match_info["assistant_id"])
+        if assistant is None:
+            return self._not_found("assistant", request.match_info["assistant_id"])
+        return web.json_response(assistant)
+
+    async def update_assistant(self, request: web.Request) -> web.Response:
+        assistant = self.assistants.get(request.match_info["assistant_id"])
+        if assistant is None:
+            return self._not_found("assistant", request.match_info["assistant_id"])
+        assistant.update(await request.json())
+        return web.json_response(assistant)
+
+    # Треды и сообщения
+
+    async def create_thread(self, request: web.Request) -> web.Response:
+        body = await request.json() if request.can_read_body else {}
+        thread = {
+            "id": _new_id("thread"),
+            "object": "thread",
+            "created_at": _now(),
+            "metadata": body.get("metadata", {}),
+            "tool_resources": None
+        }
+        self.threads[thread["id"]] = thread
+        self.messages[thread["id"]] = []
+        for message in body.get("messages", []):
+            self._add_message(thread["id"], message["role"], message["content"])
+        return web.json_response(thread)
+
+    async def get_thread(self, request: web.Request) -> web.Response:
+        thread = self.threads.get(request.match_info["thread_id"])
+        if thread is None:
+            return self._not_found("thread", request.match_info["thread_id"])
+        return web.json_response(thread)
+
+    async def delete_thread(self, request: web.Request) -> web.Response:
+        thread_id = request.match_info["thread_id"]
+        if self.threads.pop(thread_id, None) is None:
+            return self._not_found("thread", thread_id)
+        self.messages.pop(thread_id, None)
+        return web.json_response({"id": thread_id, "object": "thread.deleted", "deleted": True})
+
+    def _add_message(self, thread_id: str, role: str, content: str, run: Dict[str, Any] | None = None) -> Dict[str, Any]:
+        message = {
+            "id": _new_id("msg"),
+            "object": "thread.message",
+            "created_at": _now(),
+            "thread_id": thread_id,
+            "role": role,
+            "content": [{"type": "text", "text": {"value": content, "annotations": []}}],
+            "assistant_id": run["assistant_id"] if run else None,
+            "run_id": run["id"] if run else None,
+            "attachments": [],
+            "metadata": {},
+            "status": "completed"
+        }
+        self.messages[thread_id].append(message)
+        return message
+
+    async def create_message(self, request: web.Request) -> web.Response:
+        thread_id = request.match_info["thread_id"]
+        if thread_id not in self.threads:
+            return self._not_found("thread", thread_id)
+        body = await request.json()
+        return web.json_response(self._add_message(thread_id, body["role"], body["content"]))
+
+    async def list_messages(self, request: web.Request) -> web.Response:
+        thread_id = request.match_info["thread_id"]
+        if thread_id not in self.threads:
+            return self._not_found("thread", thread_id)
+        if request.query.get("run_id") in self.runs:
+            self._advance(self.runs[request.query["run_id"]])
+
+        messages = self.messages[thread_id]
+        if "run_id" in request.query:
+            messages = [message for message in messages if message["run_id"] == request.query["run_id"]]
+        if request.query.get("order", "desc") == "desc":
+            messages = list(reversed(messages))
+        messages = messages[:int(request.query.get("limit", 20))]
+        return web.json_response({
+            "object": "list",
+            "data": messages,
+            "first_id": messages[0]["id"] if messages else None,
+            "last_id": messages[-1]["id"] if messages else None,
+            "has_more": False
+        })
+
+    # Раны
+
+    async def create_run(self, request: web.Request) -> web.StreamResponse:
+        thread_id = request.match_info["thread_id"]
+        if thread_id not in self.threads:
+            return self._not_found("thread", thread_id)
+        body = await request.json()
+        for message in body.get("additional_messages") or []:
+            self._add_message(thread_id, message["role"], message["content"])
+
+        user_messages = [item for item in self.messages[thread_id] if item["role"] == "user"]
+        user_content = user_messages[-1]["content"][0]["text"]["value"] if user_messages else ""
+        if user_content.strip() == END_STORY_TRIGGER or self.random.random() < self.config.tool_call_rate:
+            outcome = "requires_action"
+        elif self.random.random() < self.config.failure_rate:
+            outcome = "failed"
+        else:
+            outcome = "completed"
+
+        created = time.time()
+        run = {
+            "id": _new_id("run"),
+            "object": "thread.run",
+            "created_at": int(created),
+            "thread_id": thread_id,
+            "assistant_id": body.get("assistant_id"),
+            "status": "queued",
+            "required_action": None,
+            "last_error": None,
+            "expires_at": int(created) + 600,
+            "started_at": None,
+            "cancelled_at": None,
+            "failed_at": None,
+            "completed_at": None,
+            "incomplete_details": None,
+            "model": "gpt-4o",
+            "instructions": "",
+            "tools": [],
+            "metadata": {},
+            "usage": None,
+            "parallel_tool_calls": True,
+            "truncation_strategy": body.get("truncation_strategy"),
+            "response_format": "auto",
+            "tool_choice": "auto"
+        }
+        self.runs[run["id"]] = run
+        self._run_state[run["id"]] = {
+            "started": created + self.config.queue_latency,
+            "finished": created + self.config.queue_latency + self.config.latency,
+            "outcome": outcome,
+            "reply": self.next_reply(user_content) if outcome == "completed" else "",
+            "prompt_tokens": sum(_tokens(item["content"][0]["text"]["value"]) for item in self.messages[thread_id])
+        }
+
+        if body.get("stream"):
+            return await self._stream_run(request, run)
+        return web.json_response(run)
+
+    def _advance(self, run: Dict[str, Any]) -> None:
+        """Переводит ран в статус, соответствующий прошедшему времени"""
+        if run["status"] not in ("queued", "in_progress"):
+            return
+        state = self._run_state[run["id"]]
+        now = time.time()
+        if now >= state["started"] and run["started_at"] is None:
+            run["started_at"] = int(state["started"])
+            run["status"] = "in_progress"
+        if now >= state["finished"]:
+            self._finish(run)
+
+    def _finish(self, run: Dict[str, Any]) -> None:
+        state = self._run_state[run["id"]]
+        outcome = state["outcome"]
+        run["started_at"] = run["started_at"] or int(state["started"])
+        run["status"] = outcome
+        completion_tokens = _tokens(state["reply"]) if state["reply"] else 1
+        run["usage"] = {
+            "prompt_tokens": state["prompt_tokens"],
+            "completion_tokens": completion_tokens,
+            "total_tokens": state["prompt_tokens"] + completion_tokens
+        }
+        if outcome == "completed":
+            run["completed_at"] = _now()
+            self._add_message(run["thread_id"], "assistant", state["reply"], run)
+        elif outcome == "failed":
+            run["failed_at"] = _now()
+            run["last_error"] = {"code": "server_error", "message": "Sorry, something went wrong."}
+        elif outcome == "requires_action":
+            run["required_action"] = {
+                "type": "submit_tool_outputs",
+                "submit_tool_outputs": {"tool_calls": [{
+                    "id": _new_id("call"),
+                    "type": "function",
+                    "function": {"name": "end_story", "arguments": json.dumps({"reason": "user_choice"})}
+                }]}
+            }
+
+    async def get_run(self, request: web.Request) -> web.Response:
+        run = self.runs.get(request.match_info["run_id"])
+        if run is None or run["thread_id"] != request.match_info["thread_id"]:
+            return self._not_found("run", request.match_info["run_id"])
+        if run["thread_id"] not in self.threads:
+            return self._not_found("thread", run["thread_id"])
+        self._advance(run)
+        return web.json_response(run)
+
+    async def cancel_run(self, request: web.Request) -> web.Response:
+        run = self.runs.get(request.match_info["run_id"])
+        if run is None:
+            return self._not_found("run", request.match_info["run_id"])
+        self._advance(run)
+        if run["status"] not in ("queued", "in_progress", "requires_action"):
+            return self._error(400, "invalid_request_error", f"Cannot cancel run with status '{run['status']}'.")
+        run["status"] = "cancelled"
+        run["cancelled_at"] = _now()
+        return web.json_response(run)
+
+    async def submit_tool_outputs(self, request: web.Request) -> web.Response:
+        run = self.runs.get(request.match_info["run_id"])
+        if run is None:
+            return self._not_found("run", request.match_info["run_id"])
+        if run["status"] != "requires_action":
+            return self._error(400, "invalid_request_error", "Run is not waiting for tool outputs.")
+        run["status"] = "completed"
+        run["required_action"] = None
+        run["completed_at"] = _now()
+        return web.json_response(run)
+
+    async def _stream_run(self, request: web.Request, run: Dict[str, Any]) -> web.StreamResponse:
+        """Ран в формате server-sent events Assistants API"""
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        async def send(event: str, data: Any) -> None:
+            payload = data if isinstance(data, str) else json.dumps(data)
+            await response.write(f"event: {event}\ndata: {payload}\n\n".encode("utf-8"))
+
+        state = self._run_state[run["id"]]
+        await send("thread.run.created", run)
+        await send("thread.run.queued", run)
+        await asyncio.sleep(self.config.queue_latency)
+        if run["status"] == "queued":
+            run["status"] = "in_progress"
+            run["started_at"] = _now()
+        await send("thread.run.in_progress", run)
+
+        words = state["reply"].split(" ") if state["reply"] else []
+        chunks = [
+            " ".join(words[i:i + self.config.chunk_size]) + (" " if i + self.config.chunk_size < len(words) else "")
+            for i in range(0, len(words), self.config.chunk_size)
+        ]
+        message_id = _new_id("msg")
+        delay = self.config.latency / max(1, len(chunks))
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            if run["status"] == "cancelled":
+                break
+            await send("thread.message.delta", {
+                "id": message_id,
+                "object": "thread.message.delta",
+                "delta": {"content": [{"index": 0, "type": "text", "text": {"value": chunk}}]}
+            })
+        if not chunks:
+            await asyncio.sleep(delay)
+
+        if run["status"] == "cancelled":
+            await send("thread.run.cancelled", run)
+        else:
+            self._finish(run)
+            await send(f"thread.run.{run['status']}", run)
+        await send("done", "[DONE]")
+        await response.write_eof()
+        return response
+
+    # Chat Completions
+
+    async def chat_completion(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        messages = body.get("messages", [])
+        user_content = next((item["content"] for item in reversed(messages) if item["role"] == "user"), "")
+        prompt_tokens = sum(_tokens(str(item.get("content") or "")) for item in messages)
+        call_tool = bool(body.get("tools")) and (
+            user_content.strip() == END_STORY_TRIGGER or self.random.random() < self.config.tool_call_rate
+        )
+        reply = "" if call_tool else self.next_reply(user_content)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": _tokens(reply),
+            "total_tokens": prompt_tokens + _tokens(reply)
+        }
+        tool_call = {
+            "id": _new_id("call"),
+            "type": "function",
+            "function": {"name": "end_story", "arguments": json.dumps({"reason": "user_choice"})}
+        }
+        completion_id = _new_id("chatcmpl")
+
+        if not body.get("stream"):
+            await asyncio.sleep(self.config.latency)
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": _now(),
+                "model": body.get("model", "gpt-4o"),
+                "choices": [{
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": reply or None,
+                        "tool_calls": [tool_call] if call_tool else None
+                    },
+                    "finish_reason": "tool_calls" if call_tool else "stop"
+                }],
+                "usage": usage
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        async def send(delta: Dict[str, Any] | None, finish_reason: str | None = None, with_usage: bool = False) -> None:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": _now(),
+                "model": body.get("model", "gpt-4o"),
+                "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                "usage": usage if with_usage else None
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+
+        words = reply.split(" ") if reply else []
+        delay = self.config.latency / max(1, len(words))
+        if call_tool:
+            await asyncio.sleep(delay)
+            await send({"role": "assistant", "tool_calls": [{"index": 0, **tool_call}]})
+        for i, word in enumerate(words):
+            await asyncio.sleep(delay)
+            await send({"content": word + (" " if i < len(words) - 1 else "")})
+        await send({}, finish_reason="tool_calls" if call_tool else "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await send(None, with_usage=True)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Локальная замена OpenAI API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--queue-latency", type=float, default=0.1)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--http-error-rate", type=float, default=0.0)
+    parser.add_argument("--tool-call-rate", type=float, default=0.0)
+    parser.add_argument("--reply", action="append", default=[], help="Ответ ассистента (можно несколько)")
+    parser.add_argument("--image-url", default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(FakeOpenAIConfig(
+        latency=args.latency,
+        queue_latency=args.queue_latency,
+        failure_rate=args.failure_rate,
+        http_error_rate=args.http_error_rate,
+        tool_call_rate=args.tool_call_rate,
+        replies=args.reply,
+        image_url=args.image_url,
+        seed=args.seed
+    ))
+    web.run_app(server.app, host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
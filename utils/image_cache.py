@@ -1,57 +1,297 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
 from pathlib import Path
 import aiofiles
+import aiofiles.os
 import structlog
 import hashlib
-from typing import Optional
+from typing import Any, Dict, Optional
 
 logger = structlog.get_logger()
 
+INDEX_FILE = "index.json"
+TMP_DIR = "tmp"
+
 class ImageCache:
-    def __init__(self, cache_dir: str = "image_cache"):
+    """
+    Кэш изображений из двух уровней: LRU в памяти поверх файлов на диске.
+
+    Часто отправляемые изображения отдаются из памяти без обращения к
+    файловой системе и пулу потоков aiofiles. Память ограничена
+    memory_limit байтами, при превышении вытесняются давно не
+    запрошенные изображения; промах по памяти заполняет её с диска.
+
+    Файлы на диске учитываются в индексе index.json (размер и время
+    последнего обращения), поэтому промах не требует обращения к диску.
+    Фоновая задача удаляет файлы старше ttl и давно не запрошенные файлы
+    сверх max_bytes. Файл пишется во временный и переименовывается, так
+    что оборванная запись не превращается в попадание.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = "image_cache",
+        memory_limit: int = 64 * 1024 * 1024,
+        max_bytes: int = 1024 * 1024 * 1024,
+        ttl: float = 30 * 24 * 3600,
+        cleanup_interval: float = 600
+    ):
         self.cache_dir = Path(cache_dir)
+        self.tmp_dir = self.cache_dir / TMP_DIR
+        self.index_path = self.cache_dir / INDEX_FILE
+        self.memory_limit = memory_limit
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._disk_evictions = 0
+        self._expired = 0
+        self._task: asyncio.Task | None = None
+        self._cleanup_needed = asyncio.Event()
+        self._index_dirty = False
+
+        # Подпапки создаются один раз, а не при каждом обращении
         self.cache_dir.mkdir(exist_ok=True)
-        logger.info(f"Initialized image cache in {self.cache_dir}")
+        for shard in range(256):
+            (self.cache_dir / f"{shard:02x}").mkdir(exist_ok=True)
+        self._clear_tmp()
+
+        # image_id -> {"size": байты, "accessed": время последнего обращения}
+        self._index: Dict[str, Dict[str, float]] = self._load_index()
+        self._disk_bytes = sum(entry["size"] for entry in self._index.values())
+        logger.info(f"Initialized image cache in {self.cache_dir}: {len(self._index)} files, {self._disk_bytes} bytes")
 
     def _get_cache_path(self, image_id: str) -> Path:
         """Получает путь к кэшированному файлу"""
-        # Используем хеш для создания подпапок
+        # Используем хеш для распределения по подпапкам
         hash_name = hashlib.md5(image_id.encode()).hexdigest()
-        subdir = self.cache_dir / hash_name[:2]
-        subdir.mkdir(exist_ok=True)
-        return subdir / f"{image_id}.webp"
+        return self.cache_dir / hash_name[:2] / f"{image_id}.webp"
+
+    def _clear_tmp(self) -> None:
+        """Удаляет файлы, запись которых оборвалась при прошлом запуске"""
+        self.tmp_dir.mkdir(exist_ok=True)
+        for path in self.tmp_dir.iterdir():
+            path.unlink(missing_ok=True)
+
+    def _load_index(self) -> Dict[str, Dict[str, float]]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return self._rebuild_index()
+        except Exception as e:
+            logger.error(f"Error reading image cache index, rebuilding: {e}")
+            return self._rebuild_index()
+
+    def _rebuild_index(self) -> Dict[str, Dict[str, float]]:
+        """Индекс по уже лежащим на диске файлам (кэш без индекса или с повреждённым)"""
+        index = {}
+        for path in self.cache_dir.glob("??/*.webp"):
+            stat = path.stat()
+            index[path.stem] = {"size": stat.st_size, "accessed": stat.st_mtime}
+        self._index_dirty = True
+        return index
+
+    def _write_index(self, snapshot: Dict[str, Dict[str, float]]) -> None:
+        tmp_path = self.tmp_dir / f"{INDEX_FILE}.{uuid.uuid4().hex}"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(snapshot, file)
+        os.replace(tmp_path, self.index_path)
+
+    async def save_index(self) -> None:
+        """Сохраняет индекс, если он менялся"""
+        if not self._index_dirty:
+            return
+        self._index_dirty = False
+        try:
+            await asyncio.to_thread(self._write_index, dict(self._index))
+        except Exception as e:
+            self._index_dirty = True
+            logger.error(f"Error saving image cache index: {e}")
+
+    def _remember(self, image_id: str, data: bytes) -> None:
+        """Кладёт изображение в память, вытесняя давно не запрошенные"""
+        if len(data) > self.memory_limit:
+            return
+        previous = self._memory.pop(image_id, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[image_id] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_limit:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._evictions += 1
+
+    def _touch(self, image_id: str) -> None:
+        entry = self._index.get(image_id)
+        if entry is not None:
+            entry["accessed"] = time.time()
+            self._index_dirty = True
+
+    def _forget(self, image_id: str) -> None:
+        entry = self._index.pop(image_id, None)
+        if entry is not None:
+            self._disk_bytes -= entry["size"]
+            self._index_dirty = True
 
     async def get(self, image_id: str) -> Optional[bytes]:
         """Получает изображение из кэша"""
-        cache_path = self._get_cache_path(image_id)
-        if cache_path.exists():
-            try:
-                async with aiofiles.open(cache_path, 'rb') as f:
-                    data = await f.read()
-                logger.info(f"Cache hit for image {image_id}")
-                return data
-            except Exception as e:
-                logger.error(f"Error reading from cache: {e}")
-                return None
-        return None
+        data = self._memory.get(image_id)
+        if data is not None:
+            self._memory.move_to_end(image_id)
+            self._memory_hits += 1
+            self._touch(image_id)
+            return data
+
+        if image_id not in self._index:
+            self._misses += 1
+            return None
+
+        try:
+            async with aiofiles.open(self._get_cache_path(image_id), 'rb') as f:
+                data = await f.read()
+        except FileNotFoundError:
+            # Файл удалили в обход кэша
+            self._forget(image_id)
+            self._misses += 1
+            return None
+        except Exception as e:
+            logger.error(f"Error reading from cache: {e}")
+            return None
+        logger.info(f"Cache hit for image {image_id}")
+        self._disk_hits += 1
+        self._touch(image_id)
+        self._remember(image_id, data)
+        return data
 
     async def put(self, image_id: str, data: bytes) -> bool:
         """Сохраняет изображение в кэш"""
+        self._remember(image_id, data)
+        tmp_path = self.tmp_dir / f"{image_id}.{uuid.uuid4().hex}"
         try:
-            cache_path = self._get_cache_path(image_id)
-            async with aiofiles.open(cache_path, 'wb') as f:
+            async with aiofiles.open(tmp_path, 'wb') as f:
                 await f.write(data)
-            logger.info(f"Cached image {image_id}")
-            return True
+            await aiofiles.os.replace(tmp_path, self._get_cache_path(image_id))
         except Exception as e:
             logger.error(f"Error writing to cache: {e}")
+            try:
+                await aiofiles.os.remove(tmp_path)
+            except OSError:
+                pass
             return False
 
+        self._forget(image_id)
+        self._index[image_id] = {"size": len(data), "accessed": time.time()}
+        self._disk_bytes += len(data)
+        self._index_dirty = True
+        # Фоновая задача сохранит индекс и при необходимости освободит место
+        self._cleanup_needed.set()
+        logger.info(f"Cached image {image_id}")
+        return True
+
+    async def evict(self) -> int:
+        """Удаляет устаревшие файлы и давно не запрошенные сверх max_bytes"""
+        now = time.time()
+        victims = []
+        if self.ttl > 0:
+            expired = [image_id for image_id, entry in self._index.items() if now - entry["accessed"] > self.ttl]
+            self._expired += len(expired)
+            victims.extend(expired)
+
+        remaining = self._disk_bytes - sum(self._index[image_id]["size"] for image_id in victims)
+        if remaining > self.max_bytes:
+            expired_ids = set(victims)
+            candidates = sorted(
+                (item for item in self._index.items() if item[0] not in expired_ids),
+                key=lambda item: item[1]["accessed"]
+            )
+            for image_id, entry in candidates:
+                if remaining <= self.max_bytes:
+                    break
+                victims.append(image_id)
+                remaining -= entry["size"]
+                self._disk_evictions += 1
+
+        for image_id in victims:
+            self._forget(image_id)
+            try:
+                await aiofiles.os.remove(self._get_cache_path(image_id))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"Error removing cached image {image_id}: {e}")
+
+        if victims:
+            logger.info(f"Evicted {len(victims)} images from disk cache")
+        await self.save_index()
+        return len(victims)
+
+    def start(self) -> None:
+        """Запускает фоновую очистку кэша"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.save_index()
+
+    async def _run(self) -> None:
+        while True:
+            self._cleanup_needed.clear()
+            try:
+                await self.evict()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error cleaning image cache: {e}")
+
+            try:
+                await asyncio.wait_for(self._cleanup_needed.wait(), timeout=self.cleanup_interval)
+            except asyncio.TimeoutError:
+                pass
+
     async def clear(self) -> None:
         """Очищает кэш"""
+        self._memory.clear()
+        self._memory_bytes = 0
         try:
-            for path in self.cache_dir.glob("**/*"):
-                if path.is_file():
-                    path.unlink()
+            for image_id in list(self._index):
+                self._forget(image_id)
+                try:
+                    await aiofiles.os.remove(self._get_cache_path(image_id))
+                except FileNotFoundError:
+                    pass
+            await self.save_index()
             logger.info("Cache cleared")
         except Exception as e:
-            logger.error(f"Error clearing cache: {e}") 
\ No newline at end of file
+            logger.error(f"Error clearing cache: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики кэша изображений"""
+        return {
+            "memory_items": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "memory_hits": self._memory_hits,
+            "disk_items": len(self._index),
+            "disk_bytes": self._disk_bytes,
+            "disk_hits": self._disk_hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "disk_evictions": self._disk_evictions,
+            "expired": self._expired
+        }
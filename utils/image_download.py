@@ -0,0 +1,135 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Dict
+
+import aiohttp
+import structlog
+
+from utils.image_cache import ImageCache
+from utils.metrics import percentile
+
+logger = structlog.get_logger()
+
+DRIVE_DOWNLOAD_URL = "https://drive.google.com/uc?export=download&id={image_id}"
+DOWNLOAD_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# Сигнатуры форматов изображений, которые Telegram принимает как фото
+IMAGE_SIGNATURES = (b"\xff\xd8\xff", b"\x89PNG\r\n\x1a\n", b"GIF87a", b"GIF89a")
+
+def is_image(data: bytes) -> bool:
+    """Похожи ли байты на изображение (а не на HTML-страницу входа или проверки на вирусы Drive)"""
+    if data.startswith(IMAGE_SIGNATURES):
+        return True
+    return data[:4] == b"RIFF" and data[8:12] == b"WEBP"
+
+class ImageDownloader:
+    """
+    Скачивание изображений Google Drive в ImageCache.
+
+    Все загрузки идут через одну aiohttp-сессию с пулом соединений и
+    кэшем DNS, так что соединения с Drive переиспользуются. Одновременные
+    промахи по одному image_id ждут одну общую загрузку (single-flight),
+    а не скачивают одно и то же изображение параллельно.
+    """
+
+    def __init__(
+        self,
+        cache: ImageCache,
+        connections: int = 20,
+        timeout: float = 30.0,
+        dns_ttl: int = 300
+    ):
+        self.cache = cache
+        self.connections = connections
+        self.timeout = timeout
+        self.dns_ttl = dns_ttl
+        self._session: aiohttp.ClientSession | None = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._downloads = 0
+        self._failures = 0
+        self._coalesced = 0
+        self._cache_hits = 0
+        self._latencies: deque = deque(maxlen=500)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Сессия создаётся внутри работающего event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.connections,
+                    limit_per_host=self.connections,
+                    ttl_dns_cache=self.dns_ttl
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=DOWNLOAD_HEADERS
+            )
+        return self._session
+
+    async def fetch(self, image_id: str) -> bytes:
+        """Изображение из кэша или с Google Drive"""
+        cached_data = await self.cache.get(image_id)
+        # Ранее закэшированная страница вместо изображения скачивается заново
+        if cached_data and is_image(cached_data):
+            self._cache_hits += 1
+            return cached_data
+
+        task = self._inflight.get(image_id)
+        if task is not None:
+            self._coalesced += 1
+            logger.info(f"Waiting for in-flight download of image {image_id}")
+        else:
+            task = asyncio.create_task(self._download(image_id))
+            self._inflight[image_id] = task
+            task.add_done_callback(lambda done: self._finish(image_id, done))
+        # Отмена одного ожидающего не должна прерывать загрузку для остальных
+        return await asyncio.shield(task)
+
+    def _finish(self, image_id: str, task: asyncio.Task) -> None:
+        self._inflight.pop(image_id, None)
+        if not task.cancelled():
+            # Ошибку забирают ожидающие, здесь она только помечается полученной
+            task.exception()
+
+    async def _download(self, image_id: str) -> bytes:
+        direct_url = DRIVE_DOWNLOAD_URL.format(image_id=image_id)
+        logger.info(f"Downloading image from URL: {direct_url}")
+        started = time.monotonic()
+        try:
+            async with self._get_session().get(direct_url) as response:
+                logger.info(f"Response status: {response.status}")
+                if response.status != 200:
+                    raise Exception(f"Failed to download image: {response.status}")
+                data = await response.read()
+            if not is_image(data):
+                # Drive отвечает 200 и HTML-страницей, если файл закрыт или слишком велик для проверки
+                raise Exception(f"Not an image: {response.content_type}")
+        except Exception as e:
+            self._failures += 1
+            logger.error(f"Error downloading image {image_id}: {e}")
+            raise
+
+        self._downloads += 1
+        self._latencies.append(time.monotonic() - started)
+        await self.cache.put(image_id, data)
+        logger.info(f"Cached new image {image_id}")
+        return data
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики скачивания изображений"""
+        latencies = list(self._latencies)
+        return {
+            "cache_hits": self._cache_hits,
+            "downloads": self._downloads,
+            "failures": self._failures,
+            "coalesced": self._coalesced,
+            "in_flight": len(self._inflight),
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95)
+        }
@@ -0,0 +1,45 @@
+from typing import Any, Callable, Dict
+
+import structlog
+
+logger = structlog.get_logger()
+
+# Источники runtime-метрик: имя компонента -> функция, возвращающая словарь значений
+_providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+def register_stats(name: str, provider: Callable[[], Dict[str, Any]]) -> None:
+    """Регистрирует источник метрик для админской команды /metrics"""
+    _providers[name] = provider
+
+def collect_stats() -> Dict[str, Dict[str, Any]]:
+    """Собирает текущие метрики всех зарегистрированных компонентов"""
+    stats = {}
+    for name, provider in _providers.items():
+        try:
+            stats[name] = provider()
+        except Exception as e:
+            logger.error(f"Error collecting stats for {name}: {e}")
+            stats[name] = {"error": str(e)}
+    return stats
+
+def format_stats(stats: Dict[str, Dict[str, Any]]) -> str:
+    """Форматирует метрики для отправки в Telegram"""
+    if not stats:
+        return "Метрики пока не собраны"
+
+    lines = []
+    for name, values in stats.items():
+        lines.append(f"<b>{name}</b>")
+        for key, value in values.items():
+            if isinstance(value, float):
+                value = f"{value:.3f}"
+            lines.append(f"  {key}: {value}")
+    return "\n".join(lines)
+
+def percentile(values: list, q: float) -> float:
+    """Перцентиль q (0..100) по списку значений, 0.0 для пустого списка"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return float(ordered[index])
@@ -1,13 +1,20 @@
-import aiohttp
+import asyncio
 import structlog
+from functools import partial
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.types import Message, BufferedInputFile, ReplyKeyboardMarkup
 from openai import AsyncOpenAI, PermissionDeniedError
 from config_reader import bot_config
 from utils.image_cache import ImageCache
+from utils.image_download import ImageDownloader
+from utils.metrics import register_stats
+from utils.openai_resilience import call_openai
+from utils.openai_transport import http_client, op_timeout
+from utils.outbound import outbound
+from utils.telegram_files import telegram_files
 from utils.text_utils import extract_images_and_clean_text
 import json
-from openai.types.beta.threads import Run
-from typing import TypedDict, List, TYPE_CHECKING
+from typing import Any, TypedDict, List, TYPE_CHECKING
 
 # Используем TYPE_CHECKING для избежания циклических импортов
 if TYPE_CHECKING:
@@ -16,11 +23,75 @@ if TYPE_CHECKING:
 
 logger = structlog.get_logger()
 openai_client = AsyncOpenAI(
-    api_key=bot_config.openai_api_key.get_secret_value()
+    api_key=bot_config.openai_api_key.get_secret_value(),
+    base_url=bot_config.openai_base_url,  # Например, локальный utils.fake_openai для нагрузочных прогонов
+    http_client=http_client,
+    max_retries=0  # Повторы выполняет utils.openai_resilience
 )
 
 # Инициализация кэша
-image_cache = ImageCache()
+image_cache = ImageCache(
+    memory_limit=bot_config.image_cache_memory_mb * 1024 * 1024,
+    max_bytes=bot_config.image_cache_disk_mb * 1024 * 1024,
+    ttl=bot_config.image_cache_ttl_days * 24 * 3600
+)
+register_stats("image_cache", image_cache.get_stats)
+image_downloader = ImageDownloader(image_cache, connections=bot_config.image_download_connections)
+register_stats("image_downloads", image_downloader.get_stats)
+
+# Модель, на которой работает новелла
+STORY_MODEL = "gpt-4-turbo-preview"
+
+# Функция завершения истории, доступная модели
+END_STORY_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "end_story",
+        "description": "Завершает текущую историю",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "reason": {
+                    "type": "string",
+                    "enum": ["completed", "final_scene", "user_choice"],
+                    "description": "Причина завершения истории"
+                }
+            },
+            "required": ["reason"]
+        }
+    }
+}
+
+STORY_INSTRUCTIONS = """
+... существующие инструкции ...
+
+ВАЖНО: При достижении финальной сцены:
+1. НЕ спрашивай разрешения у пользователя
+2. НЕ пиши фразы типа "История подошла к концу. Если ты хочешь, я могу завершить её"
+3. Сразу вызывай функцию end_story с параметром reason="final_scene"
+4. После описания рассвета на набережной сразу заканчивай историю
+
+Пример правильного завершения:
+"...глядя на поднимающееся солнце, она понимает, что её решения уже определили дальнейший путь и отношения с каждым."
+[Вызов end_story]
+"""
+
+ASSISTANT_NAME = "Novel Game Assistant"
+
+def load_story_instructions() -> str:
+    """Сценарий из scenario.txt вместе с инструкциями по завершению истории"""
+    with open('scenario.txt', 'r', encoding='utf-8') as file:
+        scenario = file.read()
+    return scenario + STORY_INSTRUCTIONS
+
+def assistant_params() -> dict:
+    """Параметры ассистента новеллы: имя, инструкции, модель и функции"""
+    return {
+        "name": ASSISTANT_NAME,
+        "instructions": load_story_instructions(),
+        "model": STORY_MODEL,
+        "tools": [END_STORY_TOOL]
+    }
 
 async def create_assistant(existing_assistant_id: str = None) -> str:
     """
@@ -36,7 +107,11 @@ async def create_assistant(existing_assistant_id: str = None) -> str:
         # Проверяем существующего ассистента если ID предоставлен
         if existing_assistant_id:
             try:
-                await openai_client.beta.assistants.retrieve(existing_assistant_id)
+                await call_openai(
+                    openai_client.beta.assistants.retrieve,
+                    existing_assistant_id,
+                    timeout=op_timeout("retrieve")
+                )
                 logger.debug(f"Successfully retrieved existing assistant: {existing_assistant_id}")
                 return existing_assistant_id
             except Exception as e:
@@ -44,52 +119,12 @@ async def create_assistant(existing_assistant_id: str = None) -> str:
                 # Продолжаем выполнение для создания нового ассистента
         
         # Создаем нового ассистента
-        with open('scenario.txt', 'r', encoding='utf-8') as file:
-            scenario = file.read()
-            
         logger.info("Creating new OpenAI assistant")
 
-        # Определяем функцию для ассистента
-        tools = [
-            {
-                "type": "function",
-                "function": {
-                    "name": "end_story",
-                    "description": "Завершает текущую историю",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "reason": {
-                                "type": "string",
-                                "enum": ["completed", "final_scene", "user_choice"],
-                                "description": "Причина завершения истории"
-                            }
-                        },
-                        "required": ["reason"]
-                    }
-                }
-            }
-        ]
-        
-        instructions = """
-        ... существующие инструкции ...
-        
-        ВАЖНО: При достижении финальной сцены:
-        1. НЕ спрашивай разрешения у пользователя
-        2. НЕ пиши фразы типа "История подошла к концу. Если ты хочешь, я могу завершить её"
-        3. Сразу вызывай функцию end_story с параметром reason="final_scene"
-        4. После описания рассвета на набережной сразу заканчивай историю
-        
-        Пример правильного завершения:
-        "...глядя на поднимающееся солнце, она понимает, что её решения уже определили дальнейший путь и отношения с каждым."
-        [Вызов end_story]
-        """
-        
-        assistant = await openai_client.beta.assistants.create(
-            name="Novel Game Assistant",
-            instructions=scenario + instructions,
-            model="gpt-4-turbo-preview",
-            tools=tools
+        assistant = await call_openai(
+            openai_client.beta.assistants.create,
+            **assistant_params(),
+            timeout=op_timeout("create")
         )
         
         logger.debug(f"Created new assistant with ID: {assistant.id}")
@@ -144,36 +179,55 @@ async def download_image(url: str) -> bytes:
         logger.error(f"Failed to extract image ID from URL {url}: {e}")
         raise
     
-    # Пробуем получить из кэша
-    cached_data = await image_cache.get(image_id)
-    if cached_data:
-        logger.info(f"Cache hit for image {image_id}")
-        return cached_data
-    
-    # Если нет в кэше, скачиваем
-    async with aiohttp.ClientSession() as session:
-        try:
-            # Используем прямой URL для скачивания
-            direct_url = f"https://drive.google.com/uc?export=download&id={image_id}"
-            logger.info(f"Downloading image from URL: {direct_url}")
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            
-            async with session.get(direct_url, headers=headers) as response:
-                logger.info(f"Response status: {response.status}")
-                
-                if response.status == 200:
-                    data = await response.read()
-                    await image_cache.put(image_id, data)
-                    logger.info(f"Cached new image {image_id}")
-                    return data
-                    
-                raise Exception(f"Failed to download image: {response.status}")
-        except Exception as e:
-            logger.error(f"Error downloading image {image_id}: {e}")
-            raise
+    return await image_downloader.fetch(image_id)
+
+async def fetch_image_for_send(image_id: str) -> bytes | None:
+    """Байты изображения для отправки; None - фото уйдёт по сохранённому file_id"""
+    if await telegram_files.contains(image_id):
+        return None
+    return await download_image(image_id)
+
+async def send_photo_or_notice(
+    message: Message,
+    image_data: bytes | None,
+    image_id: str,
+    reply_markup: ReplyKeyboardMarkup = None
+) -> None:
+    """
+    Отправляет фото, при ошибке Telegram - текстовое уведомление вместо него.
+    Уже загруженное изображение отправляется по file_id, а если file_id
+    стал недействительным, изображение скачивается и загружается заново.
+    """
+    try:
+        file_id = await telegram_files.get(image_id)
+        if file_id:
+            try:
+                await message.answer_photo(file_id, reply_markup=reply_markup)
+                return
+            except TelegramBadRequest as e:
+                logger.warning(f"Failed to send image {image_id} by file id: {e}")
+                await telegram_files.forget(image_id)
+
+        if image_data is None:
+            image_data = await download_image(image_id)
+        sent = await message.answer_photo(
+            BufferedInputFile(
+                image_data,
+                filename=f"{image_id}.jpg"
+            ),
+            reply_markup=reply_markup
+        )
+        if sent and sent.photo:
+            await telegram_files.remember(image_id, sent.photo[-1].file_id)
+    except TelegramRetryAfter:
+        # Повтор после retry_after выполнит очередь отправки
+        raise
+    except Exception as e:
+        logger.error(f"Error sending image {image_id}: {e}")
+        await message.answer(
+            f"[Не удалось загрузить изображение: {image_id}]",
+            reply_markup=reply_markup
+        )
 
 async def send_assistant_response(
     message: Message,
@@ -183,52 +237,62 @@ async def send_assistant_response(
     """
     Отправляет ответ ассистента пользователю с обработкой изображений
     """
+    chat_id = message.chat.id
     try:
         # Извлекаем изображения и очищаем текст
         messages = extract_images_and_clean_text(assistant_message)
         
+        # Все отправки идут через общую очередь: порядок внутри чата сохраняется,
+        # а скачивание следующего изображения идёт параллельно с отправкой текста
+        deliveries = []
         for msg in messages:
             if isinstance(msg, tuple):
                 text, image_id = msg
                 
                 # Отправляем текст, если он есть
                 if text and text.strip():
-                    await message.answer(
-                        text.strip(),
-                        reply_markup=reply_markup
-                    )
+                    deliveries.append(outbound.send(
+                        chat_id,
+                        partial(message.answer, text.strip(), reply_markup=reply_markup)
+                    ))
                 
                 # Отправляем изображение, если оно есть
                 if image_id:
                     try:
-                        image_data = await download_image(image_id)
-                        if image_data:
-                            await message.answer_photo(
-                                BufferedInputFile(
-                                    image_data,
-                                    filename=f"{image_id}.jpg"
-                                ),
-                                reply_markup=reply_markup
-                            )
+                        image_data = await fetch_image_for_send(image_id)
+                        deliveries.append(outbound.send(
+                            chat_id,
+                            partial(send_photo_or_notice, message, image_data, image_id, reply_markup)
+                        ))
                     except Exception as e:
                         logger.error(f"Error sending image {image_id}: {e}")
-                        await message.answer(
-                            f"[Не удалось загрузить изображение: {image_id}]",
-                            reply_markup=reply_markup
-                        )
+                        deliveries.append(outbound.send(
+                            chat_id,
+                            partial(
+                                message.answer,
+                                f"[Не удалось загрузить изображение: {image_id}]",
+                                reply_markup=reply_markup
+                            )
+                        ))
             else:
                 # Если это просто строка, отправляем её
                 if msg.strip():
-                    await message.answer(
-                        msg.strip(),
-                        reply_markup=reply_markup
-                    )
+                    deliveries.append(outbound.send(
+                        chat_id,
+                        partial(message.answer, msg.strip(), reply_markup=reply_markup)
+                    ))
+        
+        await asyncio.gather(*deliveries)
                     
     except Exception as e:
         logger.error(f"Error sending assistant response: {e}")
-        await message.answer(
-            "Произошла ошибка при отправке ответа. Пожалуйста, попробуйте позже.",
-            reply_markup=reply_markup
+        await outbound.send(
+            chat_id,
+            partial(
+                message.answer,
+                "Произошла ошибка при отправке ответа. Пожалуйста, попробуйте позже.",
+                reply_markup=reply_markup
+            )
         )
 
 class ToolOutput(TypedDict):
@@ -236,17 +300,17 @@ class ToolOutput(TypedDict):
     output: str
 
 async def handle_tool_calls(
-    run: Run, 
+    tool_calls: List[Any],
     thread_id: str, 
     novel_service: 'NovelService',  # Используем строковую аннотацию
     novel_state: 'NovelState',      # Используем строковую аннотацию
     message: Message
 ) -> List[ToolOutput]:
     """
-    Обрабатывает вызовы инструментов от ассистента
+    Обрабатывает вызовы инструментов от модели
     
     Args:
-        run: Текущий запуск ассистента
+        tool_calls: Вызовы функций (объекты с id, function.name и function.arguments)
         thread_id: ID треда беседы
         novel_service: Сервис для работы с новеллой
         novel_state: Текущее состояние новеллы
@@ -259,28 +323,12 @@ async def handle_tool_calls(
         "Processing tool calls",
         thread_id=thread_id,
         user_id=message.from_user.id,
-        run_id=run.id
+        count=len(tool_calls)
     )
     
-    if not hasattr(run, 'required_action') or not run.required_action:
-        logger.warning(
-            "No required action in run",
-            run_id=run.id,
-            thread_id=thread_id
-        )
-        return []
-
-    if not hasattr(run.required_action, 'submit_tool_outputs'):
-        logger.warning(
-            "No tool outputs to submit",
-            run_id=run.id,
-            thread_id=thread_id
-        )
-        return []
-    
     tool_outputs: List[ToolOutput] = []
     
-    for tool_call in run.required_action.submit_tool_outputs.tool_calls:
+    for tool_call in tool_calls:
         try:
             function_name = tool_call.function.name  # Добавляем получение имени функции
             arguments = json.loads(tool_call.function.arguments)
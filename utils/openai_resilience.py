@@ -0,0 +1,282 @@
+import asyncio
+import random
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from enum import StrEnum
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+import structlog
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    AuthenticationError,
+    NotFoundError,
+    PermissionDeniedError,
+    RateLimitError
+)
+
+from config_reader import bot_config
+from utils.metrics import register_stats
+
+logger = structlog.get_logger()
+
+T = TypeVar("T")
+
+class ErrorKind(StrEnum):
+    RATE_LIMIT = "rate_limit"
+    QUOTA = "quota"
+    SERVER = "server"
+    CONNECTION = "connection"
+    NOT_FOUND = "not_found"
+    PERMISSION = "permission"
+    CLIENT = "client"
+    OTHER = "other"
+
+# Ошибки, которые имеет смысл повторить
+RETRYABLE_KINDS = {ErrorKind.RATE_LIMIT, ErrorKind.SERVER, ErrorKind.CONNECTION}
+
+# Ошибки, говорящие о деградации OpenAI - учитываются автоматом
+DEGRADED_KINDS = RETRYABLE_KINDS | {ErrorKind.QUOTA}
+
+# Коды ошибок ранов (run.last_error.code) и соответствующие им типы ошибок
+RUN_ERROR_KINDS = {
+    "server_error": ErrorKind.SERVER,
+    "rate_limit_exceeded": ErrorKind.RATE_LIMIT
+}
+
+class OpenAIUnavailableError(Exception):
+    """OpenAI временно недоступен: автомат разомкнут, запрос не отправлялся"""
+
+    def __init__(self, retry_in: float):
+        super().__init__(f"OpenAI is unavailable, retry in {retry_in:.0f} seconds")
+        self.retry_in = retry_in
+
+class RunFailedError(Exception):
+    """Ран завершился со статусом failed"""
+
+    def __init__(self, run):
+        self.run = run
+        self.code = run.last_error.code if getattr(run, "last_error", None) else None
+        super().__init__(f"Assistant run {run.id} failed: {self.code}")
+
+def classify_error(error: BaseException) -> ErrorKind:
+    """Определяет тип ошибки OpenAI"""
+    if isinstance(error, RunFailedError):
+        return RUN_ERROR_KINDS.get(error.code, ErrorKind.OTHER)
+    if isinstance(error, RateLimitError):
+        return ErrorKind.QUOTA if error.code == "insufficient_quota" else ErrorKind.RATE_LIMIT
+    if isinstance(error, NotFoundError):
+        return ErrorKind.NOT_FOUND
+    if isinstance(error, (PermissionDeniedError, AuthenticationError)):
+        return ErrorKind.PERMISSION
+    if isinstance(error, APIConnectionError):  # включая APITimeoutError
+        return ErrorKind.CONNECTION
+    if isinstance(error, APIStatusError):
+        return ErrorKind.SERVER if error.status_code >= 500 else ErrorKind.CLIENT
+    return ErrorKind.OTHER
+
+def get_retry_after(error: BaseException) -> float | None:
+    """Пауза из заголовков retry-after-ms / retry-after ответа OpenAI, секунды"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class CircuitBreaker:
+    """
+    Автомат для запросов к OpenAI.
+
+    После failure_threshold подряд ошибок деградации размыкается и на
+    recovery_timeout секунд отклоняет запросы без обращения к API. Затем
+    пропускает один пробный запрос: успех замыкает автомат, ошибка снова
+    размыкает.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.state = self.CLOSED
+        self.times_opened = 0
+        self.rejected = 0
+
+    def check(self) -> None:
+        """Пропускает запрос или выбрасывает OpenAIUnavailableError"""
+        if self.state == self.CLOSED:
+            return
+
+        retry_in = self._opened_at + self.recovery_timeout - time.monotonic()
+        if self.state == self.OPEN and retry_in <= 0:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+
+        self.rejected += 1
+        raise OpenAIUnavailableError(max(retry_in, 1.0))
+
+    @property
+    def available(self) -> bool:
+        """Пропустит ли автомат запрос прямо сейчас (без учёта пробного запроса)"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return time.monotonic() - self._opened_at >= self.recovery_timeout
+        return not self._probe_in_flight
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("OpenAI circuit breaker closed")
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logger.warning(f"OpenAI circuit breaker opened after {self._failures} failures")
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Пробный запрос завершился ошибкой, не связанной с деградацией, или был отменён"""
+        self._probe_in_flight = False
+
+class OpenAIResilience:
+    """
+    Единая политика повторов для запросов к OpenAI.
+
+    Повторяются только rate limit, 5xx и сетевые ошибки: с экспоненциальной
+    задержкой и разбросом, либо через паузу из Retry-After. Ошибки деградации
+    учитываются автоматом, который при сбоях OpenAI быстро отказывает.
+    """
+
+    def __init__(
+        self,
+        breaker: CircuitBreaker,
+        max_attempts: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0
+    ):
+        self.breaker = breaker
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._calls = 0
+        self._retries = 0
+        self._errors = Counter()
+
+    def backoff(self, attempt: int, error: BaseException | None = None) -> float:
+        """Пауза перед повтором номер attempt (с 1)"""
+        retry_after = get_retry_after(error) if error is not None else None
+        if retry_after is not None:
+            return retry_after
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(delay / 2, delay)
+
+    def record_error(self, error: BaseException) -> ErrorKind:
+        """Учитывает ошибку в метриках и автомате, возвращает её тип"""
+        kind = classify_error(error)
+        self._errors[kind] += 1
+        if kind in DEGRADED_KINDS:
+            self.breaker.record_failure()
+        else:
+            self.breaker.release_probe()
+        return kind
+
+    def should_retry(self, error: BaseException, attempt: int, max_attempts: int | None = None) -> float | None:
+        """
+        Учитывает ошибку и решает, повторять ли запрос.
+        Возвращает паузу перед повтором или None, если повторять не нужно.
+        """
+        kind = self.record_error(error)
+        if kind not in RETRYABLE_KINDS or attempt >= (max_attempts or self.max_attempts):
+            return None
+        delay = self.backoff(attempt, error)
+        if delay > self.max_delay:
+            # Ждать дольше бессмысленно - пользователь быстрее получит ответ "попробуйте позже"
+            return None
+        return delay
+
+    async def call(
+        self,
+        fn: Callable[..., Awaitable[T]],
+        *args,
+        max_attempts: int | None = None,
+        **kwargs
+    ) -> T:
+        """Выполняет запрос к OpenAI с повторами и проверкой автомата"""
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.check()
+            # В полуоткрытом состоянии автомат пропускает только пробный запрос
+            probe = self.breaker.state == CircuitBreaker.HALF_OPEN
+            self._calls += 1
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self.should_retry(e, attempt, max_attempts)
+                if delay is None:
+                    raise
+                self._retries += 1
+                logger.warning(f"OpenAI request failed ({classify_error(e)}), retry {attempt} in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+            except BaseException:
+                # Отменённый пробный запрос ничего не сказал о состоянии OpenAI
+                if probe and self.breaker.state == CircuitBreaker.HALF_OPEN:
+                    self.breaker.release_probe()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики повторов и состояния автомата"""
+        stats = {
+            "breaker_state": self.breaker.state,
+            "breaker_opened": self.breaker.times_opened,
+            "breaker_rejected": self.breaker.rejected,
+            "calls": self._calls,
+            "retries": self._retries
+        }
+        for kind, count in self._errors.items():
+            stats[f"errors_{kind}"] = count
+        return stats
+
+openai_resilience = OpenAIResilience(
+    CircuitBreaker(
+        failure_threshold=bot_config.openai_breaker_threshold,
+        recovery_timeout=bot_config.openai_breaker_recovery
+    ),
+    max_attempts=bot_config.openai_max_attempts,
+    max_delay=bot_config.openai_max_retry_delay
+)
+register_stats("openai_resilience", openai_resilience.get_stats)
+
+async def call_openai(fn: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+    """Запрос к OpenAI через общую политику повторов"""
+    return await openai_resilience.call(fn, *args, **kwargs)
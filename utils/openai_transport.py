@@ -0,0 +1,160 @@
+import re
+import time
+from collections import deque
+from typing import Any, Dict
+
+import httpx
+from openai import DefaultAsyncHttpxClient
+
+from config_reader import bot_config
+from utils.metrics import percentile, register_stats
+
+class TransportMetrics:
+    """
+    Метрики HTTP-транспорта OpenAI.
+
+    Через trace-расширение httpcore считает новые TCP/TLS-соединения и время
+    от начала запроса до отправки заголовков - в него входит ожидание
+    свободного соединения в пуле и установка нового соединения.
+    """
+
+    def __init__(self, samples: int = 1000):
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self._waits = deque(maxlen=samples)
+
+    async def on_request(self, request: httpx.Request) -> None:
+        """Event hook httpx: подключает трассировку к каждому запросу"""
+        self.requests += 1
+        started = time.monotonic()
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.complete":
+                self.new_connections += 1
+            elif event_name == "connection.start_tls.complete":
+                self.tls_handshakes += 1
+            elif event_name.endswith(".send_request_headers.started"):
+                self._waits.append(time.monotonic() - started)
+
+        request.extensions["trace"] = trace
+
+    def get_stats(self) -> Dict[str, Any]:
+        waits = list(self._waits)
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "tls_handshakes": self.tls_handshakes,
+            "reuse_ratio": 1 - self.new_connections / self.requests if self.requests else 0.0,
+            "connection_wait_p50": percentile(waits, 50),
+            "connection_wait_p95": percentile(waits, 95),
+            "connection_wait_max": max(waits, default=0.0)
+        }
+
+# Единицы в заголовках x-ratelimit-reset-*: "1s", "6m0s", "20ms"
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+def parse_reset_duration(value: str) -> float | None:
+    """Секунды из значения заголовка x-ratelimit-reset-*"""
+    parts = _DURATION_PART.findall(value or "")
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+class RateLimitState:
+    """
+    Остаток лимитов OpenAI по заголовкам x-ratelimit-* последних ответов.
+
+    Между ответами остаток неизвестен точно, поэтому при оценке ожидания
+    учитываются ещё не отправленные запросы (pending_requests).
+    """
+
+    def __init__(self):
+        self.limit_requests: int | None = None
+        self.limit_tokens: int | None = None
+        self.remaining_requests: int | None = None
+        self.remaining_tokens: int | None = None
+        self.requests_reset_at = 0.0
+        self.tokens_reset_at = 0.0
+        self.updates = 0
+
+    async def on_response(self, response: httpx.Response) -> None:
+        """Event hook httpx: запоминает лимиты из заголовков ответа"""
+        headers = response.headers
+        if "x-ratelimit-remaining-requests" not in headers and "x-ratelimit-remaining-tokens" not in headers:
+            return
+        self.update(headers)
+
+    def update(self, headers: Any) -> None:
+        now = time.monotonic()
+        for kind in ("requests", "tokens"):
+            try:
+                if f"x-ratelimit-limit-{kind}" in headers:
+                    setattr(self, f"limit_{kind}", int(headers[f"x-ratelimit-limit-{kind}"]))
+                if f"x-ratelimit-remaining-{kind}" in headers:
+                    setattr(self, f"remaining_{kind}", int(headers[f"x-ratelimit-remaining-{kind}"]))
+            except ValueError:
+                continue
+            reset = parse_reset_duration(headers.get(f"x-ratelimit-reset-{kind}", ""))
+            if reset is not None:
+                setattr(self, f"{kind}_reset_at", now + reset)
+        self.updates += 1
+
+    def wait_time(self, tokens: int = 0, pending_requests: int = 0) -> float:
+        """Сколько секунд ждать восстановления лимитов для запроса на tokens токенов"""
+        now = time.monotonic()
+        waits = []
+        if self.remaining_requests is not None and self.remaining_requests <= pending_requests:
+            waits.append(self.requests_reset_at - now)
+        if self.remaining_tokens is not None and self.remaining_tokens < tokens:
+            waits.append(self.tokens_reset_at - now)
+        return max(0.0, *waits) if waits else 0.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "remaining_requests": self.remaining_requests if self.remaining_requests is not None else "",
+            "remaining_tokens": self.remaining_tokens if self.remaining_tokens is not None else "",
+            "limit_requests": self.limit_requests if self.limit_requests is not None else "",
+            "limit_tokens": self.limit_tokens if self.limit_tokens is not None else "",
+            "updates": self.updates
+        }
+
+# Таймауты чтения для разных типов операций с API, секунды
+OPERATION_TIMEOUTS = {
+    "create": bot_config.openai_timeout_create,
+    "retrieve": bot_config.openai_timeout_retrieve,
+    "list": bot_config.openai_timeout_list,
+    "delete": bot_config.openai_timeout_delete,
+    "stream": bot_config.openai_timeout_stream
+}
+
+def op_timeout(operation: str) -> httpx.Timeout:
+    """Таймаут запроса для операции (create, retrieve, list, delete, stream)"""
+    return httpx.Timeout(
+        OPERATION_TIMEOUTS[operation],
+        connect=bot_config.openai_connect_timeout,
+        pool=bot_config.openai_pool_timeout
+    )
+
+def create_http_client(metrics: TransportMetrics, rate_limits: RateLimitState | None = None) -> httpx.AsyncClient:
+    """HTTP-клиент для AsyncOpenAI с настроенным пулом соединений"""
+    return DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=bot_config.openai_max_connections,
+            max_keepalive_connections=bot_config.openai_max_keepalive_connections,
+            keepalive_expiry=bot_config.openai_keepalive_expiry
+        ),
+        http2=bot_config.openai_http2,
+        timeout=op_timeout("create"),
+        event_hooks={
+            "request": [metrics.on_request],
+            "response": [rate_limits.on_response] if rate_limits else []
+        }
+    )
+
+transport_metrics = TransportMetrics()
+rate_limits = RateLimitState()
+http_client = create_http_client(transport_metrics, rate_limits)
+register_stats("openai_http", transport_metrics.get_stats)
+register_stats("openai_rate_limits", rate_limits.get_stats)
@@ -0,0 +1,165 @@
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Tuple
+
+import structlog
+from aiogram.exceptions import TelegramRetryAfter
+
+from config_reader import bot_config
+from utils.metrics import register_stats
+from utils.rate_limit import TokenBucket
+
+logger = structlog.get_logger()
+
+SendFactory = Callable[[], Awaitable[Any]]
+
+class OutboundSender:
+    """
+    Центральная очередь исходящих сообщений в Telegram.
+
+    Общий токен-бакет ограничивает скорость отправки для всего бота,
+    отдельный бакет на каждый чат - скорость в конкретный чат. Сообщения
+    одного чата доставляются строго в порядке постановки в очередь,
+    при 429 чат ждёт retry_after и повторяет ту же отправку.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: int = 3,
+        group_rate: float = 20 / 60,
+        max_retries: int = 5
+    ):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._queues: Dict[int, Deque[Tuple[SendFactory, asyncio.Future]]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._sent = 0
+        self._failed = 0
+        self._throttled = 0
+        self._throttled_seconds = 0.0
+        self._max_queue = 0
+
+    def _get_chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательные id - группы и каналы, у них лимит Telegram строже
+            rate = self.group_rate if chat_id < 0 else self.chat_rate
+            bucket = TokenBucket(rate, self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def send(self, chat_id: int, factory: SendFactory, wait: bool = True) -> Awaitable[Any]:
+        """
+        Ставит отправку в очередь чата.
+
+        Args:
+            chat_id: ID чата получателя
+            factory: функция без аргументов, создающая корутину отправки
+                (например, functools.partial(message.answer, text))
+            wait: True - вернуть awaitable с результатом отправки,
+                False - отправить в фоне, ошибки только логируются
+
+        Returns:
+            Future с результатом отправки (awaitable)
+        """
+        future = asyncio.get_running_loop().create_future()
+        if not wait:
+            future.add_done_callback(self._log_background_error)
+
+        queue = self._queues.setdefault(chat_id, deque())
+        queue.append((factory, future))
+        self._max_queue = max(self._max_queue, len(queue))
+
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._drain(chat_id))
+        return future
+
+    @staticmethod
+    def _log_background_error(future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception():
+            logger.error(f"Background send failed: {future.exception()}")
+
+    async def _drain(self, chat_id: int) -> None:
+        """Последовательно отправляет сообщения одного чата"""
+        queue = self._queues[chat_id]
+        bucket = self._get_chat_bucket(chat_id)
+        try:
+            while queue:
+                factory, future = queue.popleft()
+                if future.cancelled():
+                    continue
+                try:
+                    result = await self._deliver(chat_id, bucket, factory)
+                    if not future.done():
+                        future.set_result(result)
+                except Exception as e:
+                    self._failed += 1
+                    if not future.done():
+                        future.set_exception(e)
+        finally:
+            self._workers.pop(chat_id, None)
+            if not queue:
+                self._queues.pop(chat_id, None)
+                # Бакет держим, пока он не восполнится, иначе новый бакет выдаст лишний burst
+                asyncio.get_running_loop().call_later(
+                    self.chat_burst / bucket.rate,
+                    self._drop_idle_bucket,
+                    chat_id
+                )
+
+    def _drop_idle_bucket(self, chat_id: int) -> None:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket and chat_id not in self._workers and bucket.is_idle:
+            self._chat_buckets.pop(chat_id, None)
+
+    async def _deliver(self, chat_id: int, bucket: TokenBucket, factory: SendFactory) -> Any:
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            await self._global_bucket.acquire()
+            try:
+                result = await factory()
+                self._sent += 1
+                return result
+            except TelegramRetryAfter as e:
+                self._throttled += 1
+                self._throttled_seconds += e.retry_after
+                logger.warning(
+                    "Telegram flood limit hit",
+                    chat_id=chat_id,
+                    retry_after=e.retry_after,
+                    attempt=attempt + 1
+                )
+                if attempt == self.max_retries:
+                    raise
+                bucket.block(e.retry_after)
+
+    def queue_depth(self, chat_id: int | None = None) -> int:
+        """Количество сообщений, ожидающих отправки"""
+        if chat_id is not None:
+            return len(self._queues.get(chat_id, ()))
+        return sum(len(queue) for queue in self._queues.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики исходящей очереди"""
+        return {
+            "queued": self.queue_depth(),
+            "active_chats": len(self._workers),
+            "max_chat_queue": self._max_queue,
+            "sent": self._sent,
+            "failed": self._failed,
+            "throttled": self._throttled,
+            "throttled_seconds": self._throttled_seconds
+        }
+
+outbound = OutboundSender(
+    global_rate=bot_config.outbound_global_rate,
+    chat_rate=bot_config.outbound_chat_rate,
+    chat_burst=bot_config.outbound_chat_burst
+)
+register_stats("outbound", outbound.get_stats)
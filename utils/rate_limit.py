@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+class TokenBucket:
+    """Токен-бакет: rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()  # Очередь ожидающих - FIFO
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    @property
+    def is_idle(self) -> bool:
+        """Бакет полностью восполнился и не заблокирован"""
+        self._refill()
+        return self._tokens >= self.capacity and time.monotonic() >= self._blocked_until
+
+    def block(self, seconds: float) -> None:
+        """Запрещает выдачу токенов на seconds секунд (ответ 429 с retry_after)"""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
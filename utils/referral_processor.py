@@ -1,9 +1,11 @@
 import structlog
+from functools import partial
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from aiogram.types import Message
 
 from models.referral import Referral, ReferralLink, PendingReferral
+from utils.outbound import outbound
 
 logger = structlog.get_logger()
 
@@ -71,9 +73,11 @@ async def process_pending_referral(user_id: int, session: AsyncSession, message:
         elif referral_count == 3:
             reward_text += "Вы получили максимальную скидку 50% на перезапуск истории!"
         
-        await message.bot.send_message(
+        # Уведомление рефереру не должно задерживать обработку апдейта
+        outbound.send(
             ref_link.user_id,
-            reward_text
+            partial(message.bot.send_message, ref_link.user_id, reward_text),
+            wait=False
         )
         
         # Удаляем pending реферал
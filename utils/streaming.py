@@ -0,0 +1,215 @@
+import re
+import time
+from functools import partial
+from typing import List, Optional, Tuple
+
+import structlog
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, ReplyKeyboardMarkup
+
+from utils.openai_helper import fetch_image_for_send, send_photo_or_notice
+from utils.outbound import outbound
+from utils.text_utils import (
+    clean_text_content,
+    extract_images_and_clean_text,
+    image_patterns,
+    service_patterns
+)
+
+logger = structlog.get_logger()
+
+# Паттерны изображений, в которых есть ссылка на файл (остальные - пустые пометки)
+IMAGE_LINK_PATTERNS = image_patterns[:3]
+EMPTY_IMAGE_MARKER = image_patterns[3]
+
+# Открытая пометка "[AI отправляет фото:" непосредственно перед позицией
+MARKER_PREFIX = r'\[AI отправляет фото:[ \t\r\n]*$'
+
+# Начало возможной пометки изображения, которую нельзя показывать, пока ссылка не дописана
+MARKER_OPENERS = ("[AI", "![")
+
+# Лимит Telegram на длину текста сообщения (с запасом)
+MAX_MESSAGE_LENGTH = 4000
+
+def find_complete_images_end(text: str) -> int:
+    """
+    Возвращает позицию конца последней полностью полученной пометки изображения
+    (0, если таких нет). Пометка в самом конце текста не считается полной:
+    за ней ещё может прийти точка, входящая в пометку.
+    """
+    end = 0
+    for pattern in IMAGE_LINK_PATTERNS:
+        for match in re.finditer(pattern, text):
+            # Markdown-картинка внутри "[AI отправляет фото: ...]" завершена только вместе с внешней скобкой
+            if re.search(MARKER_PREFIX, text[:match.start()]):
+                continue
+            if match.end() < len(text):
+                end = max(end, match.end())
+    return end
+
+def get_preview_text(text: str) -> str:
+    """Очищенный текст для показа, обрезанный перед недописанной пометкой изображения"""
+    cut = len(text)
+    for opener in MARKER_OPENERS:
+        index = text.find(opener)
+        while index != -1:
+            # Пустая пометка "[AI отправляет фото:]" уже закрыта и просто вычищается
+            if not re.match(EMPTY_IMAGE_MARKER, text[index:]):
+                cut = min(cut, index)
+                break
+            index = text.find(opener, index + 1)
+
+    # Последние символы могут оказаться началом пометки
+    for index in range(max(0, cut - 2), cut):
+        if text[index] in "[!":
+            cut = index
+            break
+
+    return clean_text_content(text[:cut], service_patterns) or ""
+
+class StreamingResponder:
+    """
+    Показывает ответ ассистента по мере генерации.
+
+    Сначала отправляется сообщение-заглушка, затем оно редактируется не чаще
+    edit_interval секунд. Как только ссылка изображения получена целиком,
+    текущее сообщение фиксируется, отправляется фото и следующий текст идёт
+    уже новым сообщением.
+    """
+
+    def __init__(
+        self,
+        message: Message,
+        reply_markup: ReplyKeyboardMarkup = None,
+        edit_interval: float = 1.5,
+        placeholder: str = "✍️ ..."
+    ):
+        self.message = message
+        self.chat_id = message.chat.id
+        self.reply_markup = reply_markup
+        self.edit_interval = edit_interval
+        self.placeholder = placeholder
+        self.text = ""  # Полный сырой текст ответа
+        self._consumed = 0  # Сколько сырого текста уже разобрано и отправлено окончательно
+        self._current: Optional[Message] = None  # Сообщение, которое сейчас редактируется
+        self._current_offset = 0  # С какого символа превью показывается в текущем сообщении
+        self._shown = ""
+        self._last_edit = 0.0
+        self._deliveries = []
+
+    async def start(self) -> None:
+        """Отправляет сообщение-заглушку"""
+        self._current = await outbound.send(self.chat_id, partial(
+            self.message.answer,
+            self.placeholder,
+            reply_markup=self.reply_markup
+        ))
+        self._shown = self.placeholder
+        self._last_edit = time.monotonic()
+
+    async def feed(self, delta: str) -> None:
+        """Добавляет очередной фрагмент текста"""
+        self.text += delta
+        pending = self.text[self._consumed:]
+
+        images_end = find_complete_images_end(pending)
+        if images_end:
+            await self._flush_parts(extract_images_and_clean_text(pending[:images_end]))
+            self._consumed += images_end
+            pending = self.text[self._consumed:]
+
+        if time.monotonic() - self._last_edit >= self.edit_interval:
+            await self._show(get_preview_text(pending))
+
+    async def finish(self, flush: bool = True) -> None:
+        """
+        Отправляет остаток ответа и дожидается доставки фото.
+        flush=False - ход отменён, недосланный остаток пользователю не нужен.
+        """
+        pending = self.text[self._consumed:]
+        self._consumed = len(self.text)
+        if flush and pending.strip():
+            await self._flush_parts(extract_images_and_clean_text(pending))
+
+        # Ответ оказался пустым - заглушка больше не нужна
+        if self._current and self._shown == self.placeholder:
+            await self._delete_current()
+
+        for delivery in self._deliveries:
+            await delivery
+        self._deliveries = []
+
+    async def _flush_parts(self, parts: List[Tuple[Optional[str], Optional[str]]]) -> None:
+        for text, image_id in parts:
+            if text and text.strip():
+                await self._show(text, final=True)
+            if image_id:
+                await self._send_image(image_id)
+
+    async def _show(self, preview: str, final: bool = False) -> None:
+        """Показывает превью в текущем сообщении, перенося длинный текст в новые сообщения"""
+        visible = preview[self._current_offset:]
+        while len(visible) > MAX_MESSAGE_LENGTH:
+            split = visible.rfind("\n", 0, MAX_MESSAGE_LENGTH)
+            if split <= 0:
+                split = MAX_MESSAGE_LENGTH
+            await self._set_current(visible[:split].strip())
+            offset = self._current_offset + split
+            self._reset_current()
+            self._current_offset = offset
+            visible = preview[self._current_offset:]
+
+        if visible.strip():
+            await self._set_current(visible.strip())
+        if final:
+            self._reset_current()
+
+    async def _set_current(self, text: str) -> None:
+        if text == self._shown:
+            return
+        try:
+            if self._current is None:
+                self._current = await outbound.send(self.chat_id, partial(
+                    self.message.answer,
+                    text,
+                    reply_markup=self.reply_markup
+                ))
+            else:
+                await outbound.send(self.chat_id, partial(self._current.edit_text, text))
+            self._shown = text
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                raise
+        self._last_edit = time.monotonic()
+
+    def _reset_current(self) -> None:
+        self._current = None
+        self._current_offset = 0
+        self._shown = ""
+
+    async def _delete_current(self) -> None:
+        try:
+            await outbound.send(self.chat_id, self._current.delete)
+        except TelegramBadRequest as e:
+            logger.warning(f"Failed to delete placeholder: {e}")
+        self._reset_current()
+
+    async def _send_image(self, image_id: str) -> None:
+        # Фото должно идти после текста, а не под заглушкой
+        if self._current and self._shown == self.placeholder:
+            await self._delete_current()
+        self._reset_current()
+
+        try:
+            image_data = await fetch_image_for_send(image_id)
+            self._deliveries.append(outbound.send(
+                self.chat_id,
+                partial(send_photo_or_notice, self.message, image_data, image_id, self.reply_markup)
+            ))
+        except Exception as e:
+            logger.error(f"Error sending image {image_id}: {e}")
+            self._deliveries.append(outbound.send(self.chat_id, partial(
+                self.message.answer,
+                f"[Не удалось загрузить изображение: {image_id}]",
+                reply_markup=self.reply_markup
+            )))
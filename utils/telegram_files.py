@@ -0,0 +1,102 @@
+import asyncio
+from typing import Any, Dict
+
+import structlog
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from models.novel import TelegramFile
+from utils.db import session_maker
+from utils.metrics import register_stats
+
+logger = structlog.get_logger()
+
+class TelegramFileCache:
+    """
+    Соответствие изображений сценария и их file_id в Telegram.
+
+    Изображение загружается в Telegram один раз, дальше фото отправляется
+    по file_id без скачивания и повторной загрузки байтов. Соответствия
+    хранятся в таблице telegram_files и загружаются в память при первом
+    обращении. Устаревший file_id удаляется через forget, и изображение
+    загружается заново.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker):
+        self.session_maker = session_maker
+        self._files: Dict[str, str] | None = None
+        self._lock = asyncio.Lock()
+        self._hits = 0
+        self._uploads = 0
+        self._invalidated = 0
+
+    async def _ensure_loaded(self) -> Dict[str, str]:
+        if self._files is None:
+            async with self._lock:
+                if self._files is None:
+                    try:
+                        async with self.session_maker() as session:
+                            rows = (await session.execute(
+                                select(TelegramFile.image_id, TelegramFile.file_id)
+                            )).all()
+                        self._files = dict(rows)
+                        logger.info(f"Loaded {len(self._files)} Telegram file ids")
+                    except Exception as e:
+                        # Без базы фото просто загружаются заново
+                        logger.error(f"Error loading Telegram file ids: {e}")
+                        self._files = {}
+        return self._files
+
+    async def get(self, image_id: str) -> str | None:
+        """file_id ранее загруженного изображения"""
+        file_id = (await self._ensure_loaded()).get(image_id)
+        if file_id:
+            self._hits += 1
+        return file_id
+
+    async def contains(self, image_id: str) -> bool:
+        return image_id in await self._ensure_loaded()
+
+    async def remember(self, image_id: str, file_id: str) -> None:
+        """Запоминает file_id после первой загрузки изображения"""
+        files = await self._ensure_loaded()
+        if files.get(image_id) == file_id:
+            return
+        files[image_id] = file_id
+        self._uploads += 1
+        try:
+            async with self.session_maker() as session:
+                record = await session.scalar(select(TelegramFile).where(TelegramFile.image_id == image_id))
+                if record is None:
+                    record = TelegramFile(image_id=image_id)
+                    session.add(record)
+                record.file_id = file_id
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Error saving file id of image {image_id}: {e}")
+
+    async def forget(self, image_id: str) -> None:
+        """Удаляет недействительный file_id"""
+        files = await self._ensure_loaded()
+        if files.pop(image_id, None) is None:
+            return
+        self._invalidated += 1
+        logger.warning(f"File id of image {image_id} is no longer valid")
+        try:
+            async with self.session_maker() as session:
+                await session.execute(delete(TelegramFile).where(TelegramFile.image_id == image_id))
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Error deleting file id of image {image_id}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики отправки фото по file_id"""
+        return {
+            "known": len(self._files or {}),
+            "hits": self._hits,
+            "uploads": self._uploads,
+            "invalidated": self._invalidated
+        }
+
+telegram_files = TelegramFileCache(session_maker)
+register_stats("telegram_files", telegram_files.get_stats)
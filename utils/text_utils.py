@@ -89,7 +89,8 @@ def extract_images_and_clean_text(text: str) -> List[Tuple[Optional[str], Option
                 image_match = match
                 image_start = match.start()
                 image_end = match.end()
-                image_id = match.group(1)
+                # У пустых пометок "[AI отправляет фото:]" нет группы с ID
+                image_id = match.group(1) if match.groups() else None
         
         if image_match:
             # Обрабатываем текст до изображения